@@ -0,0 +1,314 @@
+"""Microbenchmarks of query building, execution and parsing.
+Execution benchmarks run against an in-process stand-in of the YQL endpoints (benchmarks/server.py).
+$ python benchmarks/bench.py --save results.json
+$ python benchmarks/bench.py --compare baseline.json --threshold 0.15
+$ python benchmarks/bench.py --filter build
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from myql import YQL, __version__ # noqa: E402
+from myql.cache import MemoryCache # noqa: E402
+from myql.result import Result # noqa: E402
+from myql.stream import iter_results # noqa: E402
+from myql.transport import Urllib3Transport # noqa: E402
+from myql.utils import build_response, prettyfy # noqa: E402
+
+from server import StandIn, make_rows, results_json, results_xml # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """Register a benchmark. The decorated function does the setup and returns the callable to time,
+    it receives the stand-in server.
+    """
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+## BUILDING QUERIES
+
+@benchmark('build.clause_formatter')
+def bench_clause_formatter(server):
+    yql = YQL()
+    return lambda: yql._clause_formatter(['name', '=', 'Congo'])
+
+
+@benchmark('build.clause_formatter_subselect')
+def bench_clause_formatter_subselect(server):
+    yql = YQL()
+    return lambda: yql._clause_formatter(['woeid', 'IN', ('SELECT woeid FROM geo.places WHERE text="Paris"',)])
+
+
+@benchmark('build.func_filters')
+def bench_func_filters(server):
+    yql = YQL()
+    return lambda: yql._func_filters(['reverse', ('tail', 2), {'sort': [('field', 'name'), ('descending', 'true')]}])
+
+
+@benchmark('build.payload_builder')
+def bench_payload_builder(server):
+    yql = YQL()
+    yql.set({'sym': 'YHOO'})
+    return lambda: yql._payload_builder("SELECT * FROM yahoo.finance.quotes WHERE symbol = @sym")
+
+
+@benchmark('build.select_where_payload')
+def bench_select_where_payload(server):
+    yql = YQL()
+    return lambda: yql.select('geo.countries', ['name', 'woeid'], limit=10)._where_payload(['name', '=', 'Congo'], ['woeid', '>', 1])
+
+
+@benchmark('build.compiled_query')
+def bench_compiled_query(server):
+    countries = YQL().query.select('geo.countries', ['name', 'woeid'], limit=10)
+    return lambda: countries.where(['name', '=', 'Congo']).compile()
+
+
+@benchmark('build.bind')
+def bench_bind(server):
+    quote = YQL().query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'])
+    quote.compile()
+    return lambda: quote.bind(sym='YHOO')
+
+
+## PARSING RESPONSES
+
+def json_response(rows):
+    return build_response(200, {'Content-Type': 'application/json'}, json.dumps(results_json(make_rows(rows))).encode('utf-8'))
+
+
+@benchmark('parse.response_builder_100')
+def bench_response_builder(server):
+    yql, response = YQL(), json_response(100)
+    return lambda: yql.response_builder(response)
+
+
+@benchmark('parse.result_rows_100')
+def bench_result_rows(server):
+    response = json_response(100)
+    return lambda: Result.from_response(response).rows
+
+
+@benchmark('parse.result_passthrough_100')
+def bench_result_passthrough(server):
+    response = json_response(100)
+    return lambda: Result.from_response(response).body
+
+
+@benchmark('parse.prettyfy_json_100')
+def bench_prettyfy_json(server):
+    response = json_response(100)
+    return lambda: prettyfy(response, 'json')
+
+
+@benchmark('parse.prettyfy_xml_100')
+def bench_prettyfy_xml(server):
+    response = build_response(200, {'Content-Type': 'text/xml'}, results_xml(make_rows(100)).encode('utf-8'))
+    return lambda: prettyfy(response, 'xml')
+
+
+@benchmark('parse.stream_1000')
+def bench_stream(server):
+    content = json.dumps(results_json(make_rows(1000))).encode('utf-8')
+    chunks = [ content[i:i + 65536] for i in range(0, len(content), 65536) ]
+    return lambda: sum(1 for _ in iter_results(chunks))
+
+
+## CONTRIB
+
+def make_table():
+    from myql.contrib.table import Table, Binder, InputKey, PagingPage
+
+    binder = Binder('select', 'products.product', 'xml', urls=[], inputs=[]) # Fresh lists, the default ones are shared
+    binder.addUrl('https://josuebrunel.org/service/{artist}/{song}')
+    binder.addInput(InputKey(id='artist', type='xs:string', paramType='path'))
+    binder.addInput(InputKey(id='song', type='xs:string', paramType='path', required='true'))
+    binder.addPaging(PagingPage({'id': 'ItemPage', 'default': '1'}, {'id': 'Count', 'max': '25'}, {'default': '10'}))
+    table = Table('mytable', 'josuebrunel', 'http://josuebrunel.org/api', 'http://josuebrunel.org/doc.html',
+                  sampleQuery=['SELECT * FROM mytable'], bindings=[binder])
+    return table
+
+
+@benchmark('contrib.table_create')
+def bench_table_create(server):
+    return make_table
+
+
+@benchmark('contrib.table_xml')
+def bench_table_xml(server):
+    from xml.etree import ElementTree
+
+    table = make_table()
+    return lambda: ElementTree.tostring(table.etree, 'utf-8')
+
+
+@benchmark('contrib.table_pretty_xml')
+def bench_table_pretty_xml(server):
+    table = make_table()
+    return lambda: table._xml_pretty_print(table.etree)
+
+
+## EXECUTION
+
+@benchmark('execute.raw_query')
+def bench_raw_query(server):
+    yql = server.client(YQL)
+    return lambda: yql.raw_query('select * from geo.countries')
+
+
+@benchmark('execute.urllib3_raw_query')
+def bench_raw_query_urllib3(server):
+    yql = server.client(YQL, transport=Urllib3Transport())
+    return lambda: yql.raw_query('select * from geo.countries')
+
+
+@benchmark('execute.in_process_raw_query')
+def bench_raw_query_in_process(server):
+    yql = server.client(YQL, transport=server.transport())
+    return lambda: yql.raw_query('select * from geo.countries')
+
+
+@benchmark('execute.select_where')
+def bench_select_where(server):
+    yql = server.client(YQL)
+    return lambda: yql.select('geo.countries', ['name', 'woeid'], limit=10).where(['name', '=', 'Congo'])
+
+
+@benchmark('execute.cache_hit')
+def bench_cache_hit(server):
+    yql = server.client(YQL, cache=MemoryCache())
+    yql.raw_query('select * from geo.countries')
+    return lambda: yql.raw_query('select * from geo.countries')
+
+
+@benchmark('execute.multi_query_10')
+def bench_multi_query(server):
+    yql = server.client(YQL)
+    queries = [ "select * from geo.countries where name='country {0}'".format(i) for i in range(10) ]
+    return lambda: yql.multi_query(queries)
+
+
+@benchmark('execute.execute_many_10')
+def bench_execute_many(server):
+    quote = server.client(YQL).query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'])
+    bindings = [ {'sym': 'SYM{0}'.format(i)} for i in range(10) ]
+    return lambda: quote.execute_many(bindings)
+
+
+## RUNNER
+
+def measure(func, repeat=5, min_time=0.2):
+    """Return the seconds per call of each of the <repeat> runs of <func>, a run lasting at least <min_time>
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True: # Calibrating the number of calls per run
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed * 1.1)) if elapsed > 0 else number * 10
+    return number, [ timer.timeit(number) / number for _ in range(repeat) ]
+
+
+def run(names=None, repeat=5, min_time=0.2, rows=100, out=sys.stdout):
+    """Run the benchmarks whose name starts with one of <names> and return the results
+    """
+    results = {}
+    with StandIn(rows=rows) as server:
+        for name, setup in BENCHMARKS:
+            if names and not any(name.startswith(prefix) for prefix in names):
+                continue
+            number, timings = measure(setup(server), repeat, min_time)
+            timings.sort()
+            results[name] = {'min': timings[0], 'median': timings[len(timings) // 2], 'max': timings[-1], 'number': number, 'repeat': repeat}
+            if out is not None:
+                out.write("{0:<40} {1:>12}  (min {2})\n".format(name, format_time(results[name]['median']), format_time(timings[0])))
+
+    return {
+        'meta': {
+            'myql': __version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=0.1, key='min'):
+    """Return the list of (name, baseline, current, change) of the benchmarks which got slower
+    than the baseline by more than <threshold> (0.1 = 10%).
+    The fastest run (<key>='min') is the least sensitive to the noise of other processes
+    """
+    regressions = []
+    for name, current in sorted(results['results'].items()):
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        change = current[key] / previous[key] - 1
+        if change > threshold:
+            regressions.append((name, previous[key], current[key], change))
+    return regressions
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return "{0:.2f} {1}".format(seconds / scale, unit)
+    return "{0:.0f} ns".format(seconds / 1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filter', action='append', help='only run the benchmarks whose name starts with this prefix, i.e build or parse.stream')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs of each benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum duration of a run in seconds')
+    parser.add_argument('--rows', type=int, default=100, help='number of rows returned by the stand-in')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of baseline results')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown tolerated before a regression is reported')
+    parser.add_argument('--key', choices=('min', 'median'), default='min', help='statistic compared to the baseline')
+    parser.add_argument('--list', action='store_true', help='list the benchmarks')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, _ in BENCHMARKS:
+            print(name)
+        return 0
+
+    results = run(args.filter, args.repeat, args.min_time, args.rows)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold, args.key)
+    for name, previous, current, change in regressions:
+        print("REGRESSION {0}: {1} -> {2} (+{3:.0%})".format(name, format_time(previous), format_time(current), change))
+    if not regressions:
+        print("No regression over {0:.0%} compared to {1}".format(args.threshold, args.compare))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Import time of myql, measured in fresh interpreters.
+$ python benchmarks/import_time.py --repeat 20
+$ python benchmarks/import_time.py --json > import_time.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = [
+    'import myql',
+    'from myql import YQL',
+    'from myql import YQL; YQL()',
+    'from myql.contrib.weather import Weather',
+    'from myql.contrib.finance.stockscraper import StockRetriever',
+    'from myql.contrib.table import Table',
+]
+
+TIMER = "import time; started = time.perf_counter(); {0}; print(time.perf_counter() - started)"
+
+
+def measure(statement, repeat=10):
+    """Return the durations in seconds of <statement> run <repeat> times, each in a new interpreter
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    durations = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', TIMER.format(statement)], cwd=ROOT, env=env)
+        durations.append(float(output.decode('utf-8').strip().splitlines()[-1]))
+    return durations
+
+
+def summary(durations):
+    durations = sorted(durations)
+    return {'min': durations[0], 'median': durations[len(durations) // 2], 'max': durations[-1]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='number of interpreters started per statement')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('statements', nargs='*', help='statements to time, defaults to the usual imports')
+    args = parser.parse_args(argv)
+
+    measure(STATEMENTS[0], 1) # Compiling the bytecode first
+    results = dict((statement, summary(measure(statement, args.repeat))) for statement in args.statements or STATEMENTS)
+
+    if args.json:
+        print(json.dumps(results, indent=4, sort_keys=True))
+        return results
+
+    for statement, stats in results.items():
+        print("{0:>8.2f} ms  (min {1:.2f} ms)  {2}".format(stats['median'] * 1000, stats['min'] * 1000, statement))
+    return results
+
+
+if __name__ == '__main__':
+    main()
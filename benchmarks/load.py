@@ -0,0 +1,206 @@
+"""Load driver: runs YQL/MYQL clients at a set concurrency and reports throughput and latency percentiles.
+By default it queries an in-process stand-in (benchmarks/server.py), --url targets a running one.
+$ python benchmarks/load.py --concurrency 16 --requests 2000 --latency 0.02 0.05 --error-rate 0.01
+$ python benchmarks/load.py --concurrency 32 --duration 30 --shared --pool-maxsize 32 --retry 3
+$ python benchmarks/load.py --url http://127.0.0.1:8000 --distinct 50 --cache --json
+$ python benchmarks/load.py --transport urllib3 --concurrency 16
+"""
+
+import os
+import sys
+import json
+import math
+import argparse
+import threading
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from myql import YQL, MYQL # noqa: E402
+from myql.cache import MemoryCache # noqa: E402
+from myql.retry import RetryPolicy # noqa: E402
+from myql.session import SessionFactory # noqa: E402
+from myql.singleflight import SingleFlight # noqa: E402
+from myql.throttle import monotonic # noqa: E402
+from myql.transport import Urllib3Transport # noqa: E402
+
+from server import StandIn, PATHS # noqa: E402
+
+CLIENTS = {'yql': YQL, 'myql': MYQL}
+
+
+def percentile(values, rank):
+    """Return the <rank> (0-100) percentile of sorted <values>, nearest-rank method
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(math.ceil(rank / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+class LoadDriver(object):
+    '''Runs queries from <concurrency> threads until <requests> queries were sent or <duration> seconds elapsed.
+    Each thread has its own client, unless <shared> where all threads run compiled queries on a single client.
+    Attributes:
+    - make_client : callable returning a client
+    - queries : statements, run in turn
+    '''
+
+    def __init__(self, make_client, queries, concurrency=8, requests=None, duration=None, shared=False):
+        if requests is None and duration is None:
+            raise ValueError('Either requests or duration must be given')
+        self.make_client = make_client
+        self.queries = queries
+        self.concurrency = concurrency
+        self.requests = requests
+        self.duration = duration
+        self.shared = shared
+        self._issued = 0
+        self._lock = threading.Lock()
+
+    def _next(self, deadline):
+        '''Returns the index of the next query, None when the run is over
+        '''
+        with self._lock:
+            if self.requests is not None and self._issued >= self.requests:
+                return None
+            if deadline is not None and monotonic() >= deadline:
+                return None
+            self._issued += 1
+            return self._issued - 1
+
+    def _worker(self, client, deadline, latencies, statuses):
+        '''Runs queries, recording their latency and status (or exception name) in its own <latencies> and <statuses>
+        '''
+        compiled = [ client.query.raw(query) for query in self.queries ] if self.shared else None
+        while True:
+            index = self._next(deadline)
+            if index is None:
+                return
+            started = monotonic()
+            try:
+                if compiled is not None:
+                    response = compiled[index % len(compiled)].execute()
+                else:
+                    response = client.raw_query(self.queries[index % len(self.queries)])
+                status = str(response.status_code)
+            except (Exception,) as e:
+                status = type(e).__name__
+            latencies.append(monotonic() - started)
+            statuses[status] += 1
+
+    def run(self):
+        '''Returns the report of a run
+        '''
+        self._issued = 0
+        shared = self.make_client() if self.shared else None
+        clients = [ shared or self.make_client() for _ in range(self.concurrency) ]
+        outcomes = [ ([], Counter()) for _ in clients ] # One per thread, merged at the end
+
+        started = monotonic()
+        deadline = started + self.duration if self.duration is not None else None
+        threads = [ threading.Thread(target=self._worker, args=(client, deadline) + outcome) for client, outcome in zip(clients, outcomes) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = monotonic() - started
+
+        for client in set(clients):
+            client.close()
+
+        latencies, statuses = [], Counter()
+        for thread_latencies, thread_statuses in outcomes:
+            latencies.extend(thread_latencies)
+            statuses.update(thread_statuses)
+        return report(latencies, statuses, elapsed, self.concurrency)
+
+
+def report(latencies, statuses, elapsed, concurrency):
+    """Return throughput, success rate and latency percentiles (in seconds) of a run
+    """
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'errors': total - statuses.get('200', 0),
+        'statuses': dict(statuses),
+        'elapsed': elapsed,
+        'throughput': total / elapsed if elapsed else 0,
+        'latency': {
+            'mean': sum(latencies) / total if total else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+        },
+    }
+
+
+def format_report(data):
+    ms = lambda seconds: '-' if seconds is None else '{0:.2f} ms'.format(seconds * 1000)
+    latency = data['latency']
+    return '\n'.join([
+        "requests    {0} in {1:.2f}s from {2} threads".format(data['requests'], data['elapsed'], data['concurrency']),
+        "throughput  {0:.1f} req/s".format(data['throughput']),
+        "errors      {0} {1}".format(data['errors'], json.dumps(data['statuses'], sort_keys=True)),
+        "latency     p50 {0}  p95 {1}  p99 {2}  max {3}  mean {4}".format(ms(latency['p50']), ms(latency['p95']), ms(latency['p99']), ms(latency['max']), ms(latency['mean'])),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='base url of a running stand-in, an in-process one is started otherwise')
+    parser.add_argument('--client', choices=sorted(CLIENTS), default='yql')
+    parser.add_argument('--concurrency', type=int, default=8, help='number of threads')
+    parser.add_argument('--requests', type=int, help='total number of queries, defaults to 1000 without --duration')
+    parser.add_argument('--duration', type=float, help='seconds to run for')
+    parser.add_argument('--query', action='append', help='statement to run, can be repeated')
+    parser.add_argument('--distinct', type=int, default=1, help='number of distinct queries, to exercise caches')
+    parser.add_argument('--shared', action='store_true', help='share a single client (and its connection pool) between threads')
+    parser.add_argument('--transport', choices=('requests', 'urllib3'), default='requests', help='HTTP stack of the clients')
+    parser.add_argument('--pool-maxsize', type=int, default=10, help='connections kept alive per client')
+    parser.add_argument('--cache', action='store_true', help='cache responses in memory')
+    parser.add_argument('--coalesce', action='store_true', help='coalesce identical concurrent queries')
+    parser.add_argument('--retry', type=int, default=0, help='maximum number of retries of a failed query')
+    parser.add_argument('--rows', type=int, default=10, help='rows returned by the in-process stand-in')
+    parser.add_argument('--latency', type=float, nargs='+', default=[0], help='in-process stand-in latency, or a min and a max')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of failed requests of the in-process stand-in')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    queries = args.query or [ "select * from geo.places where woeid = {0}".format(2300000 + i) for i in range(args.distinct) ]
+    requests = args.requests if args.requests is not None or args.duration is not None else 1000
+
+    server = None
+    if args.url is None:
+        latency = tuple(args.latency) if len(args.latency) > 1 else args.latency[0]
+        server = StandIn(rows=args.rows, latency=latency, error_rate=args.error_rate, seed=args.seed).start()
+    base_url = args.url or server.url
+
+    cache = MemoryCache(maxsize=max(1024, args.distinct)) if args.cache else None # Shared by all the clients
+    flight = SingleFlight() if args.coalesce else False
+    factory = SessionFactory(pool_maxsize=args.pool_maxsize)
+
+    def make_client():
+        transport = Urllib3Transport(maxsize=args.pool_maxsize) if args.transport == 'urllib3' else None
+        client = CLIENTS[args.client](session=factory, transport=transport, cache=cache, coalesce=flight,
+                                      retry=RetryPolicy(max_retries=args.retry, backoff_factor=0.01) if args.retry else None)
+        client.PUBLIC_URL, client.PRIVATE_URL = base_url + PATHS[0], base_url + PATHS[1]
+        return client
+
+    try:
+        data = LoadDriver(make_client, queries, args.concurrency, requests, args.duration, args.shared).run()
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(json.dumps(data, indent=4, sort_keys=True) if args.json else format_report(data))
+    return data
+
+
+if __name__ == '__main__':
+    main()
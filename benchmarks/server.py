@@ -0,0 +1,242 @@
+"""Local stand-in of the YQL endpoints, used by the benchmarks and the load driver.
+>>> with StandIn(rows=100, latency=(0.01, 0.05), error_rate=0.01) as server:
+...     yql = server.client(YQL)
+...     response = yql.raw_query('select * from geo.countries')
+
+It can also be run on its own:
+$ python benchmarks/server.py --port 8000 --latency 0.02 --error-rate 0.01 --canned canned.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError: # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from myql.transport import InProcessTransport # noqa: E402
+from myql.utils import query_table # noqa: E402
+
+PATHS = ('/v1/public/yql', '/v1/yql')
+
+_LIMIT = re.compile(r"\bLIMIT\s+(\d+)", re.I)
+_OFFSET = re.compile(r"\bOFFSET\s+(\d+)", re.I)
+_MULTI = re.compile(r'yql\.query\.multi\s+WHERE\s+queries\s*=\s*"([^"]*)"', re.I)
+
+
+def make_rows(count, offset=0):
+    """Return <count> rows looking like a YQL table
+    """
+    return [ {'id': str(i), 'name': 'row {0}'.format(i), 'woeid': str(2300000 + i), 'value': '{0:.2f}'.format(i * 1.5)} for i in range(offset, offset + count) ]
+
+
+def results_json(rows):
+    results = {'row': rows if len(rows) != 1 else rows[0]} if rows else None # As YQL, a single row isn't wrapped in a list
+    return {'query': {'count': len(rows), 'created': '2016-01-01T00:00:00Z', 'lang': 'en-US', 'results': results}}
+
+
+def results_xml(rows):
+    items = ''.join('<row>{0}</row>'.format(''.join('<{0}>{1}</{0}>'.format(key, value) for key, value in sorted(row.items()))) for row in rows)
+    return ('<?xml version="1.0" encoding="UTF-8"?><query xmlns:yahoo="http://www.yahooapis.com/v1/base.rng" yahoo:count="{0}" yahoo:lang="en-US">'
+            '<results>{1}</results></query>').format(len(rows), items)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, as the real endpoints
+    disable_nagle_algorithm = True # Headers and body are sent separately, Nagle would delay the body
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in PATHS:
+            return self.reply(404, 'application/json', json.dumps({'error': {'description': 'Not found'}}))
+
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        status, content_type, body = self.server.standin.respond(url.path, params)
+        self.reply(status, content_type, body)
+
+    def reply(self, status, content_type, body):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def error_json(description):
+    return {'error': {'lang': 'en-US', 'description': description}}
+
+
+class StandIn(object):
+    '''Serves /v1/public/yql and /v1/yql on localhost from a background thread.
+    Each select returns <rows> synthetic rows, paginated by its LIMIT and OFFSET, or the canned
+    results of its table; yql.query.multi is supported.
+    Attributes:
+    - rows : number of synthetic rows of every table
+    - canned : dict of table -> list of rows, or full response (dict with a 'query' key)
+    - latency : seconds added to every response, or a (min, max) range
+    - error_rate : share of the requests answered with one of <error_status>
+    - error_status : status codes of the failed requests, 999 being how Yahoo throttles
+    - seed : seed of the random latencies and errors, for reproducible runs
+    - requests : number of requests served
+    - errors : number of errors served
+    '''
+
+    def __init__(self, rows=10, host='127.0.0.1', port=0, canned=None, latency=0, error_rate=0, error_status=(500, 503, 999), seed=None):
+        self.rows = rows
+        self.canned = canned or {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.standin = self
+        self._thread = None
+
+    def __repr__(self):
+        return "<StandIn>: {0} - {1} requests".format(self.url, self.requests)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def client(self, cls, *args, **kwargs):
+        '''Returns a <cls> (YQL, MYQL, ...) instance querying the stand-in
+        '''
+        client = cls(*args, **kwargs)
+        client.PUBLIC_URL = self.url + PATHS[0]
+        client.PRIVATE_URL = self.url + PATHS[1]
+        return client
+
+    def transport(self):
+        '''Returns a transport answering as the stand-in does, without HTTP
+        >>> yql = server.client(YQL, transport=server.transport())
+        '''
+        return InProcessTransport(lambda url, params: self.respond(urlparse(url).path, params))
+
+    def select(self, query):
+        '''Returns the rows a statement selects, or the canned response of its table
+        '''
+        canned = self.canned.get(query_table(query))
+        if isinstance(canned, dict):
+            return canned
+
+        limit, offset = _LIMIT.search(query), _OFFSET.search(query)
+        offset = int(offset.group(1)) if offset else 0
+        total = len(canned) if canned is not None else self.rows
+        count = max(0, total - offset)
+        if limit:
+            count = min(count, int(limit.group(1)))
+        return canned[offset:offset + count] if canned is not None else make_rows(count, offset)
+
+    def _draw(self):
+        '''Returns the latency and the error status (None for a success) of a request
+        '''
+        with self._lock:
+            self.requests += 1
+            latency = self._random.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+            status = None
+            if self.error_rate and self._random.random() < self.error_rate:
+                status = self._random.choice(self.error_status)
+                self.errors += 1
+        return latency, status
+
+    def respond(self, path, params):
+        '''Returns the (status, content type, body) of a request
+        '''
+        latency, status = self._draw()
+        if latency:
+            time.sleep(latency)
+        if status is not None:
+            return status, 'application/json', json.dumps(error_json('Stand-in error {0}'.format(status)))
+
+        query = params.get('q', '')
+        multi = _MULTI.search(query)
+        if multi:
+            results = [ self.results(q)['query']['results'] for q in multi.group(1).split(';') ]
+            data = {'query': {'count': len(results), 'lang': 'en-US', 'results': {'results': results}}}
+            return 200, 'application/json', json.dumps(data)
+
+        rows = self.select(query)
+        if params.get('format') == 'xml':
+            return 200, 'text/xml', results_xml(rows if isinstance(rows, list) else [])
+        return 200, 'application/json', json.dumps(self.results(query, rows))
+
+    def results(self, query, rows=None):
+        rows = self.select(query) if rows is None else rows
+        return rows if isinstance(rows, dict) else results_json(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in of the YQL endpoints')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--rows', type=int, default=10, help='number of synthetic rows of every table')
+    parser.add_argument('--canned', help='JSON file of table -> rows or full response')
+    parser.add_argument('--latency', type=float, nargs='+', default=[0], help='latency in seconds, or a min and a max')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of the requests failing, i.e 0.01')
+    parser.add_argument('--error-status', type=int, nargs='+', default=[500, 503, 999])
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    canned = None
+    if args.canned:
+        with open(args.canned) as f:
+            canned = json.load(f)
+
+    latency = tuple(args.latency) if len(args.latency) > 1 else args.latency[0]
+    server = StandIn(args.rows, args.host, args.port, canned, latency, args.error_rate, tuple(args.error_status), args.seed)
+    sys.stdout.write("Serving {0}/v1/public/yql and {0}/v1/yql\n".format(server.url))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,33 @@
 
 __version__ = '1.2.7'
 
-from myql import contrib
-from myql import errors
-from myql import utils
-from myql.myql import YQL, MYQL
+import sys
+import importlib
+
+_SUBMODULES = ('contrib', 'errors', 'utils')
+_ATTRIBUTES = {'YQL': 'myql.myql', 'MYQL': 'myql.myql'}
+
+__all__ = list(_SUBMODULES) + list(_ATTRIBUTES)
+
+
+def __getattr__(name):
+    '''Imports submodules and clients on first access (PEP 562), so <import myql> stays cheap
+    '''
+    if name in _SUBMODULES:
+        return importlib.import_module('myql.' + name)
+    if name in _ATTRIBUTES:
+        value = getattr(importlib.import_module(_ATTRIBUTES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'myql' has no attribute '{0}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7): # No module __getattr__, importing everything upfront
+    from myql import contrib
+    from myql import errors
+    from myql import utils
+    from myql.myql import YQL, MYQL
@@ -0,0 +1,410 @@
+"""asyncio counterpart of YQL and MYQL. Requires aiohttp
+>>> from myql.aio import AsyncMYQL
+>>> async with AsyncMYQL(max_concurrency=20) as yql:
+...     response = await yql.select('geo.countries', limit=5).where(['name', 'like', 'A%'])
+"""
+
+import asyncio
+import inspect
+import functools
+
+try:
+    import aiohttp
+    import yarl
+except ImportError: # aiohttp is an optional dependency
+    aiohttp = None
+
+from myql import errors
+from myql.myql import YQL, MultiQueryResult
+from myql.result import Result
+from myql.throttle import monotonic
+from myql.transport import BaseTransport, build_url
+from myql.utils import build_response
+
+_NO_STREAM = "AsyncYQL doesn't stream responses as they are read whole, use raw_query or YQL.stream_query"
+
+
+class AiohttpTransport(BaseTransport):
+    '''Sends requests with an <aiohttp.ClientSession>, <send> and <close> are coroutines
+    Attributes:
+    - session : an <aiohttp.ClientSession>, created on the first request if not provided
+    - limit : maximum number of connections of the session it creates
+    - timeout : default timeout
+    '''
+
+    blocking = False
+
+    def __init__(self, session=None, limit=10, timeout=None):
+        if aiohttp is None:
+            raise ImportError('AiohttpTransport requires aiohttp, run : pip install myql[async]')
+        self.session = session
+        self.limit = limit
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "<AiohttpTransport>: {0}".format(self.session)
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit))
+        return self.session
+
+    def _client_timeout(self, timeout):
+        '''Converts a requests like timeout into an aiohttp one
+        '''
+        timeout = timeout if timeout is not None else self.timeout
+        if timeout is None:
+            return None
+        if isinstance(timeout, (tuple, list)):
+            return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        return aiohttp.ClientTimeout(total=timeout)
+
+    async def send(self, url, params=None, headers=None, timeout=None, stream=False):
+        url = build_url(url, params)
+        async with self._get_session().get(yarl.URL(url, encoded=True), headers=headers or {}, timeout=self._client_timeout(timeout)) as resp:
+            content = await resp.read()
+            return build_response(resp.status, resp.headers, content, str(resp.url))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class AsyncSingleFlight(object):
+    '''Awaits a coroutine function once for all the tasks calling it with the same key at the same time.
+    Attributes:
+    - leaders : number of calls which actually ran the function
+    - shared : number of calls served by the result of another one
+    '''
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._calls = {}
+
+    async def do(self, key, func, *args):
+        '''Returns await func(*args), or waits for the call already in flight for <key>
+        '''
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future) # A cancelled waiter mustn't cancel the others
+
+        self.leaders += 1
+        future = self._calls[key] = asyncio.ensure_future(func(*args))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                del self._calls[key]
+            else: # The leader was cancelled, the waiters still get the result
+                future.add_done_callback(lambda f: self._calls.pop(key, None))
+
+
+class AsyncYQL(YQL):
+    '''asyncio counterpart of YQL. Query methods are coroutines.
+    Attributes: same as YQL plus
+    - session : an <aiohttp.ClientSession>, created on the first query if not provided
+    - max_concurrency : maximum number of requests in flight
+    - transport : an <AiohttpTransport> over <session> by default. Sync transports are supported too,
+      blocking ones (RequestsTransport, Urllib3Transport) send their requests from worker threads
+    '''
+
+    def __init__(self, *args, max_concurrency=10, **kwargs):
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._refresh_lock = None
+        super(AsyncYQL, self).__init__(*args, **kwargs)
+
+    def _init_single_flight(self, coalesce):
+        if coalesce is True:
+            return AsyncSingleFlight()
+        return coalesce or None
+
+    def _init_session(self, session, timeout):
+        '''Sets the aiohttp session used to run queries
+        '''
+        if aiohttp is None:
+            raise ImportError('AsyncYQL requires aiohttp, run : pip install myql[async]')
+
+        self.session_factory = None
+        self.session = session
+        self.timeout = timeout
+
+    def _init_transport(self, transport):
+        if transport is not None:
+            return transport
+        return AiohttpTransport(self.session, self.max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        '''Closes the aiohttp session of the transport
+        '''
+        closed = self.transport.close()
+        if inspect.isawaitable(closed):
+            await closed
+
+    async def _refresh_token(self):
+        '''Refreshes an expired token in a worker thread, only once for all the pending queries
+        '''
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        async with self._refresh_lock:
+            if not self.oauth.token_is_valid():
+                await asyncio.get_event_loop().run_in_executor(None, self.oauth.refresh_token)
+
+    async def execute_query(self, payload, ttl=None):
+        '''Execute the query and returns and response.
+        <ttl> overrides the cache time to live of the response
+        '''
+        if self.metrics is not None:
+            return await self._measured(payload, self._execute, payload, ttl)
+        return await self._execute(payload, ttl)
+
+    async def _execute(self, payload, ttl=None):
+        key = self._fingerprint(payload)
+        response = self._cache_lookup(key, payload)
+
+        if response is None:
+            if key and self.single_flight is not None: # Identical queries in flight share the response
+                response = await self.single_flight.do(key, self._fetch, key, payload, ttl)
+            else:
+                response = await self._fetch(key, payload, ttl)
+
+        self._response = response = Result.from_response(response) # Saving last result, not the whole response
+        return response
+
+    async def _measured(self, payload, func, *args):
+        started = monotonic()
+        try:
+            response = await func(*args)
+        except (Exception,) as e:
+            self.metrics.query(payload, started, e)
+            raise
+        self.metrics.query(payload, started)
+        return response
+
+    async def _fetch(self, key, payload, ttl=None):
+        '''Sends the query and caches its result'''
+        response = Result.from_response(await self._send(payload))
+        self._cache_store(key, payload, response, ttl)
+        return response
+
+    async def _send(self, payload):
+        '''Sends the query, retrying idempotent ones according to the retry policy'''
+        endpoint = self.PRIVATE_URL if vars(self).get('oauth') else self.PUBLIC_URL
+        retryable = self.retry is not None and self.retry.is_retryable(payload['q'])
+
+        attempt = 0
+        while True:
+            response, error, started = None, None, None
+            try:
+                await asyncio.sleep(self._before_request(endpoint))
+                started = monotonic()
+                response = await self._request(endpoint, payload)
+                self._after_request(endpoint, response.status_code)
+            except errors.CassetteError: # Not an upstream failure, nothing was sent
+                raise
+            except (Exception,) as e:
+                if not isinstance(e, errors.CircuitOpenError):
+                    self._after_request(endpoint)
+                error = e
+
+            if started is not None: # Requests stopped by the circuit breaker never started
+                self._log_request(endpoint, payload, started, response, error)
+                if self.metrics is not None:
+                    self.metrics.request(payload, started, response)
+
+            if not retryable or not self.retry.should_retry(attempt, response, error):
+                if error is not None:
+                    raise error
+                return response
+
+            await asyncio.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+    async def _request(self, endpoint, payload):
+        '''Sends the query, through the cassette if any'''
+        if self.cassette is None:
+            return await self._http_request(endpoint, payload)
+
+        entry = self.cassette.next(payload)
+        if entry is not None:
+            await asyncio.sleep(self.cassette.delay(entry))
+            return self.cassette.response(entry)
+
+        started = monotonic()
+        response = await self._http_request(endpoint, payload)
+        self.cassette.record(endpoint, payload, response, monotonic() - started)
+        return response
+
+    async def _http_request(self, endpoint, payload):
+        '''Sends the query over HTTP'''
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._semaphore:
+            if vars(self).get('oauth'):
+                await self._refresh_token()
+                url, headers = self._sign(endpoint, payload)
+                send = functools.partial(self.transport.send, url, None, headers, timeout=self.timeout)
+            else:
+                send = functools.partial(self.transport.send, endpoint, payload, timeout=self.timeout)
+
+            if getattr(self.transport, 'blocking', True): # Sync transports mustn't block the event loop
+                response = await asyncio.get_event_loop().run_in_executor(None, send)
+            else:
+                response = send()
+
+            if inspect.isawaitable(response):
+                response = await response
+            return response
+
+    def raw_query(self, query, format=None, pretty=False, ttl=None):
+        '''Executes a YQL query and returns an awaitable response.
+        The payload is built when called, not when awaited, as by every query method
+        >>> resp = await yql.raw_query('select * from weather.forecast where woeid=2502265')
+        '''
+        payload = self._payload_builder(query, format=format if format else self.format)
+        if pretty:
+            return self._pretty(self.execute_query(payload, ttl=ttl))
+        return self.execute_query(payload, ttl=ttl)
+
+    async def _pretty(self, response):
+        return self.response_builder(await response)
+
+    def desc(self, table):
+        '''Returns table description
+        >>> await yql.desc('geo.countries')
+        '''
+        return self.raw_query("desc {0}".format(table))
+
+    def get(self, *args, **kwargs):
+        '''Just a select which returns an awaitable response.
+        The payload is built when called, so concurrent tasks can share the client
+        >>> await yql.get('geo.countries', ['name', 'woeid'], 5)
+        '''
+        self.select(*args, **kwargs)
+        payload = self._payload_builder(self._query)
+
+        return self.execute_query(payload)
+
+    def insert(self, table, items, values):
+        '''This method allows to insert data into table
+        '''
+        return self.execute_query(self._insert_payload(table, items, values))
+
+    def where(self, *args, ttl=None, stream=False):
+        '''This method simulates a where condition and returns an awaitable response.
+        The payload is built when called, not when awaited, so concurrent tasks can share the client.
+        <stream=True> isn't supported
+        >>> await yql.select('mytable').where(['name', '=', 'alain'], ['location', '!=', 'paris'])
+        '''
+        if stream:
+            raise TypeError(_NO_STREAM)
+        return self.execute_query(self._where_payload(*args), ttl=ttl)
+
+    def iterate(self, *args, page_size=100, prefetch=True):
+        '''Returns an async generator walking the results of a select page by page (see YQL.iterate),
+        the next page being fetched while the current one is consumed
+        >>> async for county in yql.select('geo.counties').iterate(['place', '=', 'CA'], page_size=50):
+        '''
+        if not self._table:
+            raise errors.NoTableSelectedError('No Table Selected')
+
+        query = self._add_where(*args) if args else self._query
+        remaining, offset = self._limit, self._offset or 0
+
+        def page(offset, remaining):
+            size = min(page_size, remaining) if remaining is not None else page_size
+            return size, self._build_payload(query, None, vars(self).get('_func'), size, offset)
+
+        async def fetch(payload):
+            return self._page_rows(await self.execute_query(payload))
+
+        def start(payload):
+            return asyncio.ensure_future(fetch(payload)) if prefetch else fetch(payload)
+
+        async def rows(size, pending, offset, remaining):
+            try:
+                while True:
+                    results = await pending
+                    offset += len(results)
+                    remaining = remaining - len(results) if remaining is not None else None
+                    last = len(results) < size or (remaining is not None and remaining <= 0)
+                    if not last: # Next page is on its way while this one is consumed
+                        size, payload = page(offset, remaining)
+                        pending = start(payload)
+                    for row in results:
+                        yield row
+                    if last:
+                        return
+            finally:
+                if inspect.iscoroutine(pending):
+                    pending.close()
+                else:
+                    pending.cancel()
+
+        size, payload = page(offset, remaining)
+        return rows(size, fetch(payload), offset, remaining)
+
+    def stream_query(self, query, chunk_size=65536):
+        '''Not supported, raises TypeError
+        '''
+        raise TypeError(_NO_STREAM)
+
+    async def execute_many(self, payloads, ttl=None, max_workers=None):
+        '''Executes payloads concurrently, up to <max_concurrency> at a time, and returns the responses in the same order.
+        <max_workers> is ignored
+        '''
+        return list(await asyncio.gather(*[ self.execute_query(payload, ttl=ttl) for payload in payloads ]))
+
+    def multi_query(self, queries, batch_size=10):
+        '''Executes many queries concurrently, packing up to <batch_size> selects per request.
+        Returns an awaitable list of <MultiQueryResult> in the order of <queries>
+        '''
+        queries = list(queries) # Generators are walked twice
+        return self._multi_query(len(queries), self._multi_jobs(queries, batch_size))
+
+    async def _multi_query(self, size, jobs):
+        results = [None] * size
+        for outcomes in await asyncio.gather(*[ self._run_batch(*job) for job in jobs ]):
+            for index, outcome in outcomes:
+                results[index] = outcome
+
+        return results
+
+    async def _run_batch(self, batch, payload):
+        '''Executes a batch and splits its response into MultiQueryResult
+        '''
+        try:
+            response = await self.execute_query(payload)
+            results = self._multi_results(response, len(batch))
+        except (Exception,) as e:
+            if len(batch) > 1: # Let's find out which query failed
+                outcomes = await asyncio.gather(*[ self._run_batch([(index, query)], self._single_payload(payload, query)) for index, query in batch ])
+                return [ outcome[0] for outcome in outcomes ]
+            return [ (batch[0][0], MultiQueryResult(batch[0][1], None, e)) ]
+
+        return [ (index, MultiQueryResult(query, result, None)) for (index, query), result in zip(batch, results) ]
+
+
+class AsyncMYQL(AsyncYQL):
+
+    def get_guid(self, username):
+        '''Returns the guid of the username provided
+        >>> guid = await yql.get_guid('josue_brunel')
+        '''
+        return self.select('yahoo.identity').where(['yid', '=', username])
+
+    def show_tables(self, format='json'):
+        '''Return list of all available tables'''
+        payload = self._payload_builder('SHOW TABLES', format)
+
+        return self.execute_query(payload)
@@ -0,0 +1,333 @@
+"""Response caches for YQL.execute_query
+>>> from myql.cache import MemoryCache, SQLiteCache
+>>> yql = YQL(cache=MemoryCache(maxsize=512, ttl=30, table_ttl={'weather.forecast': 300}))
+>>> yql = YQL(cache=SQLiteCache('/var/cache/myql.db', max_bytes=256 * 1024 * 1024))
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+from myql.utils import build_response
+
+
+def payload_fingerprint(payload):
+    """Return a stable fingerprint of a payload: q, format, vars, crossProduct, ...
+    """
+    data = json.dumps(sorted((str(key), str(value)) for key, value in payload.items()))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def response_size(response):
+    """Return the size in bytes of a response body
+    """
+    return len(response.content or b'')
+
+
+class BaseCache(object):
+    '''Time to live policy and counters shared by caches
+    Attributes:
+    - ttl : default time to live of an entry in seconds
+    - table_ttl : dict of per-table time to live i.e {'yahoo.finance.quotes': 5}
+    '''
+
+    def __init__(self, ttl=60, table_ttl=None):
+        self.ttl = ttl
+        self.table_ttl = table_ttl or {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_ttl(self, table=None, ttl=None):
+        '''Returns the time to live of an entry: per-query, then per-table, then default one
+        '''
+        if ttl is not None:
+            return ttl
+        return self.table_ttl.get(table, self.ttl)
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None, table=None):
+        raise NotImplementedError
+
+
+class MemoryCache(BaseCache):
+    '''In-memory LRU cache with TTL
+    Attributes:
+    - maxsize : maximum number of entries
+    - max_bytes : maximum total size of the cached bodies, None means no limit
+    - ttl : default time to live of an entry in seconds
+    - table_ttl : dict of per-table time to live i.e {'yahoo.finance.quotes': 5}
+    '''
+
+    def __init__(self, maxsize=1024, max_bytes=None, ttl=60, table_ttl=None):
+        super(MemoryCache, self).__init__(ttl=ttl, table_ttl=table_ttl)
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict() # key -> (expires_at, size, value), least recently used first
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<MemoryCache>: {0} entries - {1} bytes".format(len(self), self.size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        '''Returns the cached value or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry[0] <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries[key] = self._entries.pop(key) # Most recently used
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, ttl=None, table=None):
+        '''Caches a value until its time to live expires
+        '''
+        ttl = self.get_ttl(table, ttl)
+        if not ttl or ttl <= 0:
+            return False
+
+        size = response_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time() + ttl, size, value)
+            self.size += size
+
+            while len(self._entries) > self.maxsize or (self.max_bytes is not None and self.size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+        return True
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[1]
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        '''Returns hits, misses, evictions, expirations and size counters
+        '''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'entries': len(self),
+            'bytes': self.size
+        }
+
+
+class SQLiteCache(BaseCache):
+    '''Persistent cache stored in a SQLite database, it can be shared by processes of the same host.
+    Bodies are stored zlib compressed.
+    Attributes:
+    - path : path of the database file
+    - max_bytes : maximum total size of the compressed bodies, least recently used entries are evicted first
+    - ttl : default time to live of an entry in seconds
+    - table_ttl : dict of per-table time to live
+    - compress_level : zlib compression level
+    - timeout : seconds to wait for a lock held by another process
+    - touch_interval : seconds between writes of the access times of hit entries, hits don't lock the database in between
+    '''
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl=3600, table_ttl=None, compress_level=6, timeout=30, touch_interval=1):
+        super(SQLiteCache, self).__init__(ttl=ttl, table_ttl=table_ttl)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self._local = threading.local() # sqlite3 connections can't be shared by threads
+        self._inherited = [] # Connections of a parent process, kept so they are neither used nor closed after a fork
+        self._accessed = {} # key -> access time not written yet
+        self._touched_at = time.time()
+        self._lock = threading.Lock()
+
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires_at REAL, accessed_at REAL, size INTEGER, status_code INTEGER, headers TEXT, url TEXT, body BLOB)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+            # Total size of the bodies, kept up to date by triggers so evictions don't sum the whole table
+            db.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER)")
+            db.execute("INSERT OR IGNORE INTO usage SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+            db.execute("CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN UPDATE usage SET bytes = bytes + new.size; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN UPDATE usage SET bytes = bytes - old.size; END")
+
+    def __repr__(self):
+        return "<SQLiteCache>: {0}".format(self.path)
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def _connection(self):
+        pid = os.getpid()
+        db = vars(self._local).get('db')
+        if db is not None and self._local.pid != pid: # SQLite connections mustn't be carried across a fork
+            self._inherited.append(db)
+            db = None
+
+        if db is None:
+            import sqlite3 # Only SQLiteCache users pay for importing it
+
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, pid
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def get(self, key):
+        '''Returns the cached response or None
+        '''
+        now = time.time()
+        row = self._connection().execute("SELECT expires_at, status_code, headers, url, body FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row is None or row[0] <= now:
+            if row is not None:
+                self.delete(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+        with self._lock:
+            self._accessed[key] = now
+        if now - self._touched_at >= self.touch_interval:
+            with self._transaction() as db:
+                self._touch(db)
+
+        self.hits += 1
+        return build_response(row[1], json.loads(row[2]), zlib.decompress(row[4]), row[3])
+
+    def _touch(self, db):
+        '''Writes the access times of the entries hit since the last write
+        '''
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+            self._touched_at = time.time()
+        if accessed:
+            db.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?", [ (at, key) for key, at in accessed.items() ])
+
+    def set(self, key, value, ttl=None, table=None):
+        '''Caches a response until its time to live expires
+        '''
+        ttl = self.get_ttl(table, ttl)
+        if not ttl or ttl <= 0:
+            return False
+
+        import sqlite3
+
+        body = zlib.compress(value.content or b'', self.compress_level)
+        if self.max_bytes is not None and len(body) > self.max_bytes:
+            return False
+
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,)) # Not INSERT OR REPLACE, which skips the delete trigger
+            db.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, now + ttl, now, len(body), value.status_code, json.dumps(dict(value.headers)), value.url, sqlite3.Binary(body)))
+            db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            if self.max_bytes is not None:
+                self._evict(db)
+
+        return True
+
+    def _evict(self, db, chunk=64):
+        '''Deletes least recently used entries until the cache fits in max_bytes
+        '''
+        size = db.execute("SELECT bytes FROM usage").fetchone()[0]
+        if size <= self.max_bytes:
+            return
+
+        self._touch(db) # Recent hits must not be evicted
+        while size > self.max_bytes:
+            entries = db.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?", (chunk,)).fetchall()
+            if not entries:
+                break
+            for key, entry_size in entries:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.evictions += 1
+                size -= entry_size
+                if size <= self.max_bytes:
+                    break
+
+    def delete(self, key):
+        with self._transaction() as db:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute("DELETE FROM responses")
+
+    def stats(self):
+        '''Returns hits, misses, evictions, expirations and size counters.
+        hits, misses, evictions and expirations are counted by this process only
+        '''
+        db = self._connection()
+        entries, = db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        size, = db.execute("SELECT bytes FROM usage").fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'entries': entries,
+            'bytes': size
+        }
+
+    def close(self):
+        if self._accessed:
+            with self._transaction() as db:
+                self._touch(db)
+        db = vars(self._local).pop('db', None)
+        if db is not None and self._local.pid == os.getpid():
+            db.close()
+
+
+class _Transaction(object):
+    '''Write transaction taking the database lock upfront, so concurrent writers wait instead of failing
+    '''
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, *args):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
@@ -0,0 +1,145 @@
+"""Record and replay of YQL requests, for offline and deterministic runs
+>>> from myql.cassette import Cassette
+>>> yql = YQL(cassette=Cassette('tests_data/geo.jsonl.gz', mode='record'))
+>>> yql.raw_query("select * from geo.countries") # Sent and recorded
+>>> yql = YQL(cassette=Cassette('tests_data/geo.jsonl.gz', latency='recorded'))
+>>> yql.raw_query("select * from geo.countries") # Served from the cassette
+"""
+
+import io
+import json
+import time
+import gzip
+import base64
+import threading
+
+from myql import errors
+from myql.cache import payload_fingerprint
+from myql.throttle import monotonic
+from myql.utils import build_response
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, mode + 'b'), encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+
+class Cassette(object):
+    '''Requests and responses stored one JSON object per line, gzip compressed if <path> ends with .gz.
+    A query recorded several times (i.e a throttled attempt and its retry) is replayed in the same order,
+    the last response being served again once they have all been played.
+    Attributes:
+    - path : cassette file
+    - mode : 'replay' only serves recorded responses, 'record' sends every request and appends it,
+      'auto' replays recorded queries and records the others
+    - latency : delay added to replayed responses, in seconds or 'recorded' for the recorded duration
+    '''
+
+    MODES = ('replay', 'record', 'auto')
+
+    def __init__(self, path, mode='replay', latency=None):
+        if mode not in self.MODES:
+            raise ValueError("mode must be one of {0}".format(', '.join(self.MODES)))
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.played = 0
+        self.recorded = 0
+        self._entries = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        if mode != 'record':
+            self._load()
+
+    def __repr__(self):
+        return "<Cassette>: {0} - {1} - {2} queries".format(self.path, self.mode, len(self))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with _open(self.path, 'r') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry['key'], []).append(entry)
+        except (IOError, OSError):
+            if self.mode == 'replay':
+                raise
+
+    def next(self, payload):
+        '''Returns the next recorded entry of a query, None if it must be sent.
+        Raises CassetteError in replay mode if the query wasn't recorded
+        '''
+        if self.mode == 'record':
+            return None
+
+        key = payload_fingerprint(payload)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                if self.mode == 'replay':
+                    raise errors.CassetteError("No recorded response for {0}".format(payload.get('q')))
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.played += 1
+        return entries[min(position, len(entries) - 1)]
+
+    def delay(self, entry):
+        '''Returns the seconds to wait before serving <entry>
+        '''
+        if self.latency == 'recorded':
+            return entry.get('elapsed', 0)
+        return self.latency or 0
+
+    def response(self, entry):
+        '''Builds the response of an entry
+        '''
+        body = entry['body']
+        content = base64.b64decode(body) if entry.get('encoding') == 'base64' else body.encode('utf-8')
+        headers = {'Content-Type': entry['content_type']} if entry.get('content_type') else {}
+        return build_response(entry['status'], headers, content, entry.get('url'))
+
+    def record(self, url, payload, response, elapsed=0):
+        '''Appends a request and its response to the cassette
+        '''
+        content = response.content or b''
+        try:
+            body, encoding = content.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+
+        entry = {
+            'key': payload_fingerprint(payload),
+            'url': url,
+            'payload': dict((str(k), v if isinstance(v, (bool, int, float)) else str(v)) for k, v in payload.items()),
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'body': body,
+            'encoding': encoding,
+            'elapsed': round(elapsed, 6),
+        }
+        line = json.dumps(entry, sort_keys=True, separators=(',', ':')) + '\n'
+
+        with self._lock:
+            with _open(self.path, 'a') as f:
+                f.write(line if isinstance(line, type(u'')) else line.decode('utf-8'))
+            self._entries.setdefault(entry['key'], []).append(entry)
+            self.recorded += 1
+        return entry
+
+    def request(self, url, payload, send):
+        '''Replays the response of a query, or calls <send> and records its response
+        '''
+        entry = self.next(payload)
+        if entry is not None:
+            time.sleep(self.delay(entry))
+            return self.response(entry)
+
+        started = monotonic()
+        response = send()
+        self.record(url, payload, response, monotonic() - started)
+        return response
@@ -1,6 +1,26 @@
 
 
-from myql.contrib import weather
-from myql.contrib import table
-from myql.contrib import finance
+import sys
+import importlib
 
+_SUBMODULES = ('weather', 'table', 'finance')
+
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    '''Imports contrib packages on first access (PEP 562)
+    '''
+    if name in _SUBMODULES:
+        return importlib.import_module('myql.contrib.' + name)
+    raise AttributeError("module 'myql.contrib' has no attribute '{0}'".format(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7): # No module __getattr__, importing everything upfront
+    from myql.contrib import weather
+    from myql.contrib import table
+    from myql.contrib import finance
@@ -1,3 +1,18 @@
 
 
-from myql.contrib.finance import stockscraper
+import sys
+import importlib
+
+__all__ = ['stockscraper']
+
+
+def __getattr__(name):
+    '''Imports stockscraper on first access (PEP 562)
+    '''
+    if name in __all__:
+        return importlib.import_module('myql.contrib.finance.' + name)
+    raise AttributeError("module 'myql.contrib.finance' has no attribute '{0}'".format(name))
+
+
+if sys.version_info < (3, 7): # No module __getattr__, importing everything upfront
+    from myql.contrib.finance import stockscraper
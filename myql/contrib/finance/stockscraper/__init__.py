@@ -1 +1,5 @@
-from myql.contrib.finance.stockscraper.stockretriever import StockRetriever
+from myql.contrib.finance.stockscraper.stockretriever import StockRetriever, BulkQuotes, QuoteBatch
+from myql.contrib.finance.stockscraper.history import HistoryStore
+from myql.contrib.finance.stockscraper.columns import Columns, write_columns, to_columns
+from myql.contrib.finance.stockscraper.poller import QuotePoller, QuoteChange
+from myql.contrib.finance.stockscraper.ticks import TickStore
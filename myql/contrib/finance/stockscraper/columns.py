@@ -0,0 +1,163 @@
+"""Typed columnar files of historical quotes, memory mapped so processes share them without copies
+>>> from myql.contrib.finance.stockscraper.columns import write_columns, Columns
+>>> write_columns('YHOO.cols', stocks.get_historical_info('YHOO', startDate='2005-01-01', endDate='2015-12-31'))
+>>> with Columns('YHOO.cols') as yhoo:
+...     closes = yhoo['Close'] # memoryview of float64, numpy array with yhoo.array('Close')
+
+Dates are stored as int64 days since 1970-01-01 (numpy's datetime64[D]), the other columns as float64,
+missing values being NaN. numpy is optional.
+"""
+
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+from datetime import date
+
+from myql.contrib.finance.stockscraper.history import to_date
+
+MAGIC = b'MYQLCOL1'
+_ALIGN = 8
+_EPOCH = date(1970, 1, 1).toordinal()
+_NAN = float('nan')
+
+HISTORICAL_COLUMNS = ('Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Adj_Close')
+DIVIDEND_COLUMNS = ('Date', 'Dividends')
+
+
+def date_to_days(value):
+    '''Returns the number of days between 1970-01-01 and a date or a 'YYYY-MM-DD' string
+    '''
+    return to_date(value).toordinal() - _EPOCH
+
+
+def days_to_date(days):
+    return date.fromordinal(int(days) + _EPOCH)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError): # None, 'null', 'N/A', ...
+        return _NAN
+
+
+def _is_number(value):
+    return _number(value) == _number(value) # NaN isn't equal to itself
+
+
+def to_columns(rows, columns=None):
+    '''Returns a dict of column -> array.array of <rows> sorted by date, int64 ('q') for Date and float64 ('d') for the others.
+    <rows> is a list of quotes or a query result, <columns> defaults to the Date and the fields holding numbers,
+    i.e HISTORICAL_COLUMNS for historical quotes
+    '''
+    rows = getattr(rows, 'rows', rows)
+    if columns is None:
+        keys = set(key for row in rows for key in row if key != 'Date')
+        columns = ['Date'] + sorted(key for key in keys if any(_is_number(row.get(key)) for row in rows))
+
+    rows = sorted(rows, key=lambda row: row['Date'])
+    data = {}
+    for name in columns:
+        if name == 'Date':
+            data[name] = array.array('q', (date_to_days(row['Date']) for row in rows))
+        else:
+            data[name] = array.array('d', (_number(row.get(name)) for row in rows))
+    return data
+
+
+def write_columns(path, rows, columns=None):
+    '''Writes <rows> (see to_columns) to <path> as typed columns, each one 8 bytes aligned.
+    The file is replaced atomically, processes mapping the previous one keep reading it
+    '''
+    data = to_columns(rows, columns)
+    names = list(data) if columns is None else list(columns)
+    count = len(data[names[0]]) if names else 0
+
+    header_size = len(MAGIC) + 8
+    layout, offset = [], 0
+    for name in names:
+        layout.append([name, data[name].typecode, offset])
+        offset += count * data[name].itemsize
+    header = json.dumps({'count': count, 'byteorder': sys.byteorder, 'columns': layout}).encode('utf-8')
+    start = header_size + len(header)
+    start += -start % _ALIGN
+
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header + b'\0' * (start - header_size - len(header)))
+        for name in names:
+            data[name].tofile(f)
+    os.replace(tmp, path)
+    return count
+
+
+class Columns(object):
+    '''Columns written by write_columns, memory mapped read only. Columns are memoryviews of the mapping,
+    they must be released before close().
+    Attributes:
+    - path : path of the file
+    - names : column names
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # The mapping outlives the file descriptor
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError('{0} is not a columns file'.format(path))
+
+        size, = struct.unpack('<Q', self._mmap[len(MAGIC):len(MAGIC) + 8])
+        header = json.loads(self._mmap[len(MAGIC) + 8:len(MAGIC) + 8 + size].decode('utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            self._mmap.close()
+            raise ValueError('{0} was written on a {1} endian machine'.format(path, header['byteorder']))
+
+        start = len(MAGIC) + 8 + size
+        self._start = start + (-start % _ALIGN)
+        self._count = header['count']
+        self._layout = dict((name, (typecode, offset)) for name, typecode, offset in header['columns'])
+        self.names = [ name for name, _, _ in header['columns'] ]
+
+    def __repr__(self):
+        return "<Columns>: {0} - {1} rows - {2}".format(self.path, self._count, ', '.join(self.names))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, name):
+        return name in self._layout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getitem__(self, name):
+        '''Returns a column as a typed memoryview of the mapping, no copy
+        '''
+        typecode, offset = self._layout[name]
+        start = self._start + offset
+        itemsize = array.array(typecode).itemsize
+        return memoryview(self._mmap)[start:start + self._count * itemsize].cast(typecode)
+
+    def array(self, name):
+        '''Returns a column as a read only numpy array sharing the mapping, requires numpy
+        '''
+        import numpy # Optional dependency, only needed here
+
+        typecode, offset = self._layout[name]
+        return numpy.frombuffer(self._mmap, dtype=numpy.dtype(typecode), count=self._count, offset=self._start + offset)
+
+    def dates(self):
+        '''Returns the Date column as datetime.date
+        '''
+        return [ days_to_date(days) for days in self['Date'] ]
+
+    def close(self):
+        self._mmap.close()
@@ -0,0 +1,117 @@
+"""Local store of historical quotes, so only the dates never fetched are queried
+>>> from myql.contrib.finance.stockscraper import StockRetriever, HistoryStore
+>>> stocks = StockRetriever(history=HistoryStore('history.db'))
+>>> stocks.get_historical_info('YHOO', startDate='2010-01-01', endDate='2015-12-31') # Fetched once, by yearly windows
+>>> stocks.get_historical_info('YHOO', startDate='2012-01-01', endDate='2012-06-30') # No request
+"""
+
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+from myql.cache import _Transaction
+
+_DAY = timedelta(days=1)
+
+
+def to_date(value):
+    '''Returns the date of a 'YYYY-MM-DD' string
+    '''
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def split_range(start, end, days):
+    '''Returns the list of (start, end) windows of at most <days> days covering start..end, both included
+    '''
+    windows = []
+    while start <= end:
+        stop = min(end, start + timedelta(days=days - 1))
+        windows.append((start, stop))
+        start = stop + _DAY
+    return windows
+
+
+class HistoryStore(object):
+    '''Quotes of yahoo.finance.historicaldata stored in SQLite, one row per symbol and date,
+    along with the date ranges already fetched (weekends and holidays have no quote but are covered too).
+    Attributes:
+    - path : path of the database file, ':memory:' by default
+    - timeout : seconds to wait for a lock held by another process
+    '''
+
+    def __init__(self, path=':memory:', timeout=30):
+        import sqlite3 # Only HistoryStore users pay for importing it
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False) # Guarded by _lock
+        with self._lock, _Transaction(self._db) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS quotes (symbol TEXT, date TEXT, data TEXT, PRIMARY KEY (symbol, date))")
+            db.execute("CREATE TABLE IF NOT EXISTS ranges (symbol TEXT, start TEXT, end TEXT)")
+            db.execute("CREATE INDEX IF NOT EXISTS ranges_symbol ON ranges (symbol)")
+
+    def __repr__(self):
+        return "<HistoryStore>: {0}".format(self.path)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
+
+    def _ranges(self, db, symbol):
+        return [ (to_date(start), to_date(end)) for start, end in db.execute("SELECT start, end FROM ranges WHERE symbol = ? ORDER BY start", (symbol,)) ]
+
+    def ranges(self, symbol):
+        '''Returns the (start, end) date ranges stored for <symbol>
+        '''
+        with self._lock:
+            return self._ranges(self._db, symbol.upper())
+
+    def missing(self, symbol, start, end):
+        '''Returns the (start, end) date ranges of start..end not stored yet
+        '''
+        start, end = to_date(start), to_date(end)
+        gaps = []
+        for stored_start, stored_end in self.ranges(symbol):
+            if stored_end < start:
+                continue
+            if stored_start > end:
+                break
+            if stored_start > start:
+                gaps.append((start, stored_start - _DAY))
+            start = max(start, stored_end + _DAY)
+        if start <= end:
+            gaps.append((start, end))
+        return gaps
+
+    def add(self, symbol, start, end, quotes):
+        '''Stores the <quotes> of <symbol> and marks start..end as covered, nothing is covered if <end> is before <start>
+        '''
+        symbol, start, end = symbol.upper(), to_date(start), to_date(end)
+        with self._lock, _Transaction(self._db) as db:
+            db.executemany("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?)",
+                           [ (symbol, quote['Date'], json.dumps(quote, sort_keys=True)) for quote in quotes if quote.get('Date') ])
+            if end < start:
+                return
+
+            ranges = []
+            for stored in sorted(self._ranges(db, symbol) + [(start, end)]): # Merging overlapping and adjacent ranges
+                if ranges and stored[0] <= ranges[-1][1] + _DAY:
+                    ranges[-1] = (ranges[-1][0], max(ranges[-1][1], stored[1]))
+                else:
+                    ranges.append(stored)
+            db.execute("DELETE FROM ranges WHERE symbol = ?", (symbol,))
+            db.executemany("INSERT INTO ranges VALUES (?, ?, ?)", [ (symbol, str(s), str(e)) for s, e in ranges ])
+
+    def quotes(self, symbol, start, end):
+        '''Returns the stored quotes of <symbol> from <start> to <end>, most recent first as YQL does
+        '''
+        with self._lock:
+            rows = self._db.execute("SELECT data FROM quotes WHERE symbol = ? AND date >= ? AND date <= ? ORDER BY date DESC",
+                                    (symbol.upper(), str(to_date(start)), str(to_date(end)))).fetchall()
+        return [ json.loads(row[0]) for row in rows ]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
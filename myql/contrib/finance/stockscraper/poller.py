@@ -0,0 +1,113 @@
+"""Polls the quotes of a watchlist and emits the ones which changed
+>>> from myql.contrib.finance.stockscraper import QuotePoller
+>>> poller = QuotePoller(watchlist, interval=60, fields=['LastTradePriceOnly', 'Bid', 'Ask', 'Volume'])
+>>> for change in poller: # Runs until poller.stop()
+...     render(change.symbol, change.quote)
+"""
+
+import random
+import threading
+from collections import namedtuple
+
+from myql.throttle import RateLimiter, TokenBucket, monotonic
+from myql.contrib.finance.stockscraper.stockretriever import StockRetriever
+
+
+QuoteChange = namedtuple('QuoteChange', ['symbol', 'quote', 'previous'])
+QuoteChange.__doc__ = '''Quote of a symbol which changed since the previous poll.
+- symbol : symbol of the quote
+- quote : the new quote
+- previous : the previous quote, None the first time the symbol is seen
+'''
+
+
+class QuotePoller(object):
+    '''Queries the quotes of <symbols> every <interval> seconds with StockRetriever.get_current_info, by batches,
+    and emits the quotes which changed since the previous poll.
+    The quotes of a failed batch are kept from the previous poll, so they aren't emitted again once it succeeds.
+    Attributes:
+    - symbols : the watchlist
+    - stocks : the <StockRetriever> querying the quotes, one rate limited to <rate> requests per second by default
+    - interval : seconds between the start of two polls
+    - jitter : share of <interval> randomly added or removed, so pollers started together drift apart
+    - batch_size / max_workers : symbols per request and requests sent at the same time
+    - fields : fields compared to detect a change, all of them by default
+    - columns : columns queried, all of them by default
+    - failed : <QuoteBatch> which failed during the last poll
+    - polls : number of polls run
+    '''
+
+    def __init__(self, symbols, stocks=None, interval=60, jitter=0.1, batch_size=200, max_workers=4, rate=5, fields=None, columns=None, seed=None):
+        self.symbols = list(symbols)
+        if stocks is None:
+            stocks = StockRetriever(rate_limiter=RateLimiter(default=TokenBucket(rate, capacity=max_workers)) if rate else None)
+        self.stocks = stocks
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.fields = fields
+        self.columns = columns
+        self.failed = []
+        self.polls = 0
+        self._quotes = {}
+        self._random = random.Random(seed)
+        self._stopped = threading.Event()
+
+    def __repr__(self):
+        return "<QuotePoller>: {0} symbols - every {1}s - {2} polls".format(len(self.symbols), self.interval, self.polls)
+
+    def __iter__(self):
+        return self.changes()
+
+    def _compared(self, quote):
+        if self.fields is None:
+            return quote
+        return [ quote.get(field) for field in self.fields ]
+
+    def poll(self):
+        '''Queries the watchlist once and returns the list of <QuoteChange>
+        '''
+        bulk = self.stocks.get_current_info(self.symbols, self.columns, batch_size=self.batch_size, max_workers=self.max_workers)
+        self.failed = [ batch for batch in bulk.batches if batch.error is not None ]
+
+        changes = []
+        for quote in bulk.quotes:
+            symbol = quote.get('symbol') or quote.get('Symbol')
+            previous = self._quotes.get(symbol)
+            if previous is None or self._compared(quote) != self._compared(previous):
+                changes.append(QuoteChange(symbol, quote, previous))
+            self._quotes[symbol] = quote
+
+        self.polls += 1
+        return changes
+
+    def delay(self):
+        '''Returns the seconds between the start of two polls
+        '''
+        return self.interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+
+    def changes(self, polls=None):
+        '''Yields <QuoteChange> as polls run, until stop() is called or <polls> polls ran
+        '''
+        self._stopped.clear()
+        count = 0
+        while not self._stopped.is_set():
+            started = monotonic()
+            for change in self.poll():
+                yield change
+            count += 1
+            if polls is not None and count >= polls:
+                return
+            self._stopped.wait(max(0, started + self.delay() - monotonic()))
+
+    def run(self, callback, polls=None):
+        '''Calls callback(change) for every <QuoteChange>, until stop() is called or <polls> polls ran
+        '''
+        for change in self.changes(polls):
+            callback(change)
+
+    def stop(self):
+        '''Stops the polling, i.e from a callback or another thread
+        '''
+        self._stopped.set()
@@ -7,18 +7,39 @@ Documentation http://www.gurchet-rai.net/dev/yahoo-finance-yql
 
 import re
 import json
+from collections import namedtuple
 from datetime import date, timedelta
 
 import requests
 
-from myql.myql import YQL
+from myql import errors
+from myql.myql import YQL, _thread_pool
+from myql.result import Result
+from myql.contrib.finance.stockscraper.history import split_range, to_date
+
+
+QuoteBatch = namedtuple('QuoteBatch', ['symbols', 'quotes', 'error'])
+QuoteBatch.__doc__ = '''Outcome of a batch of StockRetriever.get_current_info.
+- symbols : symbols of the batch
+- quotes : list of their quotes, empty if the batch failed
+- error : exception raised by this batch, None on success
+'''
+
+BulkQuotes = namedtuple('BulkQuotes', ['quotes', 'batches'])
+BulkQuotes.__doc__ = '''Quotes of StockRetriever.get_current_info.
+- quotes : quotes of the successful batches, in the order of the symbols
+- batches : list of <QuoteBatch> in the order of the symbols
+'''
+
 
 class StockRetriever(YQL):
 
-    def __init__(self, format='json', debug=False, oauth=None):
-        """Initialize the object
+    def __init__(self, format='json', debug=False, oauth=None, history=None, **kwargs):
+        """Initialize the object.
+        <history> is a <HistoryStore> keeping the quotes of get_historical_info, so that only the missing dates are fetched
         """
-        super(StockRetriever, self).__init__(community=True, format=format, debug=debug, oauth=oauth)
+        super(StockRetriever, self).__init__(community=True, format=format, debug=debug, oauth=oauth, **kwargs)
+        self.history = history
     
     def __get_time_range(self, startDate, endDate):
         """Return time range
@@ -32,12 +53,41 @@ class StockRetriever(YQL):
         
         return startDate, endDate
 
-    def get_current_info(self, symbolList, columns=None):
+    def get_current_info(self, symbolList, columns=None, batch_size=200, max_workers=4):
         """get_current_info() uses the yahoo.finance.quotes datatable to get all of the stock information presented in the main table on a typical stock page 
         and a bunch of data from the key statistics page.
+        Symbols are queried by batches of <batch_size> over <max_workers> threads, so long lists don't make oversized urls.
+        Returns a <BulkQuotes>
+        >>> bulk = stock.get_current_info(symbols, max_workers=8)
+        >>> bulk.quotes, [ batch.symbols for batch in bulk.batches if batch.error ]
         """
-        response = self.select('yahoo.finance.quotes',columns).where(['symbol','in',symbolList])
-        return response
+        symbolList = list(symbolList)
+        query = self.query.select('yahoo.finance.quotes', columns, format='json') # Batches are parsed
+        batches = [ symbolList[i:i + batch_size] for i in range(0, len(symbolList), batch_size) ]
+
+        if len(batches) == 1: # No thread needed
+            batches = [ self._quote_batch(query, batches[0]) ]
+        else:
+            with _thread_pool(max_workers) as executor:
+                batches = list(executor.map(lambda symbols: self._quote_batch(query, symbols), batches))
+
+        return BulkQuotes([ quote for batch in batches for quote in batch.quotes ], batches)
+
+    def _quote_batch(self, query, symbols):
+        """Returns the <QuoteBatch> of a batch of symbols, its quotes in the order of the symbols
+        """
+        try:
+            response = query.where(['symbol', 'in', symbols]).execute()
+            if response.status_code != 200:
+                raise errors.QueryError(self._error_description(response))
+            quotes = response.rows
+        except (Exception,) as e:
+            return QuoteBatch(symbols, [], e)
+
+        position = dict((symbol.upper(), index) for index, symbol in reversed(list(enumerate(symbols))))
+        if all(isinstance(quote, dict) and str(quote.get('symbol', '')).upper() in position for quote in quotes):
+            quotes = sorted(quotes, key=lambda quote: position[quote['symbol'].upper()])
+        return QuoteBatch(symbols, quotes, None)
 
     def get_news_feed(self, symbol):
         """get_news_feed() uses the rss data table to get rss feeds under the Headlines and Financial Blogs headings on a typical stock page.
@@ -46,13 +96,69 @@ class StockRetriever(YQL):
         response = self.select('rss',['title','link','description'],limit=2).where(['url','=',rss_url])
         return response
 
-    def get_historical_info(self, symbol,items=None, startDate=None, endDate=None, limit=None):
-        """get_historical_info() uses the csv datatable to retrieve all available historical data on a typical historical prices page
+    def get_historical_info(self, symbol,items=None, startDate=None, endDate=None, limit=None, stream=False, window=365, max_workers=4):
+        """get_historical_info() uses the csv datatable to retrieve all available historical data on a typical historical prices page.
+        With stream=True, returns a generator of quotes parsed as the response is read.
+        With a history store, the dates not stored yet are fetched by windows of <window> days over <max_workers> threads
+        and the result is built from the store.
         """
         startDate, endDate = self.__get_time_range(startDate, endDate)
-        response = self.select('yahoo.finance.historicaldata',items,limit).where(['symbol','=',symbol],['startDate','=',startDate],['endDate','=',endDate])
+        if self.history is not None and not stream:
+            return self._stored_history(symbol, items, startDate, endDate, limit, window, max_workers)
+
+        response = self.select('yahoo.finance.historicaldata',items,limit).where(['symbol','=',symbol],['startDate','=',startDate],['endDate','=',endDate], stream=stream)
         return response
 
+    def _stored_history(self, symbol, items, startDate, endDate, limit, window, max_workers):
+        """Fetches the missing dates into the history store and returns the stored quotes as a YQL result
+        """
+        self._update_history(symbol, startDate, endDate, window, max_workers)
+
+        quotes = self.history.quotes(symbol, startDate, endDate)
+        if items:
+            quotes = [ dict((key, quote[key]) for key in items if key in quote) for quote in quotes ]
+        if limit:
+            quotes = quotes[:limit]
+
+        results = {'quote': quotes if len(quotes) != 1 else quotes[0]} if quotes else None # As YQL, a single quote isn't wrapped in a list
+        content = json.dumps({'query': {'count': len(quotes), 'results': results}}).encode('utf-8')
+        return Result(200, content, {'Content-Type': 'application/json'})
+
+    def _update_history(self, symbol, startDate, endDate, window, max_workers):
+        """Fetches the dates of startDate..endDate missing from the history store.
+        Today's quote may still change, it's stored but today isn't marked as covered
+        """
+        today = date.today()
+        gaps = self.history.missing(symbol, startDate, min(to_date(endDate), today))
+        windows = [ window_range for start, end in gaps for window_range in split_range(start, end, window) ]
+        if not windows:
+            return
+
+        query = self.query.select('yahoo.finance.historicaldata', format='json') # Windows are parsed, whatever the client format
+
+        def fetch(window_range):
+            start, end = window_range
+            try:
+                response = query.where(['symbol', '=', symbol], ['startDate', '=', str(start)], ['endDate', '=', str(end)]).execute()
+                if response.status_code != 200:
+                    raise errors.QueryError(self._error_description(response))
+                return response.rows, None
+            except (Exception,) as e:
+                return None, e
+
+        with _thread_pool(max_workers) as executor:
+            outcomes = list(executor.map(fetch, windows))
+
+        failed = []
+        for (start, end), (quotes, error) in zip(windows, outcomes):
+            if error is not None:
+                failed.append('{0}..{1} ({2})'.format(start, end, error))
+                continue
+            self.history.add(symbol, start, min(end, today - timedelta(days=1)), quotes)
+
+        if failed:
+            raise errors.QueryError('Historical quotes of {0} not fetched for {1}'.format(symbol, ', '.join(failed)))
+
     def get_options_info(self, symbol, items=None, expiration=''):
         """get_options_data() uses the yahoo.finance.options table to retrieve call and put options from the options page.
         """
@@ -96,7 +202,7 @@ class StockRetriever(YQL):
         """
         url = "http://autoc.finance.yahoo.com/autoc?query={0}&callback=YAHOO.Finance.SymbolSuggest.ssCallback".format(name)
 
-        response = requests.get(url)
+        response = self.session.get(url, timeout=self.timeout)
 
         json_data = re.match("YAHOO\.Finance\.SymbolSuggest.ssCallback\((.*)\)", response.text)
         try:
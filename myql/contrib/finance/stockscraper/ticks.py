@@ -0,0 +1,181 @@
+"""In-memory ring buffers of quotes, with rolling statistics computed for all the symbols at once. Requires numpy
+>>> from myql.contrib.finance.stockscraper import TickStore
+>>> ticks = TickStore(capacity=390)
+>>> ticks.append(stocks.get_current_info(watchlist, batch_size=200)) # Every poll
+>>> dict(zip(ticks.symbols, ticks.vwap(30))) # Over the last 30 ticks of every symbol
+"""
+
+import time
+import warnings
+
+numpy = None # Optional dependency, imported by the first TickStore as it is slow to import
+
+_ROWS = 64 # Symbols added to the buffers when they are full
+
+
+def _import_numpy():
+    global numpy
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('TickStore requires numpy, run : pip install myql[numpy]')
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError): # None, 'N/A', ...
+        return float('nan')
+
+
+class TickStore(object):
+    '''Last <capacity> ticks (price, volume, time) of every symbol, stored in (symbols x capacity) numpy arrays.
+    Statistics are computed over the last <window> ticks of every symbol and returned as arrays in the order of <symbols>,
+    NaN for symbols without any tick in the window
+    Attributes:
+    - capacity : ticks kept per symbol, the oldest ones are overwritten
+    - price / volume : quote fields of the price and of the volume
+    - cumulative_volume : <True> if <volume> is the volume of the day, as yahoo.finance.quotes' Volume,
+      the volume of a tick being then its increase since the previous tick
+    - symbols : symbols in the order of the rows of the statistics
+    '''
+
+    def __init__(self, capacity=1024, price='LastTradePriceOnly', volume='Volume', cumulative_volume=True):
+        if numpy is None:
+            _import_numpy()
+
+        self.capacity = capacity
+        self.price = price
+        self.volume = volume
+        self.cumulative_volume = cumulative_volume
+        self.symbols = []
+        self._rows = {}
+        self._prices = numpy.full((0, capacity), numpy.nan)
+        self._volumes = numpy.full((0, capacity), numpy.nan)
+        self._times = numpy.full((0, capacity), numpy.nan)
+        self._last_volume = numpy.zeros(0) # Raw volume of the last tick, to compute the increase of a cumulative one
+        self._next = numpy.zeros(0, dtype=numpy.int64) # Position of the next tick of every symbol
+        self._count = numpy.zeros(0, dtype=numpy.int64)
+
+    def __repr__(self):
+        return "<TickStore>: {0} symbols - capacity={1}".format(len(self.symbols), self.capacity)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _grow(self, size):
+        '''Adds rows to the buffers, by steps of _ROWS
+        '''
+        rows = self._prices.shape[0]
+        if size <= rows:
+            return
+        extra = max(size - rows, _ROWS)
+        empty = numpy.full((extra, self.capacity), numpy.nan)
+        self._prices = numpy.vstack([self._prices, empty])
+        self._volumes = numpy.vstack([self._volumes, empty])
+        self._times = numpy.vstack([self._times, empty])
+        self._last_volume = numpy.concatenate([self._last_volume, numpy.full(extra, numpy.nan)])
+        self._next = numpy.concatenate([self._next, numpy.zeros(extra, dtype=numpy.int64)])
+        self._count = numpy.concatenate([self._count, numpy.zeros(extra, dtype=numpy.int64)])
+
+    def _row(self, symbol):
+        row = self._rows.get(symbol)
+        if row is None:
+            row = self._rows[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return row
+
+    def append(self, quotes, timestamp=None):
+        '''Appends a tick per quote. <quotes> is a list of quotes, a query result or the <BulkQuotes> of get_current_info.
+        A symbol must appear only once per call
+        '''
+        if hasattr(quotes, 'batches'):
+            quotes = quotes.quotes
+        elif hasattr(quotes, 'rows'):
+            quotes = quotes.rows
+        quotes = [ quote for quote in quotes if quote.get('symbol') or quote.get('Symbol') ]
+        if not quotes:
+            return 0
+
+        rows = numpy.array([ self._row(quote.get('symbol') or quote.get('Symbol')) for quote in quotes ], dtype=numpy.int64)
+        self._grow(len(self.symbols))
+        prices = numpy.array([ _number(quote.get(self.price)) for quote in quotes ])
+        volumes = numpy.array([ _number(quote.get(self.volume)) for quote in quotes ])
+
+        if self.cumulative_volume:
+            raw, previous = volumes, self._last_volume[rows]
+            increase = raw - previous
+            volumes = numpy.where(numpy.isnan(previous) | (increase < 0), raw, increase) # First tick or new day
+            self._last_volume[rows] = numpy.where(numpy.isnan(raw), previous, raw)
+
+        positions = self._next[rows]
+        self._prices[rows, positions] = prices
+        self._volumes[rows, positions] = volumes
+        self._times[rows, positions] = time.time() if timestamp is None else timestamp
+        self._next[rows] = (positions + 1) % self.capacity
+        self._count[rows] = numpy.minimum(self._count[rows] + 1, self.capacity)
+        return len(quotes)
+
+    def window(self, buffer='price', size=None):
+        '''Returns the last <size> ticks (all of them by default) of every symbol as a (symbols x size) array,
+        the oldest first, NaN where a symbol has fewer ticks. <buffer> is 'price', 'volume' or 'time'
+        '''
+        data = {'price': self._prices, 'volume': self._volumes, 'time': self._times}[buffer]
+        size = self.capacity if size is None else min(size, self.capacity)
+        count = len(self.symbols)
+
+        columns = (self._next[:count, None] - size + numpy.arange(size)) % self.capacity
+        ticks = numpy.take_along_axis(data[:count], columns, axis=1)
+        ticks[numpy.arange(size) < size - self._count[:count, None]] = numpy.nan # Slots never written or overwritten
+        return ticks
+
+    def _reduce(self, func, values):
+        with warnings.catch_warnings(): # Rows without any tick are NaN, numpy warns about them
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return func(values, axis=1)
+
+    def last(self):
+        '''Returns the last price of every symbol
+        '''
+        return self.window('price', 1)[:, 0]
+
+    def mean(self, window=None):
+        return self._reduce(numpy.nanmean, self.window('price', window))
+
+    def min(self, window=None):
+        return self._reduce(numpy.nanmin, self.window('price', window))
+
+    def max(self, window=None):
+        return self._reduce(numpy.nanmax, self.window('price', window))
+
+    def vwap(self, window=None):
+        '''Returns the volume weighted average price of every symbol
+        '''
+        prices, volumes = self.window('price', window), self.window('volume', window)
+        traded = ~(numpy.isnan(prices) | numpy.isnan(volumes))
+        volume = numpy.where(traded, volumes, 0).sum(axis=1)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return numpy.where(volume > 0, numpy.where(traded, prices * volumes, 0).sum(axis=1) / volume, numpy.nan)
+
+    def returns(self, window=None):
+        '''Returns the (symbols x window - 1) array of the returns between consecutive ticks
+        '''
+        prices = self.window('price', window)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return prices[:, 1:] / prices[:, :-1] - 1
+
+    def total_return(self, window=None):
+        '''Returns the return of every symbol from the first to the last tick of the window
+        '''
+        prices = self.window('price', window)
+        valid = ~numpy.isnan(prices)
+        first = prices[numpy.arange(len(prices)), valid.argmax(axis=1)]
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return self.last() / first - 1
+
+    def stats(self, window=None):
+        '''Returns a dict of symbol -> dict of last, mean, min, max, vwap and return
+        '''
+        columns = [ ('last', self.last()), ('mean', self.mean(window)), ('min', self.min(window)), ('max', self.max(window)),
+                    ('vwap', self.vwap(window)), ('return', self.total_return(window)) ]
+        return dict((symbol, dict((name, float(values[row])) for name, values in columns)) for row, symbol in enumerate(self.symbols))
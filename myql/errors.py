@@ -6,4 +6,33 @@ class NoTableSelectedError(Exception):
 
     def __str__(self):
         return repr(self.msg)
- 
+
+
+class QueryError(Exception):
+    '''Error raised when YQL fails to run a query
+    '''
+    def __init__(self, msg=None):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class CircuitOpenError(Exception):
+    '''Error raised when a query is rejected because the upstream is considered unhealthy
+    '''
+    def __init__(self, msg=None):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class CassetteError(Exception):
+    '''Error raised when a query to replay hasn't been recorded
+    '''
+    def __init__(self, msg=None):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
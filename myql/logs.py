@@ -0,0 +1,50 @@
+"""Logging of mYQL.
+The library only has a NullHandler and never configures the root logger.
+Payloads and requests are logged at DEBUG level, formatted only when DEBUG is enabled.
+>>> from myql.logs import enable_debug
+>>> handler = enable_debug(structured=True) # one JSON object per line
+"""
+
+import json
+import logging
+
+logger = logging.getLogger('mYQL')
+logger.addHandler(logging.NullHandler())
+
+DEFAULT_FORMAT = "[%(asctime)s %(levelname)s] [%(name)s.%(module)s.%(funcName)s] %(message)s"
+
+
+class JSONFormatter(logging.Formatter):
+    '''Formats a record as a JSON object, fields passed as extra={'yql': {...}} included
+    '''
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'yql', None) or {})
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, sort_keys=True)
+
+
+def enable_debug(level=logging.DEBUG, structured=False, stream=None):
+    """Log the queries of mYQL to <stream> (stderr by default), as JSON lines if <structured>.
+    Returns the handler, to be given to disable_debug
+    """
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JSONFormatter() if structured else logging.Formatter(DEFAULT_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return handler
+
+
+def disable_debug(handler=None):
+    """Remove a handler added by enable_debug and make mYQL quiet again
+    """
+    if handler is not None:
+        logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
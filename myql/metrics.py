@@ -0,0 +1,197 @@
+"""Query metrics: latencies, byte counts, status codes, cache outcomes and errors,
+labelled by table and verb
+>>> from myql.metrics import MemorySink, prometheus_text
+>>> sink = MemorySink()
+>>> yql = YQL(metrics=sink)
+>>> print(prometheus_text(sink))
+"""
+
+import threading
+
+from myql.utils import query_table, query_verb
+from myql.throttle import monotonic
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+
+class BaseSink(object):
+    '''Receives the metrics of a client.
+    <labels> is a tuple of (name, value) pairs sorted by name
+    '''
+
+    def increment(self, name, labels, value=1):
+        raise NotImplementedError
+
+    def observe(self, name, labels, value):
+        raise NotImplementedError
+
+
+class Histogram(object):
+    '''Cumulative histogram of observed values
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def __repr__(self):
+        return "<Histogram>: count={0} - sum={1:.6f}".format(self.count, self.sum)
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MemorySink(BaseSink):
+    '''Keeps counters and histograms in memory
+    >>> sink.counter('requests_total', table='geo.countries', verb='select', status='200')
+    3
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<MemorySink>: {0} counters - {1} histograms".format(len(self._counters), len(self._histograms))
+
+    def increment(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def counter(self, name, **labels):
+        '''Returns the value of a counter, 0 if it has never been incremented
+        '''
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name, **labels):
+        '''Returns a <Histogram>, None if nothing has been observed
+        '''
+        return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def collect(self):
+        '''Returns the list of (type, name, labels, value) of all the metrics, value is a <Histogram> copy for histograms
+        '''
+        with self._lock:
+            metrics = [ (COUNTER, name, labels, value) for (name, labels), value in self._counters.items() ]
+            for (name, labels), histogram in self._histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+                metrics.append((HISTOGRAM, name, labels, copy))
+        return sorted(metrics, key=lambda metric: (metric[1], metric[2]))
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class QueryMetrics(object):
+    '''Records the metrics of a client into a sink.
+    Metrics:
+    - payload_build_seconds : time spent building payloads
+    - query_duration_seconds : time spent in execute_query, cache and retries included
+    - request_duration_seconds : time of each HTTP request
+    - requests_total : HTTP requests by status code, 'error' when no response was received
+    - request_bytes_total / response_bytes_total : size of the query parameters and of the response bodies
+    - cache_total : cache lookups by result, hit or miss
+    - errors_total : queries which raised, by exception name
+    '''
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __repr__(self):
+        return "<QueryMetrics>: {0}".format(self.sink)
+
+    @staticmethod
+    def labels(payload, **extra):
+        '''Returns the labels of a query: its table, its verb and <extra>
+        '''
+        query = payload.get('q', '')
+        labels = dict(extra, table=query_table(query) or '', verb=query_verb(query) or '')
+        return tuple(sorted(labels.items()))
+
+    def built(self, payload, started):
+        self.sink.observe('payload_build_seconds', self.labels(payload), monotonic() - started)
+
+    def cache(self, payload, hit):
+        self.sink.increment('cache_total', self.labels(payload, result='hit' if hit else 'miss'))
+
+    def query(self, payload, started, error=None):
+        self.sink.observe('query_duration_seconds', self.labels(payload), monotonic() - started)
+        if error is not None:
+            self.sink.increment('errors_total', self.labels(payload, error=type(error).__name__))
+
+    def request(self, payload, started, response=None, stream=False):
+        '''Records an HTTP request, <response> is None if it failed.
+        The body of a streamed response isn't read, its Content-Length is used if any
+        '''
+        labels = self.labels(payload)
+        self.sink.observe('request_duration_seconds', labels, monotonic() - started)
+        self.sink.increment('request_bytes_total', labels, sum(len(str(key)) + len(str(value)) + 2 for key, value in payload.items()))
+        status = str(response.status_code) if response is not None else 'error'
+        self.sink.increment('requests_total', self.labels(payload, status=status))
+
+        if response is not None:
+            size = response.headers.get('Content-Length') if stream else len(response.content or b'')
+            if size is not None:
+                self.sink.increment('response_bytes_total', labels, int(size))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def prometheus_text(sink, namespace='myql'):
+    """Return the metrics of a <MemorySink> in the Prometheus text exposition format
+    """
+    lines, declared = [], set()
+    for kind, name, labels, value in sink.collect():
+        name = '{0}_{1}'.format(namespace, name) if namespace else name
+        if name not in declared:
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            declared.add(name)
+
+        if kind == COUNTER:
+            lines.append('{0}{1} {2}'.format(name, _format_labels(labels), _format_value(value)))
+            continue
+
+        for bound, count in zip(value.buckets + (float('inf'),), value.counts + [value.count]):
+            lines.append('{0}_bucket{1} {2}'.format(name, _format_labels(labels, (('le', _format_value(float(bound))),)), count))
+        lines.append('{0}_sum{1} {2}'.format(name, _format_labels(labels), _format_value(value.sum)))
+        lines.append('{0}_count{1} {2}'.format(name, _format_labels(labels), value.count))
+
+    return '\n'.join(lines) + '\n'
@@ -4,16 +4,47 @@
 
 
 import re
+import time
 import logging
+from collections import namedtuple
 
-import requests
 from myql import errors 
+from myql import utils
+from myql.cache import payload_fingerprint
+from myql.logs import logger
+from myql.metrics import MemorySink, QueryMetrics
+from myql.query import QueryBuilder
+from myql.result import Result
+from myql.session import SessionFactory
+from myql.singleflight import SingleFlight
+from myql.stream import iter_results
+from myql.transport import RequestsTransport, build_url
+from myql.throttle import monotonic
+
+
+MultiQueryResult = namedtuple('MultiQueryResult', ['query', 'result', 'error'])
+MultiQueryResult.__doc__ = '''Outcome of one query of YQL.multi_query.
+- query : the query as submitted
+- result : content of <query.results> (raw content if the format isn't json)
+- error : exception raised by this query, None on success
+'''
+
+
+def _thread_pool(max_workers):
+    '''Returns a ThreadPoolExecutor, concurrent.futures is only imported when threads are needed
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=max_workers)
 
 
-logging.basicConfig(level=logging.DEBUG,format="[%(asctime)s %(levelname)s] [%(name)s.%(module)s.%(funcName)s] %(message)s \n")
-logger = logging.getLogger('mYQL')
+class _Deferred(object):
+    '''Computes a result when asked, quacks like a Future
+    '''
+    def __init__(self, func):
+        self.func = func
 
-logging.getLogger('requests').disabled = True # Disabling requests default logger
+    def result(self):
+        return self.func()
 
 
 class YQL(object):
@@ -24,6 +55,16 @@ class YQL(object):
     - format : default format of the responses
     - diagnostics : set to <True> to see diagnostics on queries
     - community : set to <True> to have access to community tables
+    - session : a <requests.Session> or a <SessionFactory> building pooled keep-alive sessions
+    - timeout : (connect, read) timeout of each request, defaults to the session factory one
+    - cache : a response cache such as <MemoryCache>, only select, desc and show responses are cached
+    - coalesce : set to <True> (or pass a shared <SingleFlight>) to send a single request for identical concurrent queries
+    - rate_limiter : a <RateLimiter> holding a token bucket per endpoint
+    - retry : a <RetryPolicy> applied to failed select, desc and show queries
+    - circuit_breaker : a <CircuitBreaker> failing queries fast while the upstream is unhealthy
+    - metrics : a metrics sink such as <MemorySink> (<True> for a new one), available as <metrics.sink>
+    - cassette : a <Cassette> recording requests or replaying them without network
+    - transport : a <BaseTransport> sending the requests, a <RequestsTransport> over <session> by default
     '''
     PUBLIC_URL = 'https://query.yahooapis.com/v1/public/yql'
     PRIVATE_URL = 'https://query.yahooapis.com/v1/yql'
@@ -31,7 +72,7 @@ class YQL(object):
 
     FUNC_FILTERS = ['sort', 'tail', 'truncate', 'reverse', 'unique', 'sanitize']
   
-    def __init__(self, community=True, format='json', jsonCompact=True, crossProduct=None, debug=False, diagnostics=False, oauth=None):
+    def __init__(self, community=True, format='json', jsonCompact=True, crossProduct=None, debug=False, diagnostics=False, oauth=None, session=None, timeout=None, cache=None, coalesce=False, rate_limiter=None, retry=None, circuit_breaker=None, metrics=None, cassette=None, transport=None):
         self.community = community # True means access to community data
         self.format = format
         self._table = None
@@ -44,35 +85,100 @@ class YQL(object):
         self.crossProduct = crossProduct
         self.jsonCompact = jsonCompact
         self.debug = debug
+        self.query = QueryBuilder(self) # Builds immutable queries: yql.query.select(...).where(...)
+        self.cache = cache
+        self.single_flight = self._init_single_flight(coalesce)
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.metrics = QueryMetrics(MemorySink() if metrics is True else metrics) if metrics else None
+        self.cassette = cassette
+        self._init_session(session, timeout)
+        self.transport = self._init_transport(transport)
+        self._sign_requests = transport is not None # OAuth sessions sign their own requests, other transports send signed urls
     
         if oauth:
             self.oauth = oauth
+            if self.session_factory and getattr(oauth, 'session', None) is not None:
+                self.session_factory.mount(oauth.session) # OAuth requests benefit from pooling too
 
     def __repr__(self):
         '''Returns information on the current instance
         '''
         return "<Community>: {0} - <Format>: {1} ".format(self.community, self.format)
 
+    def _init_single_flight(self, coalesce):
+        if coalesce is True:
+            return SingleFlight()
+        return coalesce or None
+
+    def _init_session(self, session, timeout):
+        '''Sets the HTTP session used to run queries
+        '''
+        if session is None:
+            session = SessionFactory()
+
+        if isinstance(session, SessionFactory):
+            self.session_factory = session
+            self.session = session()
+            self.timeout = timeout if timeout is not None else session.timeout
+        else:
+            self.session_factory = None
+            self.session = session
+            self.timeout = timeout
+
+    def _init_transport(self, transport):
+        '''Returns the transport sending the requests
+        '''
+        if transport is not None:
+            return transport
+        return RequestsTransport(self.session, self.timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Closes the pooled connections of the session and of the transport
+        '''
+        self.session.close()
+        self.transport.close()
+
     def _payload_builder(self, query, format=None):
         '''Build the payload'''
+        started = monotonic()
+        payload = self._build_payload(query, format, vars(self).get('_func'), self._limit, self._offset)
+        self._query = payload['q']
+        if self.metrics is not None:
+            self.metrics.built(payload, started)
+
+        self._payload = payload
+        if logger.isEnabledFor(logging.DEBUG): # Skips building the record on the hot path
+            logger.debug("PAYLOAD = %s", payload, extra={'yql': {'event': 'payload', 'payload': payload}})
+
+        return payload
+
+    def _build_payload(self, query, format=None, func=None, limit=None, offset=None):
+        '''Build the payload of a query without touching the instance state'''
         if self.community :
             query = self.COMMUNITY_DATA + query # access to community data tables
 
         if vars(self).get('yql_table_url') : # Attribute only defined when MYQL.use has been called before
             query = "use '{0}' as {1}; ".format(self.yql_table_url, self.yql_table_name) + query
 
-        if vars(self).get('_func'): # if post query function filters
-            query = '| '.join((query, self._func))
+        if func: # if post query function filters
+            query = '| '.join((query, func))
 
-        self._query = query        
-        
-        self._query = self._add_limit()
-        self._query = self._add_offset()
+        if limit:
+            query = ''.join((query," LIMIT {0} ".format(limit)))
 
-        logger.info("QUERY = %s" %(self._query,))
+        if offset:
+            query = ''.join((query," OFFSET {0} ".format(offset)))
 
         payload = {
-            'q': self._query,
+            'q': query,
             'callback': '',#This is not javascript
             'diagnostics': self.diagnostics,
             'format': format if format else self.format,
@@ -86,12 +192,9 @@ class YQL(object):
         if self.crossProduct:
             payload['crossProduct'] = 'optimized'
 
-        self._payload = payload
-        logger.info("PAYLOAD = %s " %(payload, ))
-
         return payload
 
-    def raw_query(self, query, format=None, pretty=False):
+    def raw_query(self, query, format=None, pretty=False, ttl=None):
         '''Executes a YQL query and returns a response
         >>>...
         >>> resp = yql.raw_query('select * from weather.forecast where woeid=2502265')
@@ -103,23 +206,196 @@ class YQL(object):
             format = self.format
 
         payload = self._payload_builder(query, format=format)
-        response = self.execute_query(payload)
+        response = self.execute_query(payload, ttl=ttl)
         if pretty:
             response = self.response_builder(response)
 
         return response
 
-    def execute_query(self, payload):
-        '''Execute the query and returns and response'''
+    def stream_query(self, query, chunk_size=65536):
+        '''Executes a YQL query and returns a generator of the items under query.results,
+        each one is yielded as soon as it is parsed from the response
+        >>> for row in yql.stream_query("select * from yahoo.finance.historicaldata where symbol='YHOO'"):
+        '''
+        payload = self._payload_builder(query, format='json')
+        return self._stream_results(payload, chunk_size)
+
+    def _stream_results(self, payload, chunk_size=65536):
+        '''Sends the query with a streamed response and returns the generator of its results
+        '''
+        response = self._send(payload, stream=True)
+        # Saving the status of the last response, not the live one nor its unread body
+        self._response = Result(response.status_code, b'', response.headers, response.url, response.reason, response.encoding)
+        if response.status_code != 200:
+            response.close()
+            raise errors.QueryError(self._error_description(response))
+
+        def results():
+            try:
+                for item in iter_results(response.iter_content(chunk_size)):
+                    yield item
+            finally:
+                response.close()
+
+        return results()
+
+    def execute_query(self, payload, ttl=None):
+        '''Execute the query and returns its <Result>.
+        <ttl> overrides the cache time to live of the response
+        '''
+        if self.metrics is not None:
+            return self._measured(payload, self._execute, payload, ttl)
+        return self._execute(payload, ttl)
+
+    def _execute(self, payload, ttl=None):
+        key = self._fingerprint(payload)
+        response = self._cache_lookup(key, payload)
+
+        if response is None:
+            if key and self.single_flight is not None: # Identical queries in flight share the response
+                response = self.single_flight.do(key, self._fetch, key, payload, ttl)
+            else:
+                response = self._fetch(key, payload, ttl)
+
+        self._response = response = Result.from_response(response) # Saving last result, not the whole response
+        return response
+
+    def _measured(self, payload, func, *args):
+        '''Runs func(*args) recording the query duration and its error if any
+        '''
+        started = monotonic()
+        try:
+            response = func(*args)
+        except (Exception,) as e:
+            self.metrics.query(payload, started, e)
+            raise
+        self.metrics.query(payload, started)
+        return response
+
+    def _cache_lookup(self, key, payload):
+        '''Returns the cached response of a query, None on a miss
+        '''
+        if not key or self.cache is None:
+            return None
+        response = self.cache.get(key)
+        if self.metrics is not None:
+            self.metrics.cache(payload, response is not None)
+        return response
+
+    def _fetch(self, key, payload, ttl=None):
+        '''Sends the query and caches its result'''
+        response = Result.from_response(self._send(payload))
+        self._cache_store(key, payload, response, ttl)
+        return response
+
+    def _send(self, payload, stream=False):
+        '''Sends the query, retrying idempotent ones according to the retry policy'''
+        url = self.PRIVATE_URL if vars(self).get('oauth') else self.PUBLIC_URL
+        retryable = self.retry is not None and self.retry.is_retryable(payload['q'])
+
+        attempt = 0
+        while True:
+            response, error, started = None, None, None
+            try:
+                time.sleep(self._before_request(url))
+                started = monotonic()
+                response = self._request(url, payload, stream)
+                self._after_request(url, response.status_code)
+            except errors.CassetteError: # Not an upstream failure, nothing was sent
+                raise
+            except (Exception,) as e:
+                if not isinstance(e, errors.CircuitOpenError):
+                    self._after_request(url)
+                error = e
+
+            if started is not None: # Requests stopped by the circuit breaker never started
+                self._log_request(url, payload, started, response, error)
+                if self.metrics is not None:
+                    self.metrics.request(payload, started, response, stream)
+
+            if not retryable or not self.retry.should_retry(attempt, response, error):
+                if error is not None:
+                    raise error
+                return response
+
+            if stream and response is not None: # Releasing the connection of the unread body
+                response.close()
+            time.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+    def _request(self, url, payload, stream=False):
+        '''Sends the query, through the cassette if any'''
+        if self.cassette is not None:
+            return self.cassette.request(url, payload, lambda: self._http_request(url, payload, stream))
+        return self._http_request(url, payload, stream)
+
+    def _http_request(self, url, payload, stream=False):
+        '''Sends the query over HTTP'''
         if vars(self).get('oauth'):
             if not self.oauth.token_is_valid(): # Refresh token if token has expired
                 self.oauth.refresh_token()
-            response = self.oauth.session.get(self.PRIVATE_URL, params= payload, header_auth=True)
-        else:
-            response = requests.get(self.PUBLIC_URL, params= payload)
+            if self._sign_requests:
+                url, headers = self._sign(url, payload)
+                return self.transport.send(url, None, headers, timeout=self.timeout, stream=stream)
+            return self.oauth.session.get(url, params= payload, header_auth=True, timeout=self.timeout, stream=stream)
 
-        self._response = response # Saving last response object.
-        return response
+        return self.transport.send(url, payload, timeout=self.timeout, stream=stream)
+
+    def _sign(self, url, payload):
+        '''Returns the url and headers of an OAuth authenticated query
+        '''
+        url = build_url(url, payload)
+
+        if getattr(self.oauth, 'oauth_version', 'oauth1') == 'oauth2':
+            return url, {'Authorization': 'Bearer {0}'.format(self.oauth.access_token)}
+
+        from oauthlib.oauth1 import Client
+        client = Client(self.oauth.consumer_key, client_secret=self.oauth.consumer_secret,
+                        resource_owner_key=self.oauth.access_token, resource_owner_secret=self.oauth.access_token_secret)
+        url, headers, _ = client.sign(url)
+        return url, headers
+
+    def _log_request(self, url, payload, started, response=None, error=None):
+        '''Logs an HTTP request at DEBUG level
+        '''
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        status = response.status_code if response is not None else repr(error)
+        duration = monotonic() - started
+        logger.debug("REQUEST %s - %s in %.3fs", payload['q'], status, duration,
+            extra={'yql': {'event': 'request', 'url': url, 'query': payload['q'], 'status': status, 'duration': duration}})
+
+    def _before_request(self, url):
+        '''Checks the circuit breaker and returns the delay imposed by the rate limiter
+        '''
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.allow()
+        if self.rate_limiter is not None:
+            return self.rate_limiter.reserve(url)
+        return 0
+
+    def _after_request(self, url, status_code=None):
+        '''Reports the outcome of a request, None meaning it failed
+        '''
+        if self.rate_limiter is not None:
+            self.rate_limiter.feedback(url, status_code)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(status_code)
+
+    def _fingerprint(self, payload):
+        '''Returns the key used to cache or coalesce a query, None if its response mustn't be shared
+        '''
+        if self.cache is None and self.single_flight is None:
+            return None
+        if utils.query_verb(payload['q']) not in utils.IDEMPOTENT_VERBS:
+            return None
+        return payload_fingerprint(payload)
+
+    def _cache_store(self, key, payload, response, ttl=None):
+        '''Caches successful responses
+        '''
+        if key and self.cache is not None and response.status_code == 200:
+            self.cache.set(key, response, ttl=ttl, table=utils.query_table(payload['q']))
 
     def _clause_formatter(self, cond):
         '''Formats conditions
@@ -158,7 +434,7 @@ class YQL(object):
         '''Try to return a pretty formatted response object
         '''
         try:
-            r = response.json()
+            r = response.data if isinstance(response, Result) else response.json()
             result = r['query']['results']
             response = {
                 'num_result': r['query']['count'] ,
@@ -192,11 +468,6 @@ class YQL(object):
                 raise TypeError('{0} is neither a <str>, a <tuple> or a <dict>'.format(func))
         return '| '.join(filters) 
 
-    def _add_limit(self,):
-        return ''.join((self._query," LIMIT {0} ".format(self._limit))) if self._limit else self._query
-
-    def _add_offset(self,): 
-        return ''.join((self._query," OFFSET {0} ".format(self._offset))) if self._offset else self._query
 
 
     ######################################################
@@ -251,7 +522,19 @@ class YQL(object):
         >>> yql.select('social.profile', ['guid', 'givenName', 'gender'])
         '''
         self._table = table
+        self._query = self._select_statement(table, items, remote_filter)
 
+        if func_filters:
+            self._func = self._func_filters(func_filters) 
+
+        self._limit = limit
+        self._offset = offset
+            
+        return self
+
+    def _select_statement(self, table, items=None, remote_filter=None):
+        '''Returns the select statement of a table
+        '''
         if remote_filter:
             if not isinstance(remote_filter, tuple):
                 raise TypeError("{0} must be of type <type tuple>".format(remote_filter))
@@ -260,34 +543,131 @@ class YQL(object):
 
         if not items:
             items = ['*']
-        self._query = "SELECT {1} FROM {0} ".format(table, ','.join(items))
-
-        if func_filters:
-            self._func = self._func_filters(func_filters) 
-
-        self._limit = limit
-        self._offset = offset
-            
-        return self
+        return "SELECT {1} FROM {0} ".format(table, ','.join(items))
 
     ## MULTI QUERY
-    def multi_query(self, queries):
-        """Allow multi query
+    def execute_many(self, payloads, ttl=None, max_workers=4):
+        '''Executes payloads over <max_workers> threads and returns the responses in the same order
+        '''
+        with _thread_pool(max_workers) as executor:
+            return list(executor.map(lambda payload: self.execute_query(payload, ttl=ttl), payloads))
+
+    def multi_query(self, queries, batch_size=10, max_workers=4):
+        """Executes many queries, statements or <Query> objects. Up to <batch_size> selects are packed
+        in a single yql.query.multi request and requests are spread over <max_workers> threads.
+        Returns a list of <MultiQueryResult> in the order of <queries>
+        >>> results = yql.multi_query(["select * from geo.countries where name='Congo'", "desc weather.forecast"])
+        >>> results[0].result
         """
-        pass
+        queries = list(queries) # Generators are walked twice
+        jobs = self._multi_jobs(queries, batch_size)
+
+        results = [None] * len(queries)
+        with _thread_pool(max_workers) as executor:
+            for outcomes in executor.map(lambda job: self._run_batch(*job), jobs):
+                for index, outcome in outcomes:
+                    results[index] = outcome
+
+        return results
+
+    def _multi_jobs(self, queries, batch_size):
+        '''Groups queries into batches and returns the list of (batch, payload)
+        '''
+        self._func, self._limit, self._offset = None, None, None # Leftovers of a previous select must not leak in
+
+        jobs, batch = [], []
+        for index, query in enumerate(queries):
+            if self.format == 'json' and batch_size > 1 and self._is_packable(str(query)):
+                batch.append((index, query))
+                if len(batch) == batch_size:
+                    jobs.append(batch)
+                    batch = []
+            else:
+                jobs.append([(index, query)])
+        if batch:
+            jobs.append(batch)
+
+        # Payloads are built here as _payload_builder isn't thread safe
+        return [ (batch, self._payload_builder(self._multi_statement(batch))) for batch in jobs ]
+
+    def _is_packable(self, query):
+        '''Only plain selects can go through yql.query.multi
+        '''
+        return query.strip().lower().startswith('select') and '"' not in query and ';' not in query
+
+    def _multi_statement(self, batch):
+        '''Returns the statement running all the queries of the batch
+        '''
+        if len(batch) == 1:
+            return str(batch[0][1])
+        return 'SELECT * FROM yql.query.multi WHERE queries="{0}"'.format(';'.join(str(query) for _, query in batch))
+
+    def _run_batch(self, batch, payload):
+        '''Executes a batch and splits its response into MultiQueryResult
+        '''
+        try:
+            response = self.execute_query(payload)
+            results = self._multi_results(response, len(batch))
+        except (Exception,) as e:
+            if len(batch) > 1: # Let's find out which query failed
+                return [ (index, self._run_batch([(index, query)], self._single_payload(payload, query))[0][1]) for index, query in batch ]
+            return [ (batch[0][0], MultiQueryResult(batch[0][1], None, e)) ]
+
+        return [ (index, MultiQueryResult(query, result, None)) for (index, query), result in zip(batch, results) ]
+
+    def _single_payload(self, payload, query):
+        '''Builds the payload of a query out of its batch payload without touching the instance state
+        '''
+        payload = dict(payload)
+        query = str(query)
+        payload['q'] = self.COMMUNITY_DATA + query if self.community else query
+        if vars(self).get('yql_table_url'):
+            payload['q'] = "use '{0}' as {1}; ".format(self.yql_table_url, self.yql_table_name) + payload['q']
+        return payload
+
+    def _multi_results(self, response, size):
+        '''Returns the list of results held by a (multi) query response
+        '''
+        if response.status_code != 200:
+            raise errors.QueryError(self._error_description(response))
+
+        if self.format != 'json':
+            return [response.content]
+
+        data = response.data['query']
+        if size == 1:
+            return [data['results']]
+
+        results = (data['results'] or {}).get('results')
+        if not isinstance(results, list) or len(results) != size:
+            raise errors.QueryError('yql.query.multi returned {0} results for {1} queries'.format(len(results or []), size))
+        return results
+
+    def _error_description(self, response):
+        '''Extracts the YQL error description of a failed response
+        '''
+        try:
+            return response.json()['error']['description']
+        except (Exception,):
+            return 'HTTP {0}'.format(response.status_code)
 
     ## INSERT
     def insert(self, table,items, values):
         """This method allows to insert data into table
         >>> yql.insert('bi.ly.shorten',('login','apiKey','longUrl'),('YOUR LOGIN','YOUR API KEY','YOUR LONG URL'))
         """
-        values = ["'{0}'".format(e) for e in values]
-        self._query = "INSERT INTO {0} ({1}) VALUES ({2})".format(table,','.join(items),','.join(values))
-        payload = self._payload_builder(self._query)
+        payload = self._insert_payload(table, items, values)
         response = self.execute_query(payload)
 
         return response
 
+    def _insert_payload(self, table, items, values):
+        '''Builds the payload of an insert
+        '''
+        values = ["'{0}'".format(e) for e in values]
+        self._query = "INSERT INTO {0} ({1}) VALUES ({2})".format(table,','.join(items),','.join(values))
+        return self._payload_builder(self._query)
+
     ## UPDATE
     def update(self, table, items, values):
         """Updates a YQL Table
@@ -295,11 +675,14 @@ class YQL(object):
         """
         self._table = table
         self._limit = None
-        items_values = ','.join(["{0} = '{1}'".format(k,v) for k,v in zip(items,values)])
-        self._query = "UPDATE {0} SET {1}".format(self._table, items_values)
+        self._query = self._update_statement(table, items, values)
 
         return self
 
+    def _update_statement(self, table, items, values):
+        items_values = ','.join(["{0} = '{1}'".format(k,v) for k,v in zip(items,values)])
+        return "UPDATE {0} SET {1}".format(table, items_values)
+
     ## DELETE
     def delete(self, table):
         """Deletes record in table
@@ -312,24 +695,101 @@ class YQL(object):
         return self
 
     ## WHERE
-    def where(self, *args):
+    def where(self, *args, **kwargs):
         ''' This method simulates a where condition. Use as follow:
         >>> yql.select('mytable').where(['name', '=', 'alain'], ['location', '!=', 'paris'])
+        A <ttl> keyword overrides the cache time to live of the response
+        >>> yql.select('yahoo.finance.quotes').where(['symbol', '=', 'YHOO'], ttl=5)
+        With <stream=True>, returns a generator of the results parsed incrementally (see stream_query)
+        >>> rows = yql.select('yahoo.finance.historicaldata').where(['symbol', '=', 'YHOO'], stream=True)
+        '''
+        payload = self._where_payload(*args)
+        if kwargs.get('stream'):
+            return self._stream_results(payload)
+
+        response = self.execute_query(payload, ttl=kwargs.get('ttl'))
+
+        return response
+
+    def _where_payload(self, *args):
+        '''Appends the where clause to the current query and returns its payload
+        '''
+        return self._payload_builder(self._add_where(*args))
+
+    def _add_where(self, *args):
+        '''Appends the where clause to the current query
         '''
         if not self._table:
             raise errors.NoTableSelectedError('No Table Selected')
 
-        clause = []
-        self._query += ' WHERE '
+        self._query += self._where_clause(*args)
 
-        clause = [ self._clause_formatter(x) for x in args if x ]
+        return self._query
 
-        self._query += ' AND '.join(clause)
+    def _where_clause(self, *args):
+        '''Returns the where clause of the conditions
+        '''
+        clause = [ self._clause_formatter(list(x)) for x in args if x ] # _clause_formatter formats in place
+
+        return ' WHERE ' + ' AND '.join(clause)
+
+    ## ITERATE
+    def iterate(self, *args, **kwargs):
+        '''Walks the results of a select page by page (LIMIT/OFFSET), fetching the next page
+        in background while the current one is consumed. Stops on a short page.
+        A limit given to select caps the total number of rows.
+        >>> for county in yql.select('geo.counties').iterate(['place', '=', 'CA'], page_size=50):
+        - page_size : number of rows per request
+        - prefetch : set to <False> to fetch pages only when needed
+        '''
+        page_size = kwargs.get('page_size', 100)
+        if not self._table:
+            raise errors.NoTableSelectedError('No Table Selected')
 
-        payload = self._payload_builder(self._query)
-        response = self.execute_query(payload)
+        query = self._add_where(*args) if args else self._query
+        remaining, offset = self._limit, self._offset or 0
+
+        def page(offset, remaining):
+            # Payloads are built in the calling thread, only requests run in background.
+            # The client limit and offset are left untouched so they don't leak into the next queries
+            size = min(page_size, remaining) if remaining is not None else page_size
+            return size, self._build_payload(query, None, vars(self).get('_func'), size, offset)
+
+        executor = _thread_pool(1) if kwargs.get('prefetch', True) else None
+
+        def fetch(payload):
+            if executor is None:
+                return _Deferred(lambda: self._page_rows(self.execute_query(payload)))
+            return executor.submit(lambda: self._page_rows(self.execute_query(payload)))
+
+        def rows(size, pending, offset, remaining):
+            try:
+                while True:
+                    results = pending.result()
+                    offset += len(results)
+                    remaining = remaining - len(results) if remaining is not None else None
+                    last = len(results) < size or (remaining is not None and remaining <= 0)
+                    if not last: # Next page is on its way while this one is consumed
+                        size, payload = page(offset, remaining)
+                        pending = fetch(payload)
+                    for row in results:
+                        yield row
+                    if last:
+                        return
+            finally:
+                if executor is not None:
+                    executor.shutdown(wait=False)
+
+        size, payload = page(offset, remaining)
+        return rows(size, fetch(payload), offset, remaining)
+
+    def _page_rows(self, response):
+        '''Returns the list of rows of a response
+        '''
+        if response.status_code != 200:
+            raise errors.QueryError(self._error_description(response))
 
-        return response
+        return response.rows
 
 
 class MYQL(YQL):
@@ -0,0 +1,196 @@
+"""Immutable, compiled YQL queries.
+Unlike YQL.select(...).where(...), building a query doesn't touch the client state,
+so a single client can be shared by threads.
+>>> yql = YQL()
+>>> countries = yql.query.select('geo.countries', ['name', 'woeid'])
+>>> congo = countries.where(['name', '=', 'Congo'])  # countries is left untouched
+>>> response = congo.execute()
+
+Queries are prepared statements: @variables are bound at execution time
+>>> quote = yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'])
+>>> responses = quote.execute_many([{'sym': 'YHOO'}, {'sym': 'GOOG'}])
+"""
+
+import re
+
+from myql import errors
+
+_STRINGS = re.compile(r"'[^']*'|\"[^\"]*\"")
+_VARIABLE = re.compile(r"@([A-Za-z_]\w*)")
+_RESERVED = ('q', 'callback', 'diagnostics', 'format', 'debug', 'jsonCompact', 'crossProduct') # Payload keys, not variables
+
+
+class Query(object):
+    '''Immutable YQL statement bound to a client.
+    Builder methods return new queries. The payload is compiled on first use and cached,
+    it holds the client settings (community, use, set, format, ...) of that moment.
+    '''
+
+    __slots__ = ('_client', '_statement', '_table', '_func', '_limit', '_offset', '_format', '_payload', '_variables')
+
+    _FIELDS = ('statement', 'table', 'func', 'limit', 'offset', 'format')
+
+    def __init__(self, client, statement, table=None, func=None, limit=None, offset=None, format=None):
+        set_ = object.__setattr__
+        set_(self, '_client', client)
+        set_(self, '_statement', statement)
+        set_(self, '_table', table)
+        set_(self, '_func', func)
+        set_(self, '_limit', limit)
+        set_(self, '_offset', offset)
+        set_(self, '_format', format)
+        set_(self, '_payload', None)
+        set_(self, '_variables', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("<Query> objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("<Query> objects are immutable")
+
+    def __repr__(self):
+        return "<Query>: {0}".format(self)
+
+    def __str__(self):
+        '''Returns the statement with its post query filters, limit and offset
+        '''
+        query = self._statement
+        if self._func:
+            query = '| '.join((query, self._func))
+        if self._limit:
+            query = ''.join((query, " LIMIT {0} ".format(self._limit)))
+        if self._offset:
+            query = ''.join((query, " OFFSET {0} ".format(self._offset)))
+        return query
+
+    def _replace(self, **kwargs):
+        attrs = dict((name, getattr(self, '_' + name)) for name in self._FIELDS)
+        attrs.update(kwargs)
+        return Query(self._client, **attrs)
+
+    @property
+    def table(self):
+        return self._table
+
+    @property
+    def statement(self):
+        return self._statement
+
+    @property
+    def variables(self):
+        '''Names of the @variables of the statement
+        '''
+        variables = self._variables
+        if variables is None:
+            variables = tuple(sorted(set(_VARIABLE.findall(_STRINGS.sub('', str(self))))))
+            object.__setattr__(self, '_variables', variables)
+        return variables
+
+    def where(self, *args):
+        '''Returns a new query with the conditions added
+        >>> yql.query.select('mytable').where(['name', '=', 'alain'], ['location', '!=', 'paris'])
+        '''
+        clause = self._client._where_clause(*args)
+        if ' WHERE ' in self._statement:
+            clause = clause.replace(' WHERE ', ' AND ', 1)
+        return self._replace(statement=self._statement + clause)
+
+    def limit(self, limit):
+        '''Returns a new query with a LIMIT
+        '''
+        return self._replace(limit=limit)
+
+    def offset(self, offset):
+        '''Returns a new query with an OFFSET
+        '''
+        return self._replace(offset=offset)
+
+    def compile(self):
+        '''Returns the payload of the query, built once and cached
+        '''
+        payload = self._payload
+        if payload is None:
+            payload = self._client._build_payload(self._statement, self._format, self._func, self._limit, self._offset)
+            object.__setattr__(self, '_payload', payload) # Compiling twice in a race is harmless
+        return payload
+
+    @property
+    def payload(self):
+        '''Copy of the compiled payload
+        '''
+        return dict(self.compile())
+
+    def _bind(self, bindings):
+        unknown = [ name for name in bindings if name not in self.variables or name in _RESERVED ]
+        if unknown:
+            raise errors.QueryError("Not variables of the query: {0}".format(', '.join(sorted(unknown))))
+
+        payload = self.compile()
+        missing = [ name for name in self.variables if name not in bindings and name not in payload ]
+        if missing:
+            raise errors.QueryError("Unbound variables: {0}".format(', '.join(missing)))
+        if not bindings:
+            return payload
+        payload = dict(payload)
+        payload.update(bindings)
+        return payload
+
+    def bind(self, **bindings):
+        '''Returns the payload with the @variables bound, variables set on the client are used as defaults.
+        Only the @variables of the query can be bound, payload keys such as q or format can't
+        >>> yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym']).bind(sym='YHOO')
+        '''
+        return dict(self._bind(bindings))
+
+    def execute(self, ttl=None, **bindings):
+        '''Runs the query and returns a response, it can be called concurrently.
+        <bindings> are the values of the @variables, they are part of the cache key
+        >>> quote.execute(sym='YHOO')
+        '''
+        return self._client.execute_query(self._bind(bindings), ttl=ttl)
+
+    def execute_many(self, bindings, ttl=None, max_workers=4):
+        '''Runs the query once per dict of <bindings>, concurrently.
+        Returns the responses in the order of <bindings>
+        >>> quote.execute_many([{'sym': 'YHOO'}, {'sym': 'GOOG'}])
+        '''
+        payloads = [ self._bind(values) for values in bindings ]
+        return self._client.execute_many(payloads, ttl=ttl, max_workers=max_workers)
+
+
+class QueryBuilder(object):
+    '''Builds <Query> objects for a client. Available as YQL.query
+    '''
+
+    def __init__(self, client):
+        self._client = client
+
+    def raw(self, statement, format=None):
+        '''Returns a query of a raw YQL statement
+        >>> yql.query.raw("select * from geo.states where place='Congo'")
+        '''
+        return Query(self._client, statement, format=format)
+
+    def select(self, table, items=None, limit=None, offset=None, remote_filter=None, func_filters=None, format=None):
+        '''Returns a select query, followed by where() if needed
+        >>> yql.query.select('social.profile', ['guid', 'givenName', 'gender'], limit=5)
+        '''
+        statement = self._client._select_statement(table, items, remote_filter)
+        func = self._client._func_filters(list(func_filters)) if func_filters else None # _func_filters formats in place
+        return Query(self._client, statement, table, func, limit, offset, format)
+
+    def update(self, table, items, values):
+        '''Returns an update query, to be followed by where()
+        >>> yql.query.update('yql.storage', ['value'], ['https://josuebrunel.org']).where(['name', '=', 'store://YEl70PraLLMSMuYAauqNc7'])
+        '''
+        return Query(self._client, self._client._update_statement(table, items, values), table)
+
+    def delete(self, table):
+        '''Returns a delete query, to be followed by where()
+        '''
+        return Query(self._client, "DELETE FROM {0}".format(table), table)
+
+    def desc(self, table):
+        '''Returns the query describing a table
+        '''
+        return Query(self._client, "desc {0}".format(table), table)
@@ -0,0 +1,127 @@
+"""Compact results of YQL queries
+>>> result = yql.raw_query('select * from geo.countries')
+>>> result.count, result.rows[0] # Parsed once, on first access
+>>> result.body # memoryview of the raw bytes, for pass-through without parsing
+"""
+
+import json
+
+_UNPARSED = object()
+
+
+class Result(object):
+    '''Raw body of a query response with its status, headers and url.
+    The body is parsed on first access to <data>, <count>, <rows> or <diagnostics> and the parse is kept,
+    it is shared by every holder of the result (i.e cache hits) and must be treated as read only.
+    <json()> returns a fresh parse, as <requests.Response.json> does.
+    Attributes:
+    - status_code, reason, headers, url, encoding : as in <requests.Response>
+    - content : body as bytes
+    - body : memoryview of the body, no copy
+    '''
+
+    __slots__ = ('status_code', 'reason', 'headers', 'url', 'encoding', '_content', '_data')
+
+    def __init__(self, status_code, content, headers=None, url=None, reason=None, encoding=None):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers if headers is not None else {}
+        self.url = url
+        self.encoding = encoding
+        self._content = content or b''
+        self._data = _UNPARSED
+
+    @classmethod
+    def from_response(cls, response):
+        '''Returns the result of a <requests.Response>, keeping its body but not the response
+        '''
+        if isinstance(response, cls):
+            return response
+        return cls(response.status_code, response.content, response.headers, response.url, response.reason, response.encoding)
+
+    def __repr__(self):
+        return "<Result [{0}]>: {1} bytes".format(self.status_code, len(self._content))
+
+    def __len__(self):
+        return len(self._content)
+
+    def __bool__(self):
+        return self.ok
+
+    __nonzero__ = __bool__ # Python 2
+
+    def __iter__(self):
+        return self.iter_content(128)
+
+    @property
+    def content(self):
+        return self._content
+
+    @property
+    def body(self):
+        return memoryview(self._content)
+
+    @property
+    def text(self):
+        return self._content.decode(self.encoding or 'utf-8', 'replace')
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self, **kwargs):
+        '''Returns a fresh parse of the body
+        '''
+        return json.loads(self.text, **kwargs)
+
+    @property
+    def data(self):
+        '''Parsed body, parsed only once
+        '''
+        if self._data is _UNPARSED:
+            self._data = self.json()
+        return self._data
+
+    @property
+    def query(self):
+        return self.data.get('query') or {}
+
+    @property
+    def count(self):
+        return self.query.get('count')
+
+    @property
+    def results(self):
+        return self.query.get('results')
+
+    @property
+    def rows(self):
+        '''Returns the list of items under query.results
+        '''
+        results = self.results
+        if not results:
+            return []
+
+        rows = list(results.values())[0] if len(results) == 1 else results
+        return rows if isinstance(rows, list) else [rows]
+
+    @property
+    def diagnostics(self):
+        return self.query.get('diagnostics')
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        '''Yields slices of the body
+        '''
+        body, size = self.body, chunk_size or len(self._content) or 1
+        for start in range(0, len(body), size):
+            chunk = body[start:start + size].tobytes()
+            yield chunk.decode(self.encoding or 'utf-8', 'replace') if decode_unicode else chunk
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            import requests
+
+            raise requests.HTTPError("{0} {1} for url: {2}".format(self.status_code, self.reason, self.url), response=self)
+
+    def close(self):
+        pass
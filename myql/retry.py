@@ -0,0 +1,108 @@
+"""Retry policy and circuit breaker
+>>> from myql.retry import RetryPolicy, CircuitBreaker
+>>> yql = YQL(retry=RetryPolicy(max_retries=3, backoff_factor=0.5), circuit_breaker=CircuitBreaker(failure_threshold=5, recovery_timeout=30))
+"""
+
+import random
+import threading
+
+from myql import errors
+from myql.utils import IDEMPOTENT_VERBS, query_verb
+from myql.throttle import THROTTLING_STATUS, is_failure, monotonic
+
+
+class RetryPolicy(object):
+    '''Retries failed idempotent queries (select, desc, show) with exponential backoff and full jitter.
+    insert, update and delete are never retried.
+    Attributes:
+    - max_retries : maximum number of retries of a query
+    - backoff_factor : delay before the first retry, doubled on each retry
+    - max_backoff : maximum delay between two attempts
+    - jitter : set to <False> to wait exactly the backoff delay
+    - status_forcelist : response status worth a retry
+    '''
+
+    STATUS_FORCELIST = THROTTLING_STATUS + (500, 502, 503, 504)
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, max_backoff=30, jitter=True, status_forcelist=None):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.status_forcelist = status_forcelist if status_forcelist is not None else self.STATUS_FORCELIST
+
+    def __repr__(self):
+        return "<RetryPolicy>: max_retries={0} - backoff_factor={1}".format(self.max_retries, self.backoff_factor)
+
+    def is_retryable(self, query):
+        '''Only idempotent queries can be retried
+        '''
+        return query_verb(query) in IDEMPOTENT_VERBS
+
+    def should_retry(self, attempt, response=None, error=None):
+        '''Returns True if the <attempt>th attempt (from 0) deserves another one
+        '''
+        if attempt >= self.max_retries or isinstance(error, (errors.CircuitOpenError, errors.CassetteError)):
+            return False
+        if error is not None:
+            return True
+        return response.status_code in self.status_forcelist
+
+    def delay(self, attempt):
+        '''Returns the number of seconds to wait after the <attempt>th attempt
+        '''
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** attempt))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class CircuitBreaker(object):
+    '''Fails fast while the upstream is unhealthy.
+    The circuit opens after <failure_threshold> consecutive failures. After <recovery_timeout> seconds
+    it lets <half_open_max_calls> probes through: a successful probe closes it, a failed one opens it again.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<CircuitBreaker>: {0} - {1} failures".format(self.state, self.failures)
+
+    def allow(self):
+        '''Raises CircuitOpenError if the request mustn't be sent
+        '''
+        with self._lock:
+            if self.state == self.OPEN:
+                if monotonic() - self._opened_at < self.recovery_timeout:
+                    raise errors.CircuitOpenError('Circuit open, upstream considered unhealthy')
+                self.state = self.HALF_OPEN
+                self._probes = 0
+
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max_calls:
+                    raise errors.CircuitOpenError('Circuit half-open, waiting for probes to complete')
+                self._probes += 1
+
+    def record(self, status_code=None):
+        '''Records the outcome of a request, None meaning the request failed
+        '''
+        with self._lock:
+            if not is_failure(status_code):
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = monotonic()
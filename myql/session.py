@@ -0,0 +1,57 @@
+"""Pooled, keep-alive HTTP sessions for YQL clients
+"""
+
+import threading
+
+
+class SessionFactory(object):
+    '''Builds pooled keep-alive <requests.Session>
+    Attributes:
+    - pool_connections : number of per-host connection pools to keep
+    - pool_maxsize : maximum number of connections kept alive per host
+    - pool_block : set to <True> to wait for a free connection instead of opening extra ones
+    - keep_alive : set to <False> to close the connection after each request
+    - timeout : default timeout, either a number or a (connect, read) tuple
+    '''
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, keep_alive=True, timeout=None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._shared = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<SessionFactory>: pool_connections={0} - pool_maxsize={1} - keep_alive={2}".format(self.pool_connections, self.pool_maxsize, self.keep_alive)
+
+    def __call__(self):
+        '''Returns a new pooled session
+        >>> session = SessionFactory(pool_maxsize=20)()
+        '''
+        import requests # Deferred until a session is needed, requests is slow to import
+
+        return self.mount(requests.Session())
+
+    def mount(self, session):
+        '''Mounts a pooled adapter on an existing session (i.e an OAuth session)
+        '''
+        from requests.adapters import HTTPAdapter
+
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, pool_block=self.pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+
+        return session
+
+    def shared(self):
+        '''Returns a session shared by every client built from this factory
+        '''
+        with self._lock:
+            if self._shared is None:
+                self._shared = self()
+        return self._shared
@@ -0,0 +1,63 @@
+"""Request coalescing: concurrent identical queries share a single upstream request
+>>> yql = YQL(coalesce=True)
+"""
+
+import threading
+
+
+class _Call(object):
+    '''A call in flight and its outcome
+    '''
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''Runs a function once for all the threads calling it with the same key at the same time.
+    Attributes:
+    - leaders : number of calls which actually ran the function
+    - shared : number of calls served by the result of another one
+    '''
+
+    def __init__(self):
+        self.leaders = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<SingleFlight>: {0} in flight".format(len(self._calls))
+
+    def do(self, key, func, *args):
+        '''Returns func(*args), or waits for the result of the call already in flight for <key>
+        >>> response = flight.do(fingerprint, yql._send, payload)
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except (Exception,) as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
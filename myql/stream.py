@@ -0,0 +1,130 @@
+"""Incremental parsing of YQL JSON responses.
+Items under query.results are yielded as soon as they are parsed, so memory
+stays bounded by the size of an item instead of the size of the response.
+"""
+
+import json
+import codecs
+
+_WHITESPACE = ' \t\n\r'
+
+
+class _Reader(object):
+    '''Buffers the text of a chunked JSON document, dropping what has been consumed
+    '''
+
+    def __init__(self, chunks, encoding='utf-8'):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def refill(self):
+        '''Reads the next chunk, returns False at the end of the document
+        '''
+        if self.eof:
+            return False
+
+        if self.pos > 65536: # Dropping consumed text
+            self.buf, self.pos = self.buf[self.pos:], 0
+
+        try:
+            chunk = next(self.chunks)
+            self.buf += self.decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        except StopIteration:
+            self.buf += self.decoder.decode(b'', final=True)
+            self.eof = True
+        return True
+
+    def peek(self):
+        '''Returns the next non whitespace character without consuming it
+        '''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.refill():
+                raise ValueError('Unexpected end of JSON document')
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("Expecting one of '{0}' at {1}, got '{2}'".format(chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        '''Decodes the next JSON value, reading more chunks until it is complete
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof: # A number ending the buffer might be truncated
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.refill()
+
+    def keys(self):
+        '''Iterates over the keys of an object, the caller consumes each value
+        '''
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def items(self):
+        '''Iterates over the elements of an array
+        '''
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_results(chunks, encoding='utf-8'):
+    """Yield the items under query.results of a YQL JSON response given as an iterable of chunks.
+    >>> for row in iter_results(response.iter_content(65536)):
+    """
+    reader = _Reader(chunks, encoding)
+
+    for key in reader.keys():
+        if key != 'query':
+            reader.value()
+            continue
+
+        for key in reader.keys():
+            if key != 'results':
+                reader.value()
+                continue
+
+            char = reader.peek()
+            if char == '[':
+                for item in reader.items():
+                    yield item
+            elif char == '{':
+                for _ in reader.keys(): # i.e {"quote": [...]} or {"quote": {...}} for a single row
+                    if reader.peek() == '[':
+                        for item in reader.items():
+                            yield item
+                    else:
+                        yield reader.value()
+            else: # null, no result
+                reader.value()
+            return
@@ -0,0 +1,127 @@
+"""Client-side rate limiting with adaptive backoff
+>>> from myql.throttle import RateLimiter, TokenBucket
+>>> limiter = RateLimiter({
+...     YQL.PUBLIC_URL: TokenBucket(rate=2000 / 3600.0, capacity=10),
+...     YQL.PRIVATE_URL: TokenBucket(rate=20000 / 3600.0, capacity=50)
+... })
+>>> yql = YQL(rate_limiter=limiter)
+"""
+
+import time
+import threading
+
+monotonic = getattr(time, 'monotonic', time.time) # Python 2 has no monotonic clock
+
+THROTTLING_STATUS = (429, 999) # 999 is Yahoo's "Unable to process request at this time"
+
+
+def is_failure(status_code):
+    """Return True if a response status (None for a failed request) means the upstream is throttling or unhealthy
+    """
+    return status_code is None or status_code in THROTTLING_STATUS or status_code >= 500
+
+
+class TokenBucket(object):
+    '''Token bucket whose rate adapts to the upstream health: it is cut down
+    each time a request is throttled or fails and grows back slowly on success.
+    Attributes:
+    - rate : requests per second
+    - capacity : maximum burst of requests
+    - min_rate : lowest rate the bucket can be slowed down to
+    - backoff : factor applied to the rate on throttling
+    - recovery : requests per second given back to the rate on each success, defaults to 5% of <rate>
+    '''
+
+    def __init__(self, rate, capacity=1, min_rate=None, backoff=0.5, recovery=None):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.min_rate = min_rate if min_rate is not None else self.max_rate / 100
+        self.backoff = backoff
+        self.recovery = recovery if recovery is not None else self.max_rate / 20
+        self._tokens = float(capacity)
+        self._stamp = monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<TokenBucket>: {0:.3f}/{1:.3f} req/s - capacity={2}".format(self.rate, self.max_rate, self.capacity)
+
+    def _refill(self):
+        now = monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, tokens=1):
+        '''Takes <tokens> and returns how many seconds the caller must wait before using them
+        '''
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens=1):
+        '''Blocks until <tokens> are available, returns the time waited
+        '''
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    def throttled(self):
+        '''Slows down after a throttled or failed request
+        '''
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * self.backoff)
+
+    def succeeded(self):
+        '''Recovers gradually after a successful request
+        '''
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.recovery)
+
+
+class RateLimiter(object):
+    '''Rate limits per endpoint
+    Attributes:
+    - limits : dict of url -> <TokenBucket>
+    - default : bucket of the urls missing from <limits>, None means no limit
+    '''
+
+    def __init__(self, limits=None, default=None):
+        self.limits = limits or {}
+        self.default = default
+
+    def __repr__(self):
+        return "<RateLimiter>: {0}".format(self.limits)
+
+    def bucket(self, url):
+        return self.limits.get(url, self.default)
+
+    def reserve(self, url):
+        '''Returns how many seconds to wait before querying <url>
+        '''
+        bucket = self.bucket(url)
+        return bucket.reserve() if bucket else 0.0
+
+    def acquire(self, url):
+        '''Blocks until <url> can be queried
+        '''
+        bucket = self.bucket(url)
+        return bucket.acquire() if bucket else 0.0
+
+    def feedback(self, url, status_code=None):
+        '''Adapts the rate of <url> to a response status, None meaning the request failed
+        '''
+        bucket = self.bucket(url)
+        if bucket is None:
+            return
+
+        if is_failure(status_code):
+            bucket.throttled()
+        else:
+            bucket.succeeded()
@@ -0,0 +1,158 @@
+"""Transports send the HTTP requests of a YQL client, the client picks one at construction
+>>> from myql.transport import Urllib3Transport
+>>> yql = YQL(transport=Urllib3Transport(maxsize=20))
+
+- RequestsTransport : a pooled <requests.Session>, the default
+- Urllib3Transport : a bare urllib3 pool, less overhead per request
+- InProcessTransport : a function answering the requests, for tests and benchmarks
+- myql.aio.AiohttpTransport : an aiohttp session, the default of AsyncYQL
+"""
+
+import io
+
+try:
+    from urllib.parse import urlencode, urlparse, parse_qsl
+except ImportError: # Python 2
+    from urllib import urlencode
+    from urlparse import urlparse, parse_qsl
+
+from myql.session import SessionFactory
+from myql.utils import build_response
+
+
+def encode_params(payload):
+    '''Url-encodes a payload the way requests does
+    '''
+    return urlencode([ (key, value) for key, value in payload.items() if value is not None ])
+
+
+def build_url(url, params=None):
+    '''Returns <url> with the encoded <params> as query string
+    '''
+    if not params:
+        return url
+    return '{0}?{1}'.format(url, encode_params(params))
+
+
+class BaseTransport(object):
+    '''Sends a GET request and returns a <requests.Response>.
+    <params> is None when the query string is already in <url>, i.e signed OAuth requests.
+    <timeout> is either a number or a (connect, read) tuple.
+    <blocking> is False when send doesn't wait on I/O, AsyncYQL then calls it from the event loop instead of a worker thread
+    '''
+
+    blocking = True
+
+    def send(self, url, params=None, headers=None, timeout=None, stream=False):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(BaseTransport):
+    '''Sends requests with a <requests.Session>
+    Attributes:
+    - session : a session, or a <SessionFactory> building a pooled one (the default)
+    - timeout : default timeout
+    '''
+
+    def __init__(self, session=None, timeout=None):
+        if session is None:
+            session = SessionFactory()
+        if isinstance(session, SessionFactory):
+            timeout = timeout if timeout is not None else session.timeout
+            session = session()
+        self.session = session
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "<RequestsTransport>: {0}".format(self.session)
+
+    def send(self, url, params=None, headers=None, timeout=None, stream=False):
+        kwargs = {'headers': headers} if headers else {}
+        return self.session.get(url, params=params, timeout=timeout if timeout is not None else self.timeout, stream=stream, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class Urllib3Transport(BaseTransport):
+    '''Sends requests with a <urllib3.PoolManager>, skipping the per request work of requests
+    (session merging, hooks, cookies)
+    Attributes:
+    - num_pools : number of per-host connection pools to keep
+    - maxsize : maximum number of connections kept alive per host
+    - block : set to <True> to wait for a free connection instead of opening extra ones
+    - keep_alive : set to <False> to close the connection after each request
+    - timeout : default timeout
+    '''
+
+    def __init__(self, num_pools=10, maxsize=10, block=False, keep_alive=True, timeout=None, **pool_kwargs):
+        import urllib3 # Deferred, only needed by this transport
+
+        self._urllib3 = urllib3
+        self.pool = urllib3.PoolManager(num_pools=num_pools, maxsize=maxsize, block=block, retries=False, **pool_kwargs) # Retries are the client's business
+        self.headers = urllib3.make_headers(keep_alive=keep_alive, accept_encoding=True)
+        if not keep_alive:
+            self.headers['connection'] = 'close'
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "<Urllib3Transport>: {0}".format(self.pool)
+
+    def _timeout(self, timeout):
+        timeout = timeout if timeout is not None else self.timeout
+        if isinstance(timeout, (tuple, list)):
+            return self._urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        return timeout
+
+    def send(self, url, params=None, headers=None, timeout=None, stream=False):
+        url = build_url(url, params)
+        kwargs = {}
+        timeout = self._timeout(timeout)
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+
+        resp = self.pool.request('GET', url, headers=dict(self.headers, **(headers or {})), preload_content=not stream, **kwargs)
+        if stream:
+            return build_response(resp.status, resp.headers, None, url, raw=resp)
+        return build_response(resp.status, resp.headers, resp.data, url)
+
+    def close(self):
+        self.pool.clear()
+
+
+class InProcessTransport(BaseTransport):
+    '''Answers requests with a function, without network.
+    <handler(url, params)> returns either a response or a (status, content type, body) tuple,
+    <params> being strings as an HTTP server would get them
+    >>> yql = YQL(transport=InProcessTransport(lambda url, params: (200, 'application/json', '{"query": {}}')))
+    Attributes:
+    - requests : number of requests answered
+    '''
+
+    blocking = False
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = 0
+
+    def __repr__(self):
+        return "<InProcessTransport>: {0} - {1} requests".format(self.handler, self.requests)
+
+    def send(self, url, params=None, headers=None, timeout=None, stream=False):
+        url = build_url(url, params)
+        parsed = urlparse(url)
+        self.requests += 1
+
+        response = self.handler(parsed.scheme + '://' + parsed.netloc + parsed.path, dict(parse_qsl(parsed.query)))
+        if not isinstance(response, tuple):
+            return response
+
+        status, content_type, body = response
+        body = body.encode('utf-8') if not isinstance(body, bytes) else body
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+        if stream:
+            return build_response(status, headers, None, url, raw=io.BytesIO(body))
+        return build_response(status, headers, body, url)
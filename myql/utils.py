@@ -1,5 +1,11 @@
+import re
 import json
-from xml.dom import minidom
+
+
+IDEMPOTENT_VERBS = ('select', 'desc', 'show')
+
+_VERB_RE = re.compile(r"^\s*(?:(?:env|use|set)\s[^;]*;\s*)*(\w+)", re.I)
+_TABLE_RE = re.compile(r"\b(?:from|into|desc|update)\s+([\w.]+)", re.I)
 
 
 def pretty_json(data):
@@ -12,6 +18,8 @@ def pretty_json(data):
 def pretty_xml(data):
     """Return a pretty formated xml
     """
+    from xml.dom import minidom
+
     parsed_string = minidom.parseString(data.decode('utf-8'))
     return parsed_string.toprettyxml(indent='\t', encoding='utf-8')
 
@@ -24,3 +32,40 @@ def prettyfy(response, format='json'):
     else:
         return pretty_xml(response.content)
 
+
+def build_response(status_code, headers, content, url=None, raw=None):
+    """Wrap a raw HTTP response into a requests.Response, <raw> being a file like body
+    read as the content is iterated (streamed responses)
+    """
+    import requests
+    from requests.utils import get_encoding_from_headers
+
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    if raw is not None:
+        response.raw = raw
+    else:
+        response._content = content
+        response._content_consumed = True # iter_content slices the content instead of reading <raw>
+    response.url = url
+    return response
+
+
+def query_verb(query):
+    """Return the verb (select, desc, insert, ...) of a YQL statement, env and use prefixes apart
+    """
+    match = _VERB_RE.match(query)
+    return match.group(1).lower() if match else None
+
+
+def query_table(query):
+    """Return the first table a YQL statement works on
+    """
+    match = _VERB_RE.match(query)
+    if match:
+        query = query[match.start(1):] # Skipping env and use prefixes
+
+    match = _TABLE_RE.search(query)
+    return match.group(1) if match else None
@@ -41,5 +41,9 @@ setup(
   ],
   platforms=['Any'],
   license='MIT',
-  install_requires = required
+  install_requires = required,
+  extras_require = {
+    'async': ['aiohttp>=3.0'],
+    'numpy': ['numpy'],
+  }
 )
@@ -11,3 +11,25 @@ from tests.tests import TestRemoteFilters
 from tests.tests import TestFuncFilters
 from tests.tests import TestPaging
 from tests.tests import TestMultiQuery
+from tests.tests import TestSession
+from tests.tests import TestAsync
+from tests.tests import TestMemoryCache
+from tests.tests import TestSQLiteCache
+from tests.tests import TestSingleFlight
+from tests.tests import TestRateLimiter
+from tests.tests import TestRetry
+from tests.tests import TestStream
+from tests.tests import TestIterate
+from tests.tests import TestQuery
+from tests.tests import TestMetrics
+from tests.tests import TestLogging
+from tests.tests import TestImports
+from tests.tests import TestBenchmarks
+from tests.tests import TestCassette
+from tests.tests import TestTransport
+from tests.tests import TestResult
+from tests.tests import TestStockBatches
+from tests.tests import TestHistoryStore
+from tests.tests import TestColumns
+from tests.tests import TestQuotePoller
+from tests.tests import TestTickStore
@@ -1,17 +1,46 @@
 
 
 import os
+import re
 import pdb
+import time
+import shutil
+import tempfile
+import threading
+import datetime
+import io
 import logging
 import json
 import unittest
+import asyncio
+import requests
 from xml.dom import minidom
 from xml.etree import cElementTree as xtree
 
 from yahoo_oauth import OAuth1
 
 from myql import MYQL, YQL
-from myql.errors import NoTableSelectedError
+from myql.session import SessionFactory
+from myql.cache import MemoryCache, SQLiteCache, payload_fingerprint
+from myql.singleflight import SingleFlight
+from myql.throttle import RateLimiter, TokenBucket
+from myql.retry import RetryPolicy, CircuitBreaker
+from myql.stream import iter_results
+from myql.metrics import MemorySink, prometheus_text
+from myql.logs import enable_debug, disable_debug
+from myql.cassette import Cassette
+from myql.result import Result
+from myql.transport import BaseTransport, RequestsTransport, Urllib3Transport, InProcessTransport
+
+try:
+    import numpy
+except ImportError: # Optional dependency
+    numpy = None
+try:
+    from myql import aio
+except (ImportError, SyntaxError): # Python 2
+    aio = None
+from myql.errors import NoTableSelectedError, QueryError, CircuitOpenError, CassetteError
 from myql.utils import pretty_xml, pretty_json, prettyfy
 
 from myql.contrib.table import Table
@@ -19,7 +48,8 @@ from myql.contrib.table import BaseInput
 from myql.contrib.table import Binder, BinderFunction, InputKey, InputValue, PagingPage, PagingUrl, PagingOffset
 
 from myql.contrib.weather import Weather
-from myql.contrib.finance.stockscraper import StockRetriever
+from myql.contrib.finance.stockscraper import StockRetriever, HistoryStore, Columns, write_columns, QuotePoller, TickStore, BulkQuotes
+from myql.contrib.finance.stockscraper.columns import HISTORICAL_COLUMNS, DIVIDEND_COLUMNS
 
 logging.basicConfig(level=logging.DEBUG,format="[%(asctime)s %(levelname)s] [%(name)s.%(module)s.%(funcName)s] %(message)s \n")
 
@@ -41,6 +71,36 @@ def json_get_data(filename):
     return json_data
 
 
+def make_response(data, status_code=200, url=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+    response.headers['Content-Type'] = 'application/json'
+    response.url = url
+    return response
+
+
+def make_results(rows, name='row'):
+    return {'query': {'count': len(rows), 'lang': 'en-US', 'results': {name: rows} if rows else None}}
+
+
+class FakeSession(object):
+    '''Offline stand-in for a requests.Session, records every call
+    '''
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda url, params: make_response(make_results([{'q': params['q']}])))
+        self.calls = []
+        self.closed = False
+
+    def get(self, url, params=None, **kwargs):
+        self.calls.append((url, dict(params or {}), kwargs))
+        return self.handler(url, params)
+
+    def close(self):
+        self.closed = True
+
+
 class TestMYQL(unittest.TestCase):
 
     def setUp(self,):
@@ -153,11 +213,48 @@ class TestMYQL(unittest.TestCase):
 class TestMultiQuery(unittest.TestCase):
 
     def setUp(self,):
-        pass
+        self.session = FakeSession(self.handler)
+        self.yql = YQL(community=False, session=self.session)
 
     def tearDown(self,):
         pass
 
+    def handler(self, url, params):
+        query = params['q']
+        if 'fail' in query:
+            return make_response({'error': {'description': 'Query syntax error(s)'}}, status_code=400)
+        if 'yql.query.multi' in query:
+            queries = query.split('"')[1].split(';')
+            if any('fail' in q for q in queries):
+                return make_response({'error': {'description': 'Query syntax error(s)'}}, status_code=400)
+            return make_response(make_results([{'row': {'q': q}} for q in queries], 'results'))
+        return make_response({'query': {'count': 1, 'results': {'row': {'q': query}}}})
+
+    def test_multi_query_packs_selects(self,):
+        queries = ["select * from geo.countries where name='{0}'".format(i) for i in range(5)]
+        results = self.yql.multi_query(queries, batch_size=2)
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual([r.query for r in results], queries)
+        self.assertEqual([r.result['row']['q'] for r in results], queries)
+        self.assertTrue(all(r.error is None for r in results))
+
+    def test_multi_query_accepts_a_generator(self,):
+        results = self.yql.multi_query(("select * from geo.countries where name='{0}'".format(i) for i in range(3)), batch_size=2)
+        self.assertEqual([r.result['row']['q'] for r in results], ["select * from geo.countries where name='{0}'".format(i) for i in range(3)])
+
+    def test_multi_query_keeps_order_of_unpacked_queries(self,):
+        queries = ['desc geo.countries', "select * from geo.states where place='CA'", 'show tables']
+        results = self.yql.multi_query(queries, batch_size=1, max_workers=3)
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual([r.result['row']['q'] for r in results], queries)
+
+    def test_multi_query_reports_errors_per_query(self,):
+        queries = ["select * from geo.countries", "select * from fail", "select * from geo.states"]
+        results = self.yql.multi_query(queries)
+        self.assertTrue(isinstance(results[1].error, QueryError))
+        self.assertEqual(results[0].error, None)
+        self.assertEqual(results[2].result['row']['q'], queries[2])
+
 class TestPaging(unittest.TestCase):
 
     def setUp(self,):
@@ -188,6 +285,560 @@ class TestPaging(unittest.TestCase):
         self.assertEqual(data.status_code, 200)
 
 
+class TestIterate(unittest.TestCase):
+
+    def setUp(self,):
+        self.data = [ {'name': 'county {0}'.format(i)} for i in range(25) ]
+        self.session = FakeSession(self.handler)
+        self.yql = YQL(session=self.session)
+
+    def handler(self, url, params):
+        limit = re.search(r'LIMIT (\d+)', params['q'])
+        offset = re.search(r'OFFSET (\d+)', params['q'])
+        offset = int(offset.group(1)) if offset else 0
+        rows = self.data[offset:offset + int(limit.group(1))]
+        return make_response(make_results(rows if len(rows) != 1 else rows[0], 'place'))
+
+    def test_iterate_pages(self,):
+        rows = list(self.yql.select('geo.counties').iterate(['place', '=', 'CA'], page_size=10))
+        self.assertEqual(rows, self.data)
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertTrue(self.session.calls[2][1]['q'].endswith("WHERE place = 'CA' LIMIT 10  OFFSET 20 "))
+
+    def test_iterate_stops_on_short_or_empty_page(self,):
+        self.data = self.data[:20]
+        self.assertEqual(len(list(self.yql.select('geo.counties').iterate(page_size=10))), 20)
+        self.assertEqual(len(self.session.calls), 3)
+        self.data = self.data[:11]
+        self.assertEqual(len(list(self.yql.select('geo.counties').iterate(page_size=10))), 11)
+
+    def test_select_limit_and_offset(self,):
+        rows = list(self.yql.select('geo.counties', limit=12, offset=3).iterate(page_size=5))
+        self.assertEqual(rows, self.data[3:15])
+        self.assertTrue(self.session.calls[-1][1]['q'].endswith('LIMIT 2  OFFSET 13 '))
+
+    def test_prefetch(self,):
+        rows = self.yql.select('geo.counties').iterate(page_size=10)
+        next(rows)
+        for _ in range(100):
+            if len(self.session.calls) == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(self.session.calls), 2)
+        rows.close()
+
+    def test_no_prefetch(self,):
+        rows = self.yql.select('geo.counties').iterate(page_size=10, prefetch=False)
+        next(rows)
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_client_state_is_left_untouched(self,):
+        self.assertEqual(len(list(self.yql.select('geo.counties').iterate(page_size=5))), 25)
+        self.yql.raw_query('select * from x LIMIT 1')
+        self.assertTrue(self.session.calls[-1][1]['q'].endswith('; select * from x LIMIT 1'))
+
+    def test_raise_exception_no_table_selected(self):
+        with self.assertRaises(NoTableSelectedError):
+            YQL(session=self.session).iterate(page_size=10)
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self,):
+        self.session = FakeSession(self.handler)
+        self.yql = YQL(session=self.session)
+
+    def handler(self, url, params):
+        return make_response(make_results({'q': params['q']}))
+
+    def test_query_is_immutable(self,):
+        query = self.yql.query.select('geo.countries', ['name'])
+        with self.assertRaises(AttributeError):
+            query._statement = 'SELECT * FROM geo.states'
+        with self.assertRaises(AttributeError):
+            query.foo = 'bar'
+
+    def test_builder_returns_new_queries(self,):
+        countries = self.yql.query.select('geo.countries', ['name'])
+        congo = countries.where(['name', '=', 'Congo'])
+        self.assertEqual(str(countries), 'SELECT name FROM geo.countries ')
+        self.assertEqual(str(congo), "SELECT name FROM geo.countries  WHERE name = 'Congo'")
+        self.assertEqual(str(congo.where(['woeid', '>', 1]).limit(5)), "SELECT name FROM geo.countries  WHERE name = 'Congo' AND woeid > '1' LIMIT 5 ")
+        self.assertEqual(congo.table, 'geo.countries')
+
+    def test_compiled_payload(self,):
+        query = self.yql.query.select('geo.countries', ['name'], limit=2).where(['place', '=', 'Africa'])
+        payload = query.compile()
+        self.assertIs(query.compile(), payload)
+        self.yql.select('geo.countries', ['name'], limit=2).where(['place', '=', 'Africa'])
+        self.assertEqual(payload, self.yql._payload)
+        query.payload['q'] = 'SELECT * FROM geo.states'
+        self.assertEqual(query.compile(), payload)
+
+    def test_concurrent_execute(self,):
+        queries = [ self.yql.query.select('geo.countries').where(['name', '=', 'country {0}'.format(i)]) for i in range(20) ]
+        results = [None] * len(queries)
+
+        def run(index):
+            results[index] = queries[index].execute().json()['query']['results']['row']['q']
+
+        threads = [ threading.Thread(target=run, args=(i,)) for i in range(len(queries)) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [ query.payload['q'] for query in queries ])
+
+    def test_multi_query(self,):
+        queries = [ self.yql.query.select('geo.countries').where(['name', '=', 'Congo']), "SELECT * FROM geo.states" ]
+        results = self.yql.multi_query(queries, batch_size=1)
+        self.assertIs(results[0].query, queries[0])
+        self.assertTrue(results[0].result['row']['q'].endswith(str(queries[0])))
+
+    def test_variables(self,):
+        query = self.yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'], ['name', '!=', 'me@home'])
+        self.assertEqual(query.variables, ('sym',))
+        self.assertEqual(query.bind(sym='YHOO')['sym'], 'YHOO')
+        self.assertNotIn('sym', query.compile())
+        with self.assertRaises(QueryError):
+            query.execute()
+        self.yql.set({'sym': 'GOOG'})
+        self.assertEqual(self.yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym']).bind()['sym'], 'GOOG')
+
+    def test_only_variables_can_be_bound(self,):
+        query = self.yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'], ['market', '=', '@format'])
+        for bindings in ({'sym': 'YHOO', 'q': 'SELECT * FROM geo.states'}, {'sym': 'YHOO', 'format': 'xml'}, {'sym': 'YHOO', 'symbol': 'GOOG'}):
+            with self.assertRaises(QueryError):
+                query.execute(**bindings)
+            with self.assertRaises(QueryError):
+                query.execute_many([bindings])
+        self.assertEqual(len(self.session.calls), 0)
+
+    def test_bindings_are_part_of_cache_key(self,):
+        self.yql.cache = MemoryCache()
+        query = self.yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'])
+        query.execute(sym='YHOO')
+        query.execute(sym='GOOG')
+        query.execute(sym='YHOO')
+        self.assertEqual([ call[1]['sym'] for call in self.session.calls ], ['YHOO', 'GOOG'])
+        self.assertEqual(self.yql.cache.hits, 1)
+
+    def test_execute_many(self,):
+        query = self.yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'])
+        symbols = [ 'SYM{0}'.format(i) for i in range(20) ]
+        responses = query.execute_many([ {'sym': sym} for sym in symbols ], max_workers=4)
+        self.assertEqual(len(responses), 20)
+        self.assertEqual(sorted(call[1]['sym'] for call in self.session.calls), sorted(symbols))
+        self.assertTrue(all(call[1]['q'] == query.compile()['q'] for call in self.session.calls))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self,):
+        self.status = 200
+        self.session = FakeSession(self.handler)
+        self.sink = MemorySink()
+        self.yql = YQL(session=self.session, metrics=self.sink)
+
+    def handler(self, url, params):
+        if self.status is None:
+            raise requests.ConnectionError('Connection refused')
+        return make_response(make_results([{'q': params['q']}]), self.status)
+
+    def test_query_metrics(self,):
+        response = self.yql.select('geo.countries', ['name']).where(['name', '=', 'Congo'])
+        labels = {'table': 'geo.countries', 'verb': 'select'}
+        self.assertEqual(self.sink.counter('requests_total', status='200', **labels), 1)
+        self.assertEqual(self.sink.counter('response_bytes_total', **labels), len(response.content))
+        self.assertTrue(self.sink.counter('request_bytes_total', **labels) > len(self.yql._payload['q']))
+        self.assertEqual(self.sink.histogram('query_duration_seconds', **labels).count, 1)
+        self.assertEqual(self.sink.histogram('request_duration_seconds', **labels).count, 1)
+        self.assertEqual(self.sink.histogram('payload_build_seconds', **labels).count, 1)
+
+    def test_status_and_errors(self,):
+        self.status = 999
+        self.yql.desc('weather.forecast')
+        self.status = None
+        with self.assertRaises(requests.ConnectionError):
+            self.yql.desc('weather.forecast')
+        labels = {'table': 'weather.forecast', 'verb': 'desc'}
+        self.assertEqual(self.sink.counter('requests_total', status='999', **labels), 1)
+        self.assertEqual(self.sink.counter('requests_total', status='error', **labels), 1)
+        self.assertEqual(self.sink.counter('errors_total', error='ConnectionError', **labels), 1)
+        self.assertEqual(self.sink.histogram('query_duration_seconds', **labels).count, 2)
+
+    def test_cache_outcomes(self,):
+        self.yql.cache = MemoryCache()
+        for _ in range(3):
+            self.yql.raw_query('select * from geo.states')
+        self.assertEqual(self.sink.counter('cache_total', table='geo.states', verb='select', result='miss'), 1)
+        self.assertEqual(self.sink.counter('cache_total', table='geo.states', verb='select', result='hit'), 2)
+        self.assertEqual(self.sink.counter('requests_total', table='geo.states', verb='select', status='200'), 1)
+
+    def test_default_sink(self,):
+        yql = YQL(session=self.session, metrics=True)
+        yql.raw_query('show tables')
+        self.assertEqual(yql.metrics.sink.counter('requests_total', table='', verb='show', status='200'), 1)
+        self.assertIsNone(YQL(session=self.session).metrics)
+
+    def test_prometheus_text(self,):
+        self.yql.raw_query('select * from geo.states')
+        text = prometheus_text(self.sink)
+        self.assertIn('# TYPE myql_requests_total counter\n', text)
+        self.assertIn('myql_requests_total{status="200",table="geo.states",verb="select"} 1\n', text)
+        self.assertIn('# TYPE myql_query_duration_seconds histogram\n', text)
+        self.assertIn('myql_query_duration_seconds_bucket{table="geo.states",verb="select",le="+Inf"} 1\n', text)
+        self.assertIn('myql_query_duration_seconds_count{table="geo.states",verb="select"} 1\n', text)
+        self.assertEqual(text.count('# TYPE myql_query_duration_seconds '), 1)
+
+    def test_label_escaping(self,):
+        sink = MemorySink()
+        sink.increment('errors_total', (('error', 'a "b"\\c\n'),))
+        self.assertIn('myql_errors_total{error="a \\"b\\"\\\\c\\n"} 1', prometheus_text(sink))
+
+
+class TestLogging(unittest.TestCase):
+
+    class Counted(object):
+        formatted = 0
+
+        def __repr__(self):
+            TestLogging.Counted.formatted += 1
+            return 'counted'
+
+    def setUp(self,):
+        self.yql = YQL(session=FakeSession())
+        self.logger = logging.getLogger('mYQL')
+        self.level = self.logger.level
+        TestLogging.Counted.formatted = 0
+
+    def tearDown(self,):
+        self.logger.setLevel(self.level)
+
+    def test_import_leaves_logging_alone(self,):
+        import subprocess, sys
+        code = "import logging, myql; print(len(logging.getLogger().handlers), logging.getLogger().level)"
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root).decode('utf-8').split()
+        self.assertEqual(output, ['0', str(logging.WARNING)])
+
+    def test_lazy_formatting(self,):
+        self.logger.setLevel(logging.INFO)
+        self.yql.set({'counted': self.Counted()})
+        self.yql.raw_query('select * from geo.states')
+        self.assertEqual(TestLogging.Counted.formatted, 0)
+
+    def test_structured_debug(self,):
+        stream = io.StringIO()
+        handler = enable_debug(structured=True, stream=stream)
+        try:
+            self.yql.raw_query('select * from geo.states')
+        finally:
+            disable_debug(handler)
+        events = [ json.loads(line) for line in stream.getvalue().splitlines() ]
+        self.assertEqual([ event['event'] for event in events ], ['payload', 'request'])
+        self.assertTrue(events[0]['payload']['q'].endswith('select * from geo.states'))
+        self.assertEqual(events[1]['status'], 200)
+        self.assertNotIn(handler, self.logger.handlers)
+
+
+class TestImports(unittest.TestCase):
+
+    def modules(self, statement):
+        import subprocess, sys
+        code = "import sys; {0}; print(' '.join(sorted(sys.modules)))".format(statement)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.check_output([sys.executable, '-c', code], cwd=root).decode('utf-8').split()
+
+    def test_import_is_lazy(self,):
+        modules = self.modules('import myql')
+        for module in ('myql.myql', 'myql.contrib', 'requests', 'xml.dom.minidom', 'sqlite3', 'concurrent.futures'):
+            self.assertNotIn(module, modules)
+
+    def test_client_defers_heavy_dependencies(self,):
+        modules = self.modules('from myql import YQL')
+        self.assertIn('myql.myql', modules)
+        for module in ('myql.contrib', 'requests', 'xml.dom.minidom', 'sqlite3', 'concurrent.futures'):
+            self.assertNotIn(module, modules)
+
+    def test_contrib_is_lazy(self,):
+        modules = self.modules('from myql.contrib.weather import Weather')
+        self.assertNotIn('myql.contrib.table', modules)
+        self.assertNotIn('myql.contrib.finance', modules)
+
+    def test_lazy_attributes(self,):
+        import myql
+        self.assertIs(myql.YQL, YQL)
+        self.assertIs(myql.contrib.weather.Weather, Weather)
+        self.assertIs(myql.contrib.finance.stockscraper.StockRetriever, StockRetriever)
+        self.assertIn('MYQL', dir(myql))
+        with self.assertRaises(AttributeError):
+            myql.missing
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def setUp(self,):
+        import sys
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+        if path not in sys.path:
+            sys.path.insert(0, path)
+        import bench
+        self.bench = bench
+
+    def test_run_and_compare(self,):
+        results = self.bench.run(['build.bind', 'execute.raw_query'], repeat=2, min_time=0.001, out=None)
+        self.assertEqual(sorted(results['results']), ['build.bind', 'execute.raw_query'])
+        self.assertTrue(results['results']['build.bind']['min'] > 0)
+        json.dumps(results)
+
+        self.assertEqual(self.bench.compare(results, results), [])
+        baseline = json.loads(json.dumps(results))
+        baseline['results']['build.bind']['min'] /= 2
+        del baseline['results']['execute.raw_query']
+        regressions = self.bench.compare(results, baseline, threshold=0.5)
+        self.assertEqual([ regression[0] for regression in regressions ], ['build.bind'])
+
+    def test_standin(self,):
+        from server import StandIn
+        with StandIn(rows=25) as server:
+            yql = server.client(YQL)
+            rows = list(yql.select('geo.counties').iterate(page_size=10))
+            results = yql.multi_query(['select * from a LIMIT 2', 'select * from b LIMIT 1'])
+            xml = yql.raw_query('select * from geo.states LIMIT 3', format='xml')
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(len(results[0].result['row']), 2)
+        self.assertEqual(results[1].result['row']['id'], '0')
+        self.assertEqual(xml.content.count(b'<row>'), 3)
+        self.assertEqual(server.requests, 5)
+
+    def test_standin_latency_errors_and_canned(self,):
+        from server import StandIn
+        canned = {'geo.countries': [{'name': 'Congo'}, {'name': 'Gabon'}]}
+        with StandIn(canned=canned, latency=0.05, error_rate=0.5, error_status=(999,), seed=2) as server:
+            yql = server.client(YQL)
+            started = time.time()
+            responses = [ yql.raw_query('select * from geo.countries') for _ in range(6) ]
+            self.assertTrue(time.time() - started >= 0.3)
+        statuses = [ response.status_code for response in responses ]
+        self.assertEqual(set(statuses), set([200, 999]))
+        self.assertEqual(server.errors, statuses.count(999))
+        self.assertEqual(responses[statuses.index(200)].json()['query']['results']['row'], canned['geo.countries'])
+
+    def test_load_driver(self,):
+        from server import StandIn
+        from load import LoadDriver, percentile
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+
+        with StandIn(error_rate=0.2, seed=1) as server:
+            driver = LoadDriver(lambda: server.client(YQL), ['select * from geo.states'], concurrency=4, requests=50)
+            report = driver.run()
+            shared = LoadDriver(lambda: server.client(YQL), ['select * from geo.states'], concurrency=4, requests=20, shared=True).run()
+        self.assertEqual(report['requests'], 50)
+        self.assertEqual(report['errors'], server.errors - shared['errors'])
+        self.assertEqual(sum(report['statuses'].values()), 50)
+        self.assertTrue(report['latency']['p50'] <= report['latency']['p95'] <= report['latency']['p99'] <= report['latency']['max'])
+        self.assertEqual(shared['requests'], 20)
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self,):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'cassette.jsonl.gz')
+        self.statuses = []
+
+    def tearDown(self,):
+        shutil.rmtree(self.tmp)
+
+    def handler(self, url, params):
+        status = self.statuses.pop(0) if self.statuses else 200
+        return make_response(make_results([{'q': params['q']}]), status)
+
+    def offline(self, url, params):
+        raise requests.ConnectionError('No network')
+
+    def record(self, *queries):
+        yql = YQL(session=FakeSession(self.handler), cassette=Cassette(self.path, mode='record'))
+        return [ yql.raw_query(query) for query in queries ]
+
+    def test_record_and_replay(self,):
+        recorded = self.record('select * from geo.states', 'desc geo.states')
+        session = FakeSession(self.offline)
+        cassette = Cassette(self.path)
+        yql = YQL(session=session, cassette=cassette)
+        self.assertEqual(len(cassette), 2)
+        self.assertEqual(yql.raw_query('desc geo.states').content, recorded[1].content)
+        response = yql.raw_query('select * from geo.states')
+        self.assertEqual(response.json(), recorded[0].json())
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(session.calls, [])
+        self.assertEqual(cassette.played, 2)
+
+    def test_replay_miss(self,):
+        self.record('select * from geo.states')
+        yql = YQL(session=FakeSession(self.offline), cassette=Cassette(self.path))
+        with self.assertRaises(CassetteError):
+            yql.raw_query('select * from geo.countries')
+
+    def test_replay_miss_is_not_retried_nor_an_upstream_failure(self,):
+        self.record('select * from geo.states')
+        breaker = CircuitBreaker(failure_threshold=1)
+        yql = YQL(session=FakeSession(self.offline), cassette=Cassette(self.path), retry=RetryPolicy(backoff_factor=10), circuit_breaker=breaker)
+        started = time.time()
+        with self.assertRaises(CassetteError):
+            yql.raw_query('select * from geo.countries')
+        self.assertTrue(time.time() - started < 1)
+        self.assertEqual((breaker.state, breaker.failures), (CircuitBreaker.CLOSED, 0))
+        self.assertEqual(yql.raw_query('select * from geo.states').status_code, 200)
+
+    def test_replay_in_recorded_order(self,):
+        self.statuses = [999]
+        yql = YQL(session=FakeSession(self.handler), cassette=Cassette(self.path, mode='record'), retry=RetryPolicy(jitter=False, backoff_factor=0))
+        self.assertEqual(yql.raw_query('select * from geo.states').status_code, 200)
+        cassette = Cassette(self.path)
+        yql = YQL(session=FakeSession(self.offline), cassette=cassette, retry=RetryPolicy(jitter=False, backoff_factor=0))
+        self.assertEqual(yql.raw_query('select * from geo.states').status_code, 200)
+        self.assertEqual(cassette.played, 2)
+        self.assertEqual(YQL(session=FakeSession(self.offline), cassette=cassette).raw_query('select * from geo.states').status_code, 200)
+
+    def test_auto_mode_and_latency(self,):
+        self.record('select * from geo.states')
+        session = FakeSession(self.handler)
+        cassette = Cassette(self.path, mode='auto', latency=0.05)
+        yql = YQL(session=session, cassette=cassette)
+        started = time.time()
+        yql.raw_query('select * from geo.states')
+        self.assertTrue(time.time() - started >= 0.05)
+        yql.raw_query('desc geo.states')
+        self.assertEqual(len(session.calls), 1)
+        self.assertEqual(len(Cassette(self.path)), 2)
+
+    def test_uncompressed_binary_body(self,):
+        path = os.path.join(self.tmp, 'cassette.jsonl')
+        yql = YQL(session=FakeSession(lambda url, params: make_response(b'\xff\x00')), cassette=Cassette(path, mode='record'))
+        yql.raw_query('select * from geo.states', format='xml')
+        replayed = YQL(session=FakeSession(self.offline), cassette=Cassette(path)).raw_query('select * from geo.states', format='xml')
+        self.assertEqual(replayed.content, b'\xff\x00')
+        with open(path) as f:
+            self.assertEqual(json.loads(f.readline())['encoding'], 'base64')
+
+
+class RecordingTransport(BaseTransport):
+
+    def __init__(self,):
+        self.calls = []
+
+    def send(self, url, params=None, headers=None, timeout=None, stream=False):
+        self.calls.append((url, params, headers))
+        return make_response(make_results([{'url': url}]))
+
+
+class TestTransport(unittest.TestCase):
+
+    def handler(self, url, params):
+        return 200, 'application/json', json.dumps(make_results([{'url': url, 'params': params}]))
+
+    def test_in_process(self,):
+        transport = InProcessTransport(self.handler)
+        yql = YQL(community=False, transport=transport)
+        row = yql.raw_query('select * from geo.states').json()['query']['results']['row'][0]
+        self.assertEqual(row['url'], YQL.PUBLIC_URL)
+        self.assertEqual(row['params']['q'], 'select * from geo.states')
+        self.assertEqual(row['params']['diagnostics'], 'False')
+        self.assertEqual(transport.requests, 1)
+
+    def test_in_process_stream(self,):
+        rows = [ {'id': str(i)} for i in range(50) ]
+        transport = InProcessTransport(lambda url, params: (200, 'application/json', json.dumps(make_results(rows))))
+        self.assertEqual(list(YQL(transport=transport).stream_query('select * from geo.states', chunk_size=64)), rows)
+
+    def test_default_transport_uses_session(self,):
+        session = FakeSession()
+        yql = YQL(session=session, timeout=3)
+        self.assertIsInstance(yql.transport, RequestsTransport)
+        yql.raw_query('select * from geo.states')
+        self.assertEqual(session.calls[0][2], {'timeout': 3, 'stream': False})
+        yql.close()
+        self.assertTrue(session.closed)
+
+    def test_oauth_requests_are_signed(self,):
+        oauth = type('OAuth', (object,), {'oauth_version': 'oauth2', 'access_token': 'token', 'token_is_valid': lambda self: True})()
+        transport = RecordingTransport()
+        YQL(oauth=oauth, transport=transport).raw_query('select * from geo.states')
+        url, params, headers = transport.calls[0]
+        self.assertTrue(url.startswith(YQL.PRIVATE_URL + '?'))
+        self.assertIsNone(params)
+        self.assertEqual(headers, {'Authorization': 'Bearer token'})
+
+    def test_urllib3(self,):
+        import sys
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+        if path not in sys.path:
+            sys.path.insert(0, path)
+        from server import StandIn
+
+        with StandIn(rows=25) as server:
+            yql = server.client(YQL, transport=Urllib3Transport(maxsize=2, timeout=(1, 5)))
+            response = yql.raw_query('select * from geo.states LIMIT 3')
+            rows = list(yql.stream_query('select * from geo.states'))
+            yql.close()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['query']['results']['row']), 3)
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(server.requests, 2)
+
+
+class TestResult(unittest.TestCase):
+
+    def setUp(self,):
+        self.rows = [ {'id': str(i)} for i in range(3) ]
+        data = make_results(self.rows)
+        data['query']['diagnostics'] = {'user-time': '5'}
+        self.session = FakeSession(lambda url, params: make_response(data))
+        self.yql = YQL(session=self.session, cache=MemoryCache())
+
+    def test_lazy_parse(self,):
+        result = self.yql.raw_query('select * from geo.states')
+        self.assertIsInstance(result, Result)
+        self.assertIs(self.yql._response, result)
+        self.assertFalse(hasattr(result, '__dict__'))
+        self.assertEqual(result.count, 3)
+        self.assertEqual(result.rows, self.rows)
+        self.assertEqual(result.diagnostics, {'user-time': '5'})
+        self.assertIs(result.data, result.data)
+        self.assertIsNot(result.json(), result.data)
+
+    def test_response_compatibility(self,):
+        result = self.yql.raw_query('select * from geo.states')
+        self.assertEqual(result.status_code, 200)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.headers['content-type'], 'application/json')
+        self.assertEqual(json.loads(result.text), result.json())
+        self.assertEqual(b''.join(result.iter_content(7)), result.content)
+        self.assertEqual(self.yql.response_builder(result), {'num_result': 3, 'result': {'row': self.rows}})
+        with self.assertRaises(requests.HTTPError):
+            Result(500, b'', url=YQL.PUBLIC_URL).raise_for_status()
+
+    def test_zero_copy_body(self,):
+        result = self.yql.raw_query('select * from geo.states')
+        body = result.body
+        self.assertIsInstance(body, memoryview)
+        self.assertEqual(body.tobytes(), result.content)
+        self.assertIs(body.obj, result.content)
+        self.assertEqual(len(result), len(result.content))
+
+    def test_single_and_no_row(self,):
+        self.assertEqual(Result(200, json.dumps({'query': {'count': 1, 'results': {'quote': {'id': '0'}}}}).encode('utf-8')).rows, [{'id': '0'}])
+        self.assertEqual(Result(200, json.dumps(make_results([])).encode('utf-8')).rows, [])
+
+    def test_cache_keeps_results(self,):
+        first = self.yql.raw_query('select * from geo.states')
+        self.assertIs(self.yql.raw_query('select * from geo.states'), first)
+        self.assertEqual(len(self.session.calls), 1)
+
+
 class TestFilters(unittest.TestCase):
 
     def setUp(self,):
@@ -429,6 +1080,290 @@ class TestWeather(unittest.TestCase):
         self.assertEqual(data.status_code, 200)
  
 
+class TestStockBatches(unittest.TestCase):
+
+    def setUp(self,):
+        self.failing = set()
+        self.session = FakeSession(self.handler)
+        self.stock = StockRetriever(session=self.session)
+        self.symbols = [ 'SYM{0}'.format(i) for i in range(23) ]
+
+    def handler(self, url, params):
+        symbols = re.findall(r"'([^']+)'", params['q'].split(' in ')[-1])
+        if self.failing & set(symbols):
+            return make_response({'error': {'description': 'Boom'}}, 400)
+        quotes = [ {'symbol': symbol, 'Ask': '1.0'} for symbol in reversed(symbols) ] # Not in the requested order
+        return make_response(make_results(quotes, 'quote'))
+
+    def test_batches_in_input_order(self,):
+        bulk = self.stock.get_current_info(self.symbols, batch_size=5, max_workers=3)
+        self.assertEqual(len(self.session.calls), 5)
+        self.assertEqual([ quote['symbol'] for quote in bulk.quotes ], self.symbols)
+        self.assertEqual([ batch.symbols for batch in bulk.batches ], [ self.symbols[i:i + 5] for i in range(0, 23, 5) ])
+        self.assertTrue(all(batch.error is None for batch in bulk.batches))
+
+    def test_failed_batch(self,):
+        self.failing = set(['SYM7'])
+        bulk = self.stock.get_current_info(self.symbols, batch_size=5)
+        failed = [ batch for batch in bulk.batches if batch.error ]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0].symbols, self.symbols[5:10])
+        self.assertIsInstance(failed[0].error, QueryError)
+        self.assertIn('Boom', str(failed[0].error))
+        self.assertEqual([ quote['symbol'] for quote in bulk.quotes ], self.symbols[:5] + self.symbols[10:])
+
+    def test_batches_by_default(self,):
+        symbols = [ 'SYM{0}'.format(i) for i in range(450) ]
+        bulk = self.stock.get_current_info(symbols)
+        self.assertEqual([ len(batch.symbols) for batch in bulk.batches ], [200, 200, 50])
+        self.assertEqual([ quote['symbol'] for quote in bulk.quotes ], symbols)
+        bulk = self.stock.get_current_info(self.symbols[:3])
+        self.assertEqual([ quote['symbol'] for quote in bulk.quotes ], self.symbols[:3])
+        self.assertEqual(len(self.session.calls), 4)
+        self.assertTrue(all(call[1]['format'] == 'json' for call in self.session.calls))
+
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self,):
+        self.failing = set()
+        self.session = FakeSession(self.handler)
+        self.store = HistoryStore()
+        self.stock = StockRetriever(session=self.session, history=self.store)
+
+    def tearDown(self,):
+        self.store.close()
+
+    def handler(self, url, params):
+        start, end = [ re.search(r"{0}\s*=\s*'([\d-]+)'".format(name), params['q']).group(1) for name in ('startDate', 'endDate') ]
+        if start in self.failing:
+            return make_response({'error': {'description': 'Boom'}}, 400)
+        day, quotes = datetime.date(*map(int, end.split('-'))), []
+        while str(day) >= start:
+            if day.weekday() < 5:
+                quotes.append({'Symbol': 'YHOO', 'Date': str(day), 'Close': str(day.day)})
+            day -= datetime.timedelta(days=1)
+        return make_response(make_results(quotes, 'quote'))
+
+    def fetched(self,):
+        return [ re.findall(r"Date\s*=\s*'([\d-]+)'", call[1]['q']) for call in self.session.calls ]
+
+    def test_windows_are_queried_as_json(self,):
+        stock = StockRetriever(format='xml', session=self.session, history=self.store)
+        result = stock.get_historical_info('YHOO', startDate='2015-01-01', endDate='2015-01-31')
+        self.assertEqual(result.count, 22)
+        self.assertEqual(self.session.calls[0][1]['format'], 'json')
+
+    def test_missing_ranges(self,):
+        self.store.add('YHOO', '2015-01-10', '2015-01-20', [])
+        self.store.add('yhoo', '2015-01-21', '2015-01-25', [])
+        self.store.add('YHOO', '2015-02-01', '2015-02-05', [])
+        self.assertEqual(len(self.store.ranges('YHOO')), 2)
+        self.assertEqual([ (str(start), str(end)) for start, end in self.store.missing('YHOO', '2015-01-01', '2015-02-10') ],
+                         [('2015-01-01', '2015-01-09'), ('2015-01-26', '2015-01-31'), ('2015-02-06', '2015-02-10')])
+        self.assertEqual(self.store.missing('YHOO', '2015-01-12', '2015-01-22'), [])
+
+    def test_only_missing_dates_are_fetched(self,):
+        first = self.stock.get_historical_info('YHOO', startDate='2014-01-01', endDate='2015-06-30', window=200, max_workers=3)
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual(first.rows[0]['Date'], '2015-06-30')
+        self.assertEqual(first.count, len(self.store))
+
+        again = self.stock.get_historical_info('YHOO', startDate='2014-03-01', endDate='2014-03-31')
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual(again.count, 21)
+
+        self.stock.get_historical_info('YHOO', startDate='2013-12-01', endDate='2015-07-15', window=200)
+        self.assertEqual(self.fetched()[3:], [['2013-12-01', '2013-12-31'], ['2015-07-01', '2015-07-15']])
+
+    def test_items_and_limit(self,):
+        result = self.stock.get_historical_info('YHOO', items=['Date', 'Close'], startDate='2015-01-01', endDate='2015-01-31', limit=2)
+        self.assertEqual(result.json()['query']['results']['quote'], [{'Date': '2015-01-30', 'Close': '30'}, {'Date': '2015-01-29', 'Close': '29'}])
+
+    def test_failed_window_is_fetched_again(self,):
+        self.failing = set(['2015-01-01'])
+        with self.assertRaises(QueryError):
+            self.stock.get_historical_info('YHOO', startDate='2014-01-01', endDate='2015-03-31', window=365)
+        self.assertEqual([ (str(start), str(end)) for start, end in self.store.missing('YHOO', '2014-01-01', '2015-03-31') ], [('2015-01-01', '2015-03-31')])
+        self.failing = set()
+        self.stock.get_historical_info('YHOO', startDate='2014-01-01', endDate='2015-03-31', window=365)
+        self.assertEqual(self.fetched()[-1], ['2015-01-01', '2015-03-31'])
+
+    def test_today_is_not_covered(self,):
+        today = datetime.date.today()
+        start = today - datetime.timedelta(days=10)
+        self.stock.get_historical_info('YHOO', startDate=str(start), endDate=str(today + datetime.timedelta(days=5)))
+        self.assertEqual(self.fetched()[0], [str(start), str(today)])
+        self.assertEqual(self.store.missing('YHOO', start, today), [(today, today)])
+
+
+class TestColumns(unittest.TestCase):
+
+    def setUp(self,):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'YHOO.cols')
+        self.quotes = [ {'Symbol': 'YHOO', 'Date': '2015-01-{0:02d}'.format(day), 'Open': str(day), 'High': str(day + 1), 'Low': str(day - 1),
+                         'Close': '{0}.5'.format(day), 'Volume': str(day * 1000), 'Adj_Close': 'null' if day == 2 else str(day)} for day in range(9, 1, -1) ]
+
+    def tearDown(self,):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self,):
+        self.assertEqual(write_columns(self.path, Result(200, json.dumps(make_results(self.quotes, 'quote')).encode('utf-8'))), 8)
+        with Columns(self.path) as yhoo:
+            self.assertEqual(len(yhoo), 8)
+            self.assertEqual(yhoo.names, ['Date'] + sorted(HISTORICAL_COLUMNS[1:]))
+            self.assertEqual(yhoo.dates()[0], datetime.date(2015, 1, 2))
+            self.assertEqual(yhoo['Date'].format, 'q')
+            self.assertEqual(yhoo['Date'][0], (datetime.date(2015, 1, 2) - datetime.date(1970, 1, 1)).days)
+            self.assertEqual(list(yhoo['Close']), [ day + 0.5 for day in range(2, 10) ])
+            self.assertNotEqual(yhoo['Adj_Close'][0], yhoo['Adj_Close'][0]) # NaN
+            self.assertTrue(yhoo['Volume'].readonly)
+
+    def test_explicit_columns(self,):
+        dividends = [{'Date': '2014-06-02', 'Dividends': '0.47'}, {'Date': '2014-03-03', 'Dividends': '0.45'}]
+        write_columns(self.path, dividends, DIVIDEND_COLUMNS)
+        with Columns(self.path) as columns:
+            self.assertEqual(columns.names, list(DIVIDEND_COLUMNS))
+            self.assertEqual(list(columns['Dividends']), [0.45, 0.47])
+            self.assertNotIn('Open', columns)
+
+    def test_rewrite_keeps_mapped_readers(self,):
+        write_columns(self.path, self.quotes[:3])
+        reader = Columns(self.path)
+        write_columns(self.path, self.quotes)
+        self.assertEqual(len(reader), 3)
+        self.assertEqual(len(Columns(self.path)), 8)
+        reader.close()
+
+    def test_not_a_columns_file(self,):
+        with open(self.path, 'wb') as f:
+            f.write(b'date,open\n')
+        with self.assertRaises(ValueError):
+            Columns(self.path)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_numpy_array(self,):
+        write_columns(self.path, self.quotes)
+        with Columns(self.path) as yhoo:
+            close = yhoo.array('Close')
+            self.assertEqual(close.dtype, numpy.float64)
+            self.assertEqual(close.sum(), sum(day + 0.5 for day in range(2, 10)))
+            self.assertFalse(close.flags.writeable)
+            del close
+
+
+class TestQuotePoller(unittest.TestCase):
+
+    def setUp(self,):
+        self.prices = dict(('SYM{0}'.format(i), '1.00') for i in range(12))
+        self.failing = set()
+        self.session = FakeSession(self.handler)
+        self.poller = QuotePoller(sorted(self.prices), stocks=StockRetriever(session=self.session), interval=0, batch_size=5, fields=['LastTradePriceOnly'])
+
+    def handler(self, url, params):
+        symbols = re.findall(r"'([^']+)'", params['q'].split(' in ')[-1])
+        if self.failing & set(symbols):
+            return make_response({'error': {'description': 'Boom'}}, 400)
+        return make_response(make_results([ {'symbol': symbol, 'LastTradePriceOnly': self.prices[symbol], 'LastTradeTime': str(time.time())} for symbol in symbols ], 'quote'))
+
+    def test_only_changes_are_emitted(self,):
+        first = self.poller.poll()
+        self.assertEqual(len(first), 12)
+        self.assertTrue(all(change.previous is None for change in first))
+        self.assertEqual(self.poller.poll(), [])
+
+        self.prices['SYM3'] = '1.05'
+        changes = self.poller.poll()
+        self.assertEqual([ change.symbol for change in changes ], ['SYM3'])
+        self.assertEqual(changes[0].previous['LastTradePriceOnly'], '1.00')
+        self.assertEqual(changes[0].quote['LastTradePriceOnly'], '1.05')
+        self.assertEqual(len(self.session.calls), 9)
+
+    def test_failed_batch_keeps_previous_quotes(self,):
+        self.poller.poll()
+        self.failing = set(['SYM0'])
+        self.prices['SYM1'] = '2.00'
+        self.assertEqual(self.poller.poll(), [])
+        self.assertEqual(len(self.poller.failed), 1)
+        self.failing = set()
+        self.assertEqual([ change.symbol for change in self.poller.poll() ], ['SYM1'])
+        self.assertEqual(self.poller.failed, [])
+
+    def test_generator_and_callback(self,):
+        self.assertEqual(len(list(self.poller.changes(polls=3))), 12)
+        self.assertEqual(self.poller.polls, 3)
+
+        seen = []
+        def callback(change):
+            seen.append(change.symbol)
+            self.poller.stop()
+        self.prices['SYM5'] = '3.00'
+        self.poller.run(callback)
+        self.assertEqual(seen, ['SYM5'])
+        self.assertEqual(self.poller.polls, 4)
+
+    def test_jitter_and_rate_limit(self,):
+        poller = QuotePoller(['YHOO'], interval=10, jitter=0.2, rate=2, seed=1)
+        delays = [ poller.delay() for _ in range(50) ]
+        self.assertTrue(all(8 <= delay <= 12 for delay in delays))
+        self.assertTrue(len(set(delays)) > 1)
+        self.assertEqual(poller.stocks.rate_limiter.default.max_rate, 2)
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestTickStore(unittest.TestCase):
+
+    def setUp(self,):
+        self.ticks = TickStore(capacity=4)
+
+    def tick(self, prices, volumes=None, timestamp=None):
+        volumes = volumes or {}
+        return self.ticks.append([ {'symbol': symbol, 'LastTradePriceOnly': price, 'Volume': volumes.get(symbol)} for symbol, price in prices ], timestamp)
+
+    def test_ring_buffer(self,):
+        for i in range(6):
+            self.tick([('YHOO', str(10 + i)), ('GOOG', str(500 - i))], timestamp=i)
+        self.tick([('AAPL', '100')], timestamp=6)
+        self.assertEqual(self.ticks.symbols, ['YHOO', 'GOOG', 'AAPL'])
+        prices = self.ticks.window('price')
+        self.assertEqual(prices[0].tolist(), [12, 13, 14, 15])
+        self.assertEqual(prices[1].tolist(), [498, 497, 496, 495])
+        self.assertTrue(numpy.isnan(prices[2][:3]).all())
+        self.assertEqual(self.ticks.window('time', 2)[0].tolist(), [4, 5])
+        self.assertEqual(self.ticks.last().tolist(), [15, 495, 100])
+
+    def test_rolling_statistics(self,):
+        for prices in ([('YHOO', '10'), ('GOOG', '20')], [('YHOO', '12'), ('GOOG', 'N/A')], [('YHOO', '11'), ('GOOG', '18')]):
+            self.tick(prices)
+        self.assertEqual(self.ticks.mean().tolist(), [11, 19])
+        self.assertEqual(self.ticks.min(2).tolist(), [11, 18])
+        self.assertEqual(self.ticks.max().tolist(), [12, 20])
+        returns = self.ticks.returns(3)
+        self.assertAlmostEqual(returns[0][0], 0.2)
+        self.assertTrue(numpy.isnan(returns[1]).all())
+        self.assertAlmostEqual(self.ticks.total_return()[0], 0.1)
+        self.assertAlmostEqual(self.ticks.total_return()[1], -0.1)
+        self.assertEqual(sorted(self.ticks.stats(2)['YHOO']), ['last', 'max', 'mean', 'min', 'return', 'vwap'])
+
+    def test_vwap_of_cumulative_volume(self,):
+        self.tick([('YHOO', '10')], {'YHOO': '100'})
+        self.tick([('YHOO', '20')], {'YHOO': '400'}) # 300 traded at 20
+        self.tick([('YHOO', '30')], {'YHOO': '50'}) # New day
+        self.assertEqual(self.ticks.window('volume')[0][-3:].tolist(), [100, 300, 50])
+        self.assertAlmostEqual(self.ticks.vwap()[0], (10 * 100 + 20 * 300 + 30 * 50) / 450.0)
+        self.assertAlmostEqual(self.ticks.vwap(2)[0], (20 * 300 + 30 * 50) / 350.0)
+
+    def test_append_query_results(self,):
+        bulk = BulkQuotes([{'symbol': 'YHOO', 'LastTradePriceOnly': '10', 'Volume': '5'}], [])
+        self.assertEqual(self.ticks.append(bulk), 1)
+        result = Result(200, json.dumps(make_results([{'Symbol': 'GOOG', 'LastTradePriceOnly': '20'}], 'quote')).encode('utf-8'))
+        self.assertEqual(self.ticks.append(result), 1)
+        self.assertEqual(self.ticks.append([]), 0)
+        self.assertEqual(self.ticks.symbols, ['YHOO', 'GOOG'])
+        self.assertTrue(numpy.isnan(self.ticks.vwap()[1]))
+
+
 class TestStockScraper(unittest.TestCase):
 
     def setUp(self,):
@@ -439,13 +1374,13 @@ class TestStockScraper(unittest.TestCase):
 
     def test_get_current_info(self,):
         data = self.stock.get_current_info(["YHOO","AAPL","GOOG","J&KBANK.BO"])
-        logging.debug(pretty_json(data.content))
-        self.assertEqual(data.status_code, 200)
+        logging.debug(data.quotes)
+        self.assertEqual(data.batches[0].error, None)
         
     def test_get_current_info_with_one_symbol(self,):
         data = self.stock.get_current_info(["J&KBANK.BO"])
-        logging.debug(pretty_json(data.content))
-        self.assertEqual(data.status_code, 200)
+        logging.debug(data.quotes)
+        self.assertEqual(data.batches[0].error, None)
 
     def test_get_news_feed(self,):
         data = self.stock.get_news_feed('YHOO')
@@ -765,6 +1700,608 @@ class TestTable(unittest.TestCase):
         os.path.unlink('tests_data/mytest.xml')
         os.path.unlink('tests_data/toto.xml')
         
+
+def done(result):
+    future = asyncio.get_event_loop().create_future()
+    future.set_result(result)
+    return future
+
+
+class FakeAsyncResponse(object):
+
+    def __init__(self, session, response, url):
+        self.session = session
+        self.status, self.headers, self.content, self.url = response.status_code, response.headers, response.content, url
+
+    def __aenter__(self):
+        self.session.in_flight += 1
+        self.session.max_in_flight = max(self.session.in_flight, self.session.max_in_flight)
+        return asyncio.sleep(0.01, result=self)
+
+    def __aexit__(self, *args):
+        self.session.in_flight -= 1
+        return done(False)
+
+    def read(self):
+        return done(self.content)
+
+
+class FakeAsyncSession(object):
+    '''Offline stand-in for an aiohttp.ClientSession
+    '''
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda url, params: make_response(make_results([{'q': params['q']}])))
+        self.calls = []
+        self.closed = False
+        self.in_flight = self.max_in_flight = 0
+
+    def get(self, url, headers=None, timeout=None):
+        from six.moves.urllib.parse import urlparse, parse_qsl
+        url = str(url)
+        params = dict(parse_qsl(urlparse(url).query))
+        self.calls.append((url, params, headers))
+        return FakeAsyncResponse(self, self.handler(url, params), url)
+
+    def close(self):
+        self.closed = True
+        return done(None)
+
+
+@unittest.skipIf(aio is None or aio.aiohttp is None, 'aiohttp is not installed')
+class TestAsync(unittest.TestCase):
+
+    def setUp(self,):
+        self.session = FakeAsyncSession()
+        self.yql = aio.AsyncMYQL(community=True, session=self.session, max_concurrency=2)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self,):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_queries_match_sync_client(self,):
+        yql = MYQL(community=True, session=FakeSession())
+        yql.select('geo.countries', ['name'], limit=5).where(['name', 'like', 'A%'])
+        response = self.loop.run_until_complete(self.yql.select('geo.countries', ['name'], limit=5).where(['name', 'like', 'A%']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['query']['results']['row'][0]['q'], yql._payload['q'])
+        self.assertEqual(self.session.calls[0][1]['diagnostics'], 'False')
+
+    def test_awaitable_methods(self,):
+        coros = [self.yql.desc('weather.forecast'), self.yql.get('geo.countries', limit=2), self.yql.show_tables(), self.yql.raw_query('select * from geo.states', pretty=True)]
+        responses = self.loop.run_until_complete(asyncio.gather(*coros))
+        self.assertEqual(len(self.session.calls), 4)
+        self.assertEqual(responses[0].status_code, 200)
+        self.assertEqual(responses[3]['num_result'], 1)
+
+    def test_gathered_chained_queries(self,):
+        coros = [self.yql.select('geo.countries').where(['name', '=', 'Congo']), self.yql.select('geo.states').where(['place', '=', 'CA']),
+                 self.yql.get('geo.counties', limit=2)]
+        self.loop.run_until_complete(asyncio.gather(*coros))
+        queries = sorted(call[1]['q'].split('; ')[-1] for call in self.session.calls)
+        self.assertEqual(queries, ['SELECT * FROM geo.counties  LIMIT 2 ', "SELECT * FROM geo.countries  WHERE name = 'Congo'",
+                                   "SELECT * FROM geo.states  WHERE place = 'CA'"])
+
+    def test_gathered_query_methods(self,):
+        coros = [self.yql.raw_query('select * from a'), self.yql.show_tables(), self.yql.desc('weather.forecast'),
+                 self.yql.insert('yql.storage.admin', ('value',), ('v',)), self.yql.multi_query(['desc geo.states']),
+                 self.yql.get_guid('me'), self.yql.select('b', limit=3, func_filters=['reverse']).where(['name', '=', 'c'])]
+        self.loop.run_until_complete(asyncio.gather(*coros))
+        queries = sorted(call[1]['q'].split('; ')[-1] for call in self.session.calls)
+        self.assertEqual(queries, sorted(['select * from a', 'SHOW TABLES', 'desc weather.forecast', "INSERT INTO yql.storage.admin (value) VALUES ('v')",
+                                          'desc geo.states', "SELECT * FROM yahoo.identity  WHERE yid = 'me'", "SELECT * FROM b  WHERE name = 'c'| reverse() LIMIT 3 "]))
+
+    def test_bounded_concurrency(self,):
+        coros = [ self.yql.raw_query('select * from geo.states') for _ in range(6) ]
+        self.loop.run_until_complete(asyncio.gather(*coros))
+        self.assertEqual(len(self.session.calls), 6)
+        self.assertEqual(self.session.max_in_flight, 2)
+
+    def test_multi_query(self,):
+        results = self.loop.run_until_complete(self.yql.multi_query(['desc geo.states', 'show tables'], batch_size=1))
+        self.assertEqual([ r.result['row'][0]['q'].split('; ')[-1] for r in results ], ['desc geo.states', 'show tables'])
+        results = self.loop.run_until_complete(self.yql.multi_query((query for query in ['desc geo.states', 'show tables'])))
+        self.assertEqual(len(results), 2)
+
+    def test_execute_many(self,):
+        query = self.yql.query.select('yahoo.finance.quotes').where(['symbol', '=', '@sym'])
+        responses = self.loop.run_until_complete(query.execute_many([{'sym': 'YHOO'}, {'sym': 'GOOG'}]))
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(sorted(call[1]['sym'] for call in self.session.calls), ['GOOG', 'YHOO'])
+
+    def test_metrics(self,):
+        yql = aio.AsyncYQL(session=self.session, metrics=True)
+        self.loop.run_until_complete(yql.raw_query('select * from geo.states'))
+        self.assertEqual(yql.metrics.sink.counter('requests_total', table='geo.states', verb='select', status='200'), 1)
+        self.assertEqual(yql.metrics.sink.histogram('query_duration_seconds', table='geo.states', verb='select').count, 1)
+
+    def test_cassette_miss(self,):
+        path = os.path.join(tempfile.mkdtemp(), 'cassette.jsonl')
+        open(path, 'w').close()
+        breaker = CircuitBreaker(failure_threshold=1)
+        yql = aio.AsyncYQL(session=self.session, cassette=Cassette(path), retry=RetryPolicy(backoff_factor=10), circuit_breaker=breaker)
+        with self.assertRaises(CassetteError):
+            self.loop.run_until_complete(yql.raw_query('select * from geo.states'))
+        self.assertEqual(breaker.failures, 0)
+        shutil.rmtree(os.path.dirname(path))
+
+    def test_cassette(self,):
+        path = os.path.join(tempfile.mkdtemp(), 'cassette.jsonl')
+        yql = aio.AsyncYQL(session=self.session, cassette=Cassette(path, mode='record'))
+        recorded = self.loop.run_until_complete(yql.raw_query('select * from geo.states'))
+        offline = FakeAsyncSession(lambda url, params: self.fail('Request sent while replaying'))
+        yql = aio.AsyncYQL(session=offline, cassette=Cassette(path))
+        replayed = self.loop.run_until_complete(yql.raw_query('select * from geo.states'))
+        self.assertEqual(replayed.content, recorded.content)
+        shutil.rmtree(os.path.dirname(path))
+
+    def test_transport(self,):
+        transport = InProcessTransport(lambda url, params: (200, 'application/json', json.dumps(make_results([params]))))
+        yql = aio.AsyncYQL(community=False, transport=transport)
+        response = self.loop.run_until_complete(yql.raw_query('select * from geo.states'))
+        self.assertEqual(response.json()['query']['results']['row'][0]['q'], 'select * from geo.states')
+        self.loop.run_until_complete(yql.close())
+        self.assertEqual(len(self.session.calls), 0)
+
+    def test_iterate(self,):
+        data = [ {'name': 'county {0}'.format(i)} for i in range(25) ]
+        def handler(url, params):
+            offset = re.search(r'OFFSET (\d+)', params['q'])
+            offset = int(offset.group(1)) if offset else 0
+            return make_response(make_results(data[offset:offset + int(re.search(r'LIMIT (\d+)', params['q']).group(1))], 'place'))
+        self.session.handler = handler
+
+        async def collect(rows):
+            return [ row async for row in rows ]
+        rows = self.loop.run_until_complete(collect(self.yql.select('geo.counties').iterate(['place', '=', 'CA'], page_size=10)))
+        self.assertEqual(rows, data)
+        self.assertEqual(len(self.session.calls), 3)
+        self.loop.run_until_complete(self.yql.raw_query('select * from x LIMIT 1'))
+        self.assertTrue(self.session.calls[-1][1]['q'].endswith('; select * from x LIMIT 1'))
+        rows = self.loop.run_until_complete(collect(self.yql.select('geo.counties', limit=12, offset=3).iterate(page_size=5, prefetch=False)))
+        self.assertEqual(rows, data[3:15])
+
+    def test_blocking_transport_runs_in_threads(self,):
+        transport = RecordingTransport()
+        send = transport.send
+        def blocking_send(*args, **kwargs):
+            time.sleep(0.2)
+            transport.calls.append(threading.current_thread())
+            return send(*args, **kwargs)
+        transport.send = blocking_send
+        yql = aio.AsyncYQL(community=False, transport=transport)
+        started = time.time()
+        self.loop.run_until_complete(asyncio.gather(yql.raw_query('select * from a'), yql.raw_query('select * from b')))
+        self.assertTrue(time.time() - started < 0.35)
+        self.assertNotIn(threading.current_thread(), transport.calls)
+
+        threads = []
+        in_process = InProcessTransport(lambda url, params: threads.append(threading.current_thread()) or (200, 'application/json', '{}'))
+        self.loop.run_until_complete(aio.AsyncYQL(transport=in_process).raw_query('select * from a'))
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_stream_is_not_supported(self,):
+        with self.assertRaises(TypeError):
+            self.yql.stream_query('select * from geo.states')
+        with self.assertRaises(TypeError):
+            self.yql.select('geo.states').where(['place', '=', 'CA'], stream=True)
+        self.assertEqual(len(self.session.calls), 0)
+
+    def test_close(self,):
+        self.loop.run_until_complete(self.yql.close())
+        self.assertTrue(self.session.closed)
+
+
+class TestSession(unittest.TestCase):
+
+    def test_default_session_is_pooled(self,):
+        yql = YQL(session=SessionFactory(pool_connections=2, pool_maxsize=20, timeout=(3, 10)))
+        adapter = yql.session.get_adapter(yql.PUBLIC_URL)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(yql.timeout, (3, 10))
+
+    def test_keep_alive_disabled(self,):
+        yql = YQL(session=SessionFactory(keep_alive=False))
+        self.assertEqual(yql.session.headers['Connection'], 'close')
+
+    def test_shared_session(self,):
+        factory = SessionFactory()
+        yql1, yql2 = YQL(session=factory.shared()), YQL(session=factory.shared())
+        self.assertTrue(yql1.session is yql2.session)
+
+    def test_execute_query_uses_session(self,):
+        session = FakeSession()
+        with YQL(session=session, timeout=5) as yql:
+            response = yql.raw_query('select * from geo.countries')
+            response = yql.select('geo.countries').where(['name', '=', 'Congo'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(session.calls), 2)
+        self.assertEqual(session.calls[0][0], YQL.PUBLIC_URL)
+        self.assertEqual(session.calls[1][2]['timeout'], 5)
+        self.assertTrue(session.closed)
+
+
+class TestMemoryCache(unittest.TestCase):
+
+    def setUp(self,):
+        self.session = FakeSession()
+        self.cache = MemoryCache(maxsize=2, ttl=60, table_ttl={'yahoo.finance.quotes': 0})
+        self.yql = YQL(session=self.session, cache=self.cache)
+
+    def test_identical_selects_are_served_from_cache(self,):
+        r1 = self.yql.select('weather.forecast').where(['woeid', '=', 2502265])
+        r2 = self.yql.select('weather.forecast').where(['woeid', '=', 2502265])
+        self.assertTrue(r1 is r2)
+        self.assertEqual(len(self.session.calls), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_payload_is_part_of_the_key(self,):
+        self.yql.raw_query('select * from geo.states')
+        self.yql.set({'home': 'Congo'})
+        self.yql.raw_query('select * from geo.states')
+        self.yql.raw_query('select * from geo.states', format='xml')
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertNotEqual(payload_fingerprint({'q': 'a', 'format': 'json'}), payload_fingerprint({'q': 'a', 'format': 'xml'}))
+
+    def test_ttl(self,):
+        self.yql.select('yahoo.finance.quotes').where(['symbol', '=', 'YHOO']) # table ttl of 0 : never cached
+        self.yql.select('yahoo.finance.quotes').where(['symbol', '=', 'YHOO'], ttl=-1)
+        self.yql.raw_query('select * from geo.states', ttl=0.01)
+        time.sleep(0.02)
+        self.yql.raw_query('select * from geo.states', ttl=0.01)
+        self.assertEqual(len(self.session.calls), 4)
+        self.assertEqual(self.cache.expirations, 1)
+
+    def test_lru_eviction(self,):
+        for query in ('select * from a', 'select * from b', 'select * from a', 'select * from c', 'select * from a'):
+            self.yql.raw_query(query)
+        self.assertEqual(len(self.session.calls), 3)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_writes_and_errors_are_not_cached(self,):
+        self.yql.insert('yql.storage.admin', ('value',), ('http://josuebrunel.org',))
+        self.yql.insert('yql.storage.admin', ('value',), ('http://josuebrunel.org',))
+        self.session.handler = lambda url, params: make_response({'error': {}}, status_code=400)
+        self.yql.raw_query('select * from fail')
+        self.yql.raw_query('select * from fail')
+        self.assertEqual(len(self.session.calls), 4)
+
+
+class TestSQLiteCache(unittest.TestCase):
+
+    def setUp(self,):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'myql.db')
+        self.session = FakeSession(lambda url, params: make_response(make_results([{'q': params['q'], 'padding': 'x' * 2000}])))
+
+    def tearDown(self,):
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_survives_restarts(self,):
+        cache = SQLiteCache(self.path)
+        response = YQL(session=self.session, cache=cache).raw_query('select * from geo.states')
+        cache.close()
+        cached = YQL(session=self.session, cache=SQLiteCache(self.path)).raw_query('select * from geo.states')
+        self.assertEqual(len(self.session.calls), 1)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.headers['Content-Type'], 'application/json')
+
+    def test_bodies_are_compressed(self,):
+        cache = SQLiteCache(self.path)
+        response = YQL(session=self.session, cache=cache).raw_query('select * from geo.states')
+        self.assertTrue(cache.stats()['bytes'] < len(response.content) / 4)
+
+    def test_ttl(self,):
+        cache = SQLiteCache(self.path, ttl=0.01)
+        yql = YQL(session=self.session, cache=cache)
+        yql.raw_query('select * from geo.states')
+        time.sleep(0.02)
+        yql.raw_query('select * from geo.states')
+        self.assertEqual(len(self.session.calls), 2)
+        self.assertEqual(cache.expirations, 1)
+
+    def test_size_eviction(self,):
+        cache = SQLiteCache(self.path, max_bytes=250)
+        yql = YQL(session=self.session, cache=cache)
+        for query in ('select * from a', 'select * from b', 'select * from c'):
+            yql.raw_query(query)
+        self.assertTrue(cache.stats()['bytes'] <= 250)
+        self.assertTrue(cache.evictions >= 1)
+        self.assertEqual(cache.get(payload_fingerprint(yql._payload)).json()['query']['results']['row'][0]['q'], yql._payload['q'])
+
+    def test_shared_by_concurrent_writers(self,):
+        caches = [ SQLiteCache(self.path) for _ in range(4) ]
+        def run(cache):
+            yql = YQL(session=self.session, cache=cache)
+            for i in range(10):
+                yql.raw_query('select * from t{0}'.format(i))
+        threads = [ threading.Thread(target=run, args=(cache,)) for cache in caches ]
+        [ t.start() for t in threads ]
+        [ t.join() for t in threads ]
+        self.assertEqual(len(caches[0]), 10)
+
+    @unittest.skipIf(not hasattr(os, 'fork'), 'os.fork is not available')
+    def test_forked_process_reconnects(self,):
+        cache = SQLiteCache(self.path)
+        parent = cache._connection()
+        pid = os.fork()
+        if pid == 0: # Child
+            ok = cache._connection() is not parent and cache.set('child', make_response(make_results([])), ttl=60)
+            os._exit(0 if ok else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+        self.assertTrue(cache._connection() is parent)
+        self.assertEqual(cache.get('child').status_code, 200)
+
+    def test_running_size(self,):
+        cache = SQLiteCache(self.path)
+        yql = YQL(session=self.session, cache=cache)
+        for query in ('select * from a', 'select * from b', 'select * from a'):
+            yql.raw_query(query, ttl=0.01 if query.endswith('b') else None)
+        time.sleep(0.02)
+        cache.set('c', make_response(make_results([])))
+        cache.delete('c')
+        size = cache._connection().execute("SELECT SUM(size) FROM responses").fetchone()[0]
+        self.assertEqual(cache.stats()['bytes'], size)
+        self.assertEqual(cache.stats()['entries'], 1)
+        cache.clear()
+        self.assertEqual(cache.stats()['bytes'], 0)
+
+    def test_hits_are_touched_by_batches(self,):
+        cache = SQLiteCache(self.path, touch_interval=3600)
+        cache.set('a', make_response(make_results([])))
+        accessed_at = lambda: cache._connection().execute("SELECT accessed_at FROM responses").fetchone()[0]
+        before = accessed_at()
+        time.sleep(0.01)
+        cache.get('a')
+        self.assertEqual(accessed_at(), before)
+        cache.close()
+        self.assertTrue(accessed_at() > before)
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self,):
+        self.started = threading.Event()
+        self.session = FakeSession(self.handler)
+        self.yql = YQL(session=self.session, coalesce=True)
+
+    def handler(self, url, params):
+        time.sleep(0.1)
+        if 'fail' in params['q']:
+            raise requests.ConnectionError('Connection refused')
+        return make_response(make_results([{'q': params['q']}]))
+
+    def run_concurrently(self, queries):
+        results = [None] * len(queries)
+        def run(i, query):
+            yql = YQL(session=self.session, coalesce=self.yql.single_flight) # One client per thread, one flight for all
+            try:
+                results[i] = yql.raw_query(query)
+            except (Exception,) as e:
+                results[i] = e
+        threads = [ threading.Thread(target=run, args=(i, query)) for i, query in enumerate(queries) ]
+        [ t.start() for t in threads ]
+        [ t.join() for t in threads ]
+        return results
+
+    def test_identical_queries_share_one_request(self,):
+        results = self.run_concurrently(['select * from yahoo.finance.quotes'] * 8)
+        self.assertEqual(len(self.session.calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(self.yql.single_flight.shared, 7)
+
+    def test_different_queries_are_not_coalesced(self,):
+        self.run_concurrently(['select * from a', 'select * from b', "insert into yql.storage (value) values ('a')", "insert into yql.storage (value) values ('a')"])
+        self.assertEqual(len(self.session.calls), 4)
+
+    def test_errors_are_shared(self,):
+        results = self.run_concurrently(['select * from fail'] * 4)
+        self.assertEqual(len(self.session.calls), 1)
+        self.assertTrue(all(isinstance(r, requests.ConnectionError) for r in results))
+
+    def test_sequential_queries_are_not_coalesced(self,):
+        flight = SingleFlight()
+        yql = YQL(session=self.session, coalesce=flight)
+        yql.raw_query('select * from a')
+        yql.raw_query('select * from a')
+        self.assertEqual(flight.leaders, 2)
+        self.assertEqual(flight.shared, 0)
+
+    @unittest.skipIf(aio is None or aio.aiohttp is None, 'aiohttp is not installed')
+    def test_async_identical_queries_share_one_request(self,):
+        session = FakeAsyncSession()
+        yql = aio.AsyncYQL(session=session, coalesce=True)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            responses = loop.run_until_complete(asyncio.gather(*[ yql.raw_query('select * from a') for _ in range(5) ]))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual(len(session.calls), 1)
+        self.assertTrue(all(r is responses[0] for r in responses))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_burst_then_rate(self,):
+        bucket = TokenBucket(rate=100, capacity=3)
+        start = time.time()
+        delays = [ bucket.acquire() for _ in range(6) ]
+        self.assertEqual(delays[:3], [0.0, 0.0, 0.0])
+        self.assertTrue(time.time() - start >= 0.025)
+
+    def test_adaptive_backoff_and_recovery(self,):
+        bucket = TokenBucket(rate=10, backoff=0.5, recovery=1)
+        bucket.throttled()
+        bucket.throttled()
+        self.assertEqual(bucket.rate, 2.5)
+        for _ in range(3):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 5.5)
+        for _ in range(10):
+            bucket.succeeded()
+        self.assertEqual(bucket.rate, 10)
+
+    def test_limits_per_endpoint(self,):
+        limiter = RateLimiter({YQL.PUBLIC_URL: TokenBucket(rate=10, capacity=1)})
+        self.assertEqual(limiter.reserve(YQL.PUBLIC_URL), 0.0)
+        self.assertTrue(limiter.reserve(YQL.PUBLIC_URL) > 0)
+        self.assertEqual(limiter.reserve(YQL.PRIVATE_URL), 0.0)
+
+    def test_yql_slows_down_when_throttled(self,):
+        statuses = [999, 999, 200]
+        session = FakeSession(lambda url, params: make_response({}, status_code=statuses.pop(0)))
+        bucket = TokenBucket(rate=1000, capacity=10, recovery=100)
+        yql = YQL(session=session, rate_limiter=RateLimiter({YQL.PUBLIC_URL: bucket}))
+        yql.raw_query('select * from yahoo.finance.quotes')
+        yql.raw_query('select * from yahoo.finance.quotes')
+        self.assertEqual(bucket.rate, 250)
+        yql.raw_query('select * from yahoo.finance.quotes')
+        self.assertEqual(bucket.rate, 350)
+
+    def test_connection_errors_slow_down(self,):
+        def handler(url, params):
+            raise requests.ConnectionError()
+        bucket = TokenBucket(rate=1000, capacity=10)
+        yql = YQL(session=FakeSession(handler), rate_limiter=RateLimiter(default=bucket))
+        with self.assertRaises(requests.ConnectionError):
+            yql.raw_query('select * from yahoo.finance.quotes')
+        self.assertEqual(bucket.rate, 500)
+
+
+class TestRetry(unittest.TestCase):
+
+    def setUp(self,):
+        self.statuses = []
+        self.session = FakeSession(self.handler)
+        self.yql = YQL(session=self.session, retry=RetryPolicy(max_retries=3, backoff_factor=0.001))
+
+    def handler(self, url, params):
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status is None:
+            raise requests.ConnectionError('Connection reset by peer')
+        return make_response({}, status_code=status)
+
+    def test_select_is_retried(self,):
+        self.statuses = [503, None, 999]
+        response = self.yql.select('geo.countries').where(['name', '=', 'Congo'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.session.calls), 4)
+
+    def test_gives_up_after_max_retries(self,):
+        self.statuses = [503] * 5
+        self.assertEqual(self.yql.desc('geo.countries').status_code, 503)
+        self.assertEqual(len(self.session.calls), 4)
+        self.statuses = [None] * 5
+        with self.assertRaises(requests.ConnectionError):
+            self.yql.raw_query('show tables')
+
+    def test_writes_are_never_retried(self,):
+        self.statuses = [503, None]
+        self.assertEqual(self.yql.insert('yql.storage.admin', ('value',), ('http://josuebrunel.org',)).status_code, 503)
+        with self.assertRaises(requests.ConnectionError):
+            self.yql.delete('yql.storage').where(['name', '=', 'store://Rqb5fbQyDvrfHJiClWnZ6q'])
+        self.assertEqual(len(self.session.calls), 2)
+
+    def test_client_errors_are_not_retried(self,):
+        self.statuses = [400]
+        self.assertEqual(self.yql.raw_query('select * from fail').status_code, 400)
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_exponential_backoff_with_jitter(self,):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+        self.assertTrue(all(0 <= policy.delay(2) <= 4 for _ in range(20)))
+        self.assertTrue(policy.delay(10) <= 5)
+        self.assertEqual(RetryPolicy(backoff_factor=1, jitter=False).delay(3), 8)
+
+    def test_circuit_breaker(self,):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        yql = YQL(session=self.session, circuit_breaker=breaker)
+        self.statuses = [503, 503, 503]
+        yql.raw_query('select * from a')
+        yql.raw_query('select * from a')
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            yql.raw_query('select * from a')
+        self.assertEqual(len(self.session.calls), 2)
+        time.sleep(0.06)
+        yql.raw_query('select * from a') # Failed probe
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        self.assertEqual(yql.raw_query('select * from a').status_code, 200) # Successful probe
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_limited_probes(self,):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0, half_open_max_calls=1)
+        breaker.record(None)
+        breaker.allow()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+
+def make_streamed_response(data, status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(json.dumps(data).encode('utf-8'))
+    return response
+
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self,):
+        self.rows = [ {'Date': '2015-01-{0:02d}'.format(i), 'Close': str(40 + i), 'Note': u'\u00e9\"'} for i in range(1, 31) ]
+        self.data = {'query': {'count': 30, 'diagnostics': {'results': 'ignored'}, 'results': {'quote': self.rows}}}
+
+    def test_iter_results_with_any_chunk_size(self,):
+        body = json.dumps(self.data, ensure_ascii=False).encode('utf-8')
+        for size in (1, 7, 64, len(body)):
+            chunks = [ body[i:i + size] for i in range(0, len(body), size) ]
+            self.assertEqual(list(iter_results(chunks)), self.rows)
+
+    def test_iter_results_single_row_and_no_result(self,):
+        self.assertEqual(list(iter_results([json.dumps({'query': {'count': 1, 'results': {'quote': self.rows[0]}}}).encode('utf-8')])), [self.rows[0]])
+        self.assertEqual(list(iter_results([json.dumps({'query': {'count': 0, 'results': None}}).encode('utf-8')])), [])
+
+    def test_stream_query_is_incremental(self,):
+        response = make_streamed_response(self.data)
+        session = FakeSession(lambda url, params: response)
+        rows = YQL(session=session).stream_query("select * from yahoo.finance.historicaldata where symbol='YHOO'", chunk_size=256)
+        self.assertEqual(next(rows), self.rows[0])
+        self.assertTrue(response.raw.tell() < len(response.raw.getvalue()))
+        self.assertEqual(list(rows), self.rows[1:])
+        self.assertTrue(session.calls[0][2]['stream'])
+
+    def test_stream_keeps_no_response(self,):
+        yql = YQL(session=FakeSession(lambda url, params: make_streamed_response(self.data)))
+        rows = yql.stream_query("select * from yahoo.finance.historicaldata where symbol='YHOO'")
+        self.assertTrue(isinstance(yql._response, Result))
+        self.assertEqual((yql._response.status_code, yql._response.content), (200, b''))
+        self.assertEqual(list(rows), self.rows)
+
+    def test_where_stream(self,):
+        session = FakeSession(lambda url, params: make_streamed_response(self.data))
+        rows = YQL(session=session).select('yahoo.finance.historicaldata').where(['symbol', '=', 'YHOO'], stream=True)
+        self.assertEqual(list(rows), self.rows)
+
+    def test_retried_stream_is_closed(self,):
+        responses = [make_streamed_response({}, 503), make_streamed_response(self.data)]
+        session = FakeSession(lambda url, params: responses[len(session.calls) - 1])
+        yql = YQL(session=session, retry=RetryPolicy(jitter=False, backoff_factor=0))
+        self.assertEqual(list(yql.stream_query('select * from yahoo.finance.historicaldata')), self.rows)
+        self.assertTrue(responses[0].raw.closed)
+
+    def test_stream_error(self,):
+        session = FakeSession(lambda url, params: make_streamed_response({'error': {'description': 'No definition found for Table'}}, 400))
+        with self.assertRaises(QueryError):
+            YQL(session=session).stream_query('select * from fail')
+
 if '__main__' == __name__:
     unittest.main()
 